@@ -7,10 +7,29 @@ OkoaMaisha: Hospital Patient Length of Stay Predictor
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
 import plotly.graph_objects as go
 import plotly.express as px
+import json
 from datetime import datetime
+from io import BytesIO
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from okoamaisha import clinical
+from okoamaisha.artifacts import load_artifacts
+from okoamaisha.auth import UserStore, has_role, login, verify_token
+from okoamaisha.cohorts import DAY_NAMES, DIMENSIONS, CohortCube
+from okoamaisha.counterfactual import TARGET_DAYS, CounterfactualSearch
+from okoamaisha.evaluation import LONG_STAY_DAYS, EvaluationSet, model_version
+from okoamaisha.features import (COMORBIDITY_COLS, FACILITIES, engineer_batch, engineer_features as build_features,
+                                 from_admissions, is_admissions_schema, to_model_input)
+from okoamaisha.history import WINDOW_DAYS, HistoryStore
+from okoamaisha.memory import MemoryMonitor
+from okoamaisha.prediction_log import PredictionLog, prediction_records
+from okoamaisha.reports import render_report, write_ward_reports
+from okoamaisha.scoring import Scorer
+from okoamaisha.session_worklist import SessionWorklist
+from okoamaisha.validation import bounds, validate_batch
+from okoamaisha.worklist import Worklist
 
 # Page config
 st.set_page_config(
@@ -185,50 +204,92 @@ footer {visibility: hidden;}
 # Load model
 @st.cache_resource
 def load_model_artifacts():
-    model = joblib.load('best_model.pkl')
-    scaler = joblib.load('scaler.pkl')
-    feature_names = joblib.load('feature_names.pkl')
-    metadata = joblib.load('model_metadata.pkl')
-    return model, scaler, feature_names, metadata
+    return load_artifacts()
 
 model, scaler, feature_names, metadata = load_model_artifacts()
 
-comorbidity_cols = metadata.get('comorbidity_cols', [
-    'dialysisrenalendstage', 'asthma', 'irondef', 'pneum',
-    'substancedependence', 'psychologicaldisordermajor',
-    'depress', 'psychother', 'fibrosisandother', 'malnutrition', 'hemo'
-])
+comorbidity_cols = metadata.get('comorbidity_cols', COMORBIDITY_COLS)
 
 def engineer_features(input_dict):
-    df = pd.DataFrame(0, index=[0], columns=feature_names)
-    
-    for key in ['gender', 'rcount', 'bmi', 'pulse', 'respiration', 'hematocrit',
-                'neutrophils', 'sodium', 'glucose', 'bloodureanitro', 'creatinine',
-                'secondarydiagnosisnonicd9', 'admission_month', 'admission_dayofweek',
-                'admission_quarter']:
-        if key in input_dict:
-            df[key] = input_dict[key]
-    
-    for c in comorbidity_cols:
-        df[c] = int(input_dict.get(c, 0))
-    
-    df['total_comorbidities'] = sum([input_dict.get(c, 0) for c in comorbidity_cols])
-    df['high_glucose'] = int(input_dict['glucose'] > 140)
-    df['low_sodium'] = int(input_dict['sodium'] < 135)
-    df['high_creatinine'] = int(input_dict['creatinine'] > 1.3)
-    df['low_bmi'] = int(input_dict['bmi'] < 18.5)
-    df['high_bmi'] = int(input_dict['bmi'] > 30)
-    df['abnormal_vitals'] = (
-        int((input_dict['pulse'] < 60) or (input_dict['pulse'] > 100)) +
-        int((input_dict['respiration'] < 12) or (input_dict['respiration'] > 20))
-    )
-    
-    for fac in ['A', 'B', 'C', 'D', 'E']:
-        col_name = f'facility_{fac}'
-        if col_name in feature_names:
-            df[col_name] = int(input_dict['facility'] == fac)
-    
-    return df
+    return build_features(input_dict, feature_names, comorbidity_cols)
+
+def predict_batch(inputs):
+    return model.predict(scaler.transform(to_model_input(engineer_batch(inputs, feature_names, comorbidity_cols))))
+
+@st.cache_resource
+def load_counterfactual_search():
+    return CounterfactualSearch(Scorer(model, scaler, feature_names, metadata))
+
+@st.cache_resource
+def load_cohort_cube():
+    return CohortCube.load()
+
+@st.cache_resource
+def load_worklist():
+    return Worklist()
+
+@st.cache_resource
+def load_history():
+    return HistoryStore.load()
+
+@st.cache_resource
+def load_evaluation():
+    # A set scored by an earlier bundle would show another model's metrics
+    return EvaluationSet.load(model_version=model_version(metadata))
+
+@st.cache_data
+def load_metric_intervals(version):
+    evaluation = load_evaluation()
+    return None if evaluation is None else evaluation.intervals()
+
+@st.cache_resource
+def load_memory_monitor():
+    return MemoryMonitor()
+
+prediction_log = PredictionLog()
+
+# Patients this browser session is following; survives reruns, not new sessions
+if 'my_worklist' not in st.session_state:
+    st.session_state['my_worklist'] = SessionWorklist()
+my_worklist = st.session_state['my_worklist']
+
+# Login: bcrypt runs once per sign-in on a shared pool; reruns only check the signed token
+session_user = verify_token(st.session_state.get('auth_token'))
+if session_user is None:
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        st.markdown("""
+        <div class='compact-header'>
+            <h1>🏥 OkoaMaisha</h1>
+            <p>Sign in to continue</p>
+        </div>
+        """, unsafe_allow_html=True)
+        user_store = UserStore()
+        if not user_store.users():
+            st.warning("No users are configured yet. Create one with "
+                       "`python -m okoamaisha.auth add-user <username> --role admin`.")
+        with st.form("login"):
+            username = st.text_input("Username")
+            password = st.text_input("Password", type="password")
+            submitted = st.form_submit_button("🔐 Sign In", type="primary", use_container_width=True)
+        if submitted:
+            token = login(user_store, username, password)
+            if token:
+                st.session_state['auth_token'] = token
+                st.rerun()
+            st.error("Incorrect username or password")
+    st.stop()
+
+# Memory accounting per rerun; call-site sampling only with OKOA_MEMORY_PROFILE=1
+memory_monitor = load_memory_monitor()
+memory_monitor.record_rerun(get_script_run_ctx().session_id, st.session_state)
+
+# Minimum role per page; roles in increasing order are clinician, planner, admin
+PAGE_ROLES = {
+    "🏠 Home": 'clinician', "📊 Overview": 'clinician', "📈 Model Performance": 'clinician',
+    "🧮 Cohort Analytics": 'planner', "📋 Discharge Worklist": 'planner', "🗒️ My Worklist": 'clinician',
+    "📄 Ward Reports": 'planner', "📁 Dataset Info": 'clinician', "🧠 Memory": 'admin',
+}
 
 # Sidebar
 with st.sidebar:
@@ -236,7 +297,12 @@ with st.sidebar:
     st.title("OkoaMaisha")
     st.caption("Hospital Length of Stay Predictor")
     
-    page = st.radio("Navigation", ["🏠 Home", "📊 Overview", "📈 Model Performance", "📁 Dataset Info"])
+    page = st.radio("Navigation", [p for p, role in PAGE_ROLES.items() if has_role(session_user['role'], role)])
+    
+    st.caption(f"👤 Signed in as **{session_user['name']}** ({session_user['role']})")
+    if st.button("🚪 Sign Out", use_container_width=True):
+        del st.session_state['auth_token']
+        st.rerun()
     
     st.markdown("---")
     st.markdown("### 🎯 Quick Stats")
@@ -384,9 +450,23 @@ if page == "🏠 Home":
             gender = st.selectbox("Gender", ["Female", "Male"])
             gender_encoded = 1 if gender == "Male" else 0
         with col2:
-            rcount = st.slider("Readmissions (past 180d)", 0, 5, 0)
+            history = load_history()
+            patient_id = st.text_input("Patient ID", placeholder="Look up readmissions from history",
+                                       disabled=history is None,
+                                       help=None if history is not None else "No admission history store loaded")
+            history_rcount = None
+            if history is not None and patient_id.strip().isdigit():
+                history_rcount = int(history.rcount([int(patient_id)], [np.datetime64('today')])[0])
+            rcount = st.slider("Readmissions (past 180d)", *bounds('rcount'), history_rcount or 0,
+                               disabled=history_rcount is not None)
+            if history_rcount is not None:
+                visits = history.visits(int(patient_id))
+                today = np.datetime64('today')
+                recent = visits[(visits >= today - np.timedelta64(WINDOW_DAYS, 'D')) & (visits < today)]
+                st.caption(f"From admission history: {len(recent)} of {len(visits)} recorded visits "
+                           f"in the past {WINDOW_DAYS} days" + (f", last on {visits[-1]}" if len(visits) else ""))
         with col3:
-            bmi = st.number_input("BMI", 10.0, 60.0, 25.0, 0.1)
+            bmi = st.number_input("BMI", *bounds('bmi'), 25.0, 0.1)
         
     with st.expander("🩺 **Medical History & Comorbidities**", expanded=True):
         col1, col2, col3 = st.columns(3)
@@ -427,8 +507,8 @@ if page == "🏠 Home":
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("**Vital Signs**")
-            pulse = st.number_input("Pulse (bpm)", 30, 200, 75)
-            respiration = st.number_input("Respiration (/min)", 5.0, 60.0, 16.0)
+            pulse = st.number_input("Pulse (bpm)", *bounds('pulse'), 75)
+            respiration = st.number_input("Respiration (/min)", *bounds('respiration'), 16.0)
             
             if pulse < 60 or pulse > 100:
                 st.warning(f"⚠️ Abnormal pulse: {pulse} bpm")
@@ -437,8 +517,8 @@ if page == "🏠 Home":
         
         with col2:
             st.markdown("**Hematology**")
-            hematocrit = st.number_input("Hematocrit (%)", 20.0, 60.0, 40.0)
-            neutrophils = st.number_input("Neutrophils (×10³/µL)", 0.0, 20.0, 4.0)
+            hematocrit = st.number_input("Hematocrit (%)", *bounds('hematocrit'), 40.0)
+            neutrophils = st.number_input("Neutrophils (×10³/µL)", *bounds('neutrophils'), 4.0)
             
             if hematocrit < 35 or hematocrit > 50:
                 st.warning(f"⚠️ Abnormal hematocrit: {hematocrit}%")
@@ -447,22 +527,22 @@ if page == "🏠 Home":
         col3, col4, col5, col6 = st.columns(4)
         
         with col3:
-            glucose = st.number_input("Glucose (mg/dL)", 50.0, 400.0, 100.0)
+            glucose = st.number_input("Glucose (mg/dL)", *bounds('glucose'), 100.0)
             if glucose > 140:
                 st.caption("🔴 Elevated")
         
         with col4:
-            sodium = st.number_input("Sodium (mEq/L)", 120.0, 160.0, 140.0)
+            sodium = st.number_input("Sodium (mEq/L)", *bounds('sodium'), 140.0)
             if sodium < 135:
                 st.caption("🔴 Low")
         
         with col5:
-            creatinine = st.number_input("Creatinine (mg/dL)", 0.3, 10.0, 1.0)
+            creatinine = st.number_input("Creatinine (mg/dL)", *bounds('creatinine'), 1.0)
             if creatinine > 1.3:
                 st.caption("🔴 Elevated")
         
         with col6:
-            bloodureanitro = st.number_input("BUN (mg/dL)", 5.0, 100.0, 12.0)
+            bloodureanitro = st.number_input("BUN (mg/dL)", *bounds('bloodureanitro'), 12.0)
             if bloodureanitro > 20:
                 st.caption("🟡 Elevated")
         
@@ -478,10 +558,25 @@ if page == "🏠 Home":
             day_map = {"Mon": 0, "Tue": 1, "Wed": 2, "Thu": 3, "Fri": 4, "Sat": 5, "Sun": 6}
             admission_dayofweek = day_map[admission_dayofweek_str]
         with col4:
-            secondarydiagnosisnonicd9 = st.slider("Secondary Diagnoses", 0, 10, 1)
+            secondarydiagnosisnonicd9 = st.slider("Secondary Diagnoses", *bounds('secondarydiagnosisnonicd9'), 1)
         
         admission_quarter = (admission_month - 1) // 3 + 1
     
+    input_dict = {
+        'gender': gender_encoded, 'rcount': rcount, 'bmi': bmi,
+        'pulse': pulse, 'respiration': respiration, 'hematocrit': hematocrit,
+        'neutrophils': neutrophils, 'glucose': glucose, 'sodium': sodium,
+        'creatinine': creatinine, 'bloodureanitro': bloodureanitro,
+        'secondarydiagnosisnonicd9': secondarydiagnosisnonicd9,
+        'admission_month': admission_month, 'admission_dayofweek': admission_dayofweek,
+        'admission_quarter': admission_quarter, 'facility': facility,
+        'dialysisrenalendstage': dialysisrenalendstage, 'asthma': asthma,
+        'irondef': irondef, 'pneum': pneum, 'substancedependence': substancedependence,
+        'psychologicaldisordermajor': psychologicaldisordermajor, 'depress': depress,
+        'psychother': psychother, 'fibrosisandother': fibrosisandother,
+        'malnutrition': malnutrition, 'hemo': hemo
+    }
+    
     st.markdown("<br>", unsafe_allow_html=True)
     
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -489,27 +584,23 @@ if page == "🏠 Home":
         predict_button = st.button("🚀 PREDICT LENGTH OF STAY", 
                                    type="primary", 
                                    use_container_width=True)
+    
+    with st.expander("🗒️ **Keep this patient in My Worklist**"):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            patient_label = st.text_input("Patient label", placeholder="e.g. Ward 3 · Bed 12")
+        with col2:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("➕ Add to My Worklist", use_container_width=True, disabled=not patient_label):
+                my_worklist.add(patient_label, input_dict)
+                st.success(f"Added **{patient_label}** ({len(my_worklist)} patients in My Worklist)")
 
     if predict_button:
         with st.spinner("🔮 Analyzing patient data with AI..."):
-            input_dict = {
-                'gender': gender_encoded, 'rcount': rcount, 'bmi': bmi,
-                'pulse': pulse, 'respiration': respiration, 'hematocrit': hematocrit,
-                'neutrophils': neutrophils, 'glucose': glucose, 'sodium': sodium,
-                'creatinine': creatinine, 'bloodureanitro': bloodureanitro,
-                'secondarydiagnosisnonicd9': secondarydiagnosisnonicd9,
-                'admission_month': admission_month, 'admission_dayofweek': admission_dayofweek,
-                'admission_quarter': admission_quarter, 'facility': facility,
-                'dialysisrenalendstage': dialysisrenalendstage, 'asthma': asthma,
-                'irondef': irondef, 'pneum': pneum, 'substancedependence': substancedependence,
-                'psychologicaldisordermajor': psychologicaldisordermajor, 'depress': depress,
-                'psychother': psychother, 'fibrosisandother': fibrosisandother,
-                'malnutrition': malnutrition, 'hemo': hemo
-            }
-            
             input_df = engineer_features(input_dict)
             input_scaled = scaler.transform(input_df)
             prediction = model.predict(input_scaled)[0]
+            prediction_log.append(prediction_records(pd.DataFrame([input_dict]), [prediction]))
             
             # Animated prediction result
             st.markdown(f"""
@@ -520,13 +611,18 @@ if page == "🏠 Home":
             </div>
             """, unsafe_allow_html=True)
             
+            patient_values = {'rcount': rcount, 'total_comorbidities': comorbidity_count, 'glucose': glucose,
+                              'sodium': sodium, 'creatinine': creatinine, 'bmi': bmi}
+            rules = clinical.evaluate(patient_values, prediction).iloc[0]
+            
             # Quick status indicators
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                if prediction <= 3:
+                stay = clinical.STAY_CATEGORIES[rules['stay_category']]
+                if stay == 'Short':
                     st.success("🟢 **Short Stay**\n\nLow resource intensity")
-                elif prediction <= 7:
+                elif stay == 'Medium':
                     st.warning("🟡 **Medium Stay**\n\nStandard resources")
                 else:
                     st.error("🔴 **Long Stay**\n\nHigh resource needs")
@@ -542,8 +638,8 @@ if page == "🏠 Home":
                          delta_color="inverse" if rcount >= 2 else "normal")
             
             with col4:
-                risk_score = (comorbidity_count * 10) + (rcount * 15)
-                risk_level = "High" if risk_score > 40 else "Medium" if risk_score > 20 else "Low"
+                risk_score = int(rules['risk_score'])
+                risk_level = clinical.RISK_LEVELS[rules['risk_level']]
                 st.metric("Risk Score", f"{risk_score}/100",
                          delta=risk_level,
                          delta_color="inverse" if risk_level == "High" else "off")
@@ -553,68 +649,14 @@ if page == "🏠 Home":
             # Resource recommendations
             st.markdown("### 📋 Resource Planning Recommendations")
             
-            if prediction > 7:
-                st.error("""
-                **🔴 High-Intensity Care Protocol**
-                
-                ✅ **Immediate Actions:**
-                - Reserve extended-care bed immediately
-                - Assign case manager within 24 hours
-                - Order 10+ day medication supply
-                - Initiate discharge planning on day 1
-                
-                ✅ **Coordination:**
-                - Schedule multi-specialty care coordination
-                - Alert social services for post-discharge support
-                - Arrange family meeting within 48 hours
-                """)
-            elif prediction > 4:
-                st.warning("""
-                **🟡 Standard Care Protocol**
-                
-                ✅ **Standard Actions:**
-                - Standard acute care bed assignment
-                - Regular nursing staff ratios
-                - 7-day medication supply
-                - Routine monitoring and assessments
-                
-                ✅ **Planning:**
-                - Discharge planning by day 3
-                - Regular team rounds
-                """)
-            else:
-                st.success("""
-                **🟢 Short-Stay Fast-Track Protocol**
-                
-                ✅ **Optimized Actions:**
-                - Short-stay unit eligible
-                - Standard staffing sufficient
-                - Early discharge planning opportunity
-                - Minimal supply requirements
-                
-                ✅ **Efficiency:**
-                - Consider same-day discharge protocols
-                - Streamlined documentation
-                """)
+            protocol = clinical.PROTOCOL_KEYS[rules['protocol']]
+            alert = getattr(st, clinical.PROTOCOLS[protocol]['style'])
+            alert(clinical.protocol_markdown(protocol))
             
             # Risk factors
             st.markdown("### ⚠️ Clinical Risk Factors Identified")
             
-            risks = []
-            if rcount >= 2:
-                risks.append(f"🔴 High readmission count ({rcount}) - Strong predictor of extended stay")
-            if comorbidity_count >= 3:
-                risks.append(f"🔴 Multiple comorbidities ({comorbidity_count}) - Complex care needs")
-            if glucose > 140:
-                risks.append(f"🟡 Elevated glucose ({glucose:.0f} mg/dL) - Diabetes management protocol")
-            if sodium < 135:
-                risks.append(f"🟡 Hyponatremia ({sodium:.0f} mEq/L) - Monitor electrolytes closely")
-            if creatinine > 1.3:
-                risks.append(f"🟡 Elevated creatinine ({creatinine:.1f} mg/dL) - Renal function monitoring")
-            if bmi < 18.5:
-                risks.append(f"🟡 Low BMI ({bmi:.1f}) - Nutritional support recommended")
-            elif bmi > 30:
-                risks.append(f"🟡 Elevated BMI ({bmi:.1f}) - Consider mobility support")
+            risks = clinical.risk_factor_messages(rules['risk_factors'], patient_values)
             
             if risks:
                 for risk in risks:
@@ -622,13 +664,34 @@ if page == "🏠 Home":
             else:
                 st.success("✅ No major risk factors identified - Standard protocols apply")
             
+            st.markdown(f"### 🎯 What Would Bring This Under {TARGET_DAYS} Days?")
+            
+            if prediction < TARGET_DAYS:
+                st.success(f"✅ Already predicted under {TARGET_DAYS} days")
+            else:
+                started = datetime.now()
+                _, plans = load_counterfactual_search().search(input_dict)
+                search_ms = (datetime.now() - started).total_seconds() * 1000
+                if len(plans):
+                    st.dataframe(pd.DataFrame({
+                        'Lab / Vital Changes': plans['changes'],
+                        'Fields Changed': plans['n_changes'],
+                        'Predicted LoS (days)': plans['predicted_los'].round(1),
+                    }), use_container_width=True, hide_index=True)
+                    st.caption(f"Smallest lab and vital changes the model predicts would get this patient under "
+                               f"{TARGET_DAYS} days, moving values only toward their typical range in the training "
+                               f"data (within one standard deviation of its mean); history and "
+                               f"demographics are held fixed. Searched in {search_ms:.0f} ms. These are model "
+                               f"what-ifs, not treatment recommendations.")
+                else:
+                    st.info(f"📭 No change of up to three labs or vitals toward their typical ranges brings the "
+                            f"prediction under {TARGET_DAYS} days (searched in {search_ms:.0f} ms).")
+            
             st.markdown("### 📊 Length of Stay Comparison")
             
-            comparison_data = pd.DataFrame({
-                'Category': ['Your Patient', 'Average Short Stay', 'Average Medium Stay', 'Average Long Stay'],
-                'Days': [prediction, 2.5, 5.5, 10.0],
-                'Color': ['#3b82f6', '#10b981', '#f59e0b', '#ef4444']
-            })
+            comparison_data = pd.DataFrame(
+                [('Your Patient', prediction, '#3b82f6')] + clinical.CATEGORY_AVERAGES,
+                columns=['Category', 'Days', 'Color'])
             
             fig = go.Figure(data=[
                 go.Bar(x=comparison_data['Category'], 
@@ -657,8 +720,10 @@ if page == "🏠 Home":
             with col2:
                 st.download_button(
                     "📥 Download Report",
-                    data=f"Patient Prediction Report\n\nPredicted LoS: {prediction:.1f} days\nComorbidities: {comorbidity_count}\nReadmissions: {rcount}",
-                    file_name=f"los_prediction_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                    data=render_report({**input_dict, 'eid': 'ad hoc'}, prediction, metadata['test_mae'],
+                                       metadata['model_name'], datetime.now().strftime('%Y-%m-%d %H:%M')),
+                    file_name=f"los_prediction_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
+                    mime="text/html",
                     use_container_width=True
                 )
 
@@ -843,15 +908,136 @@ elif page == "📈 Model Performance":
     
     st.markdown("### 🎯 Core Performance Metrics")
     
+    evaluation = load_evaluation()
+    intervals = load_metric_intervals(model_version(metadata))
+    if intervals is not None:
+        overall = intervals[intervals['group'] == 'All'].set_index('metric')
+        def ci(metric, fmt):
+            row = overall.loc[metric]
+            return f"95% CI {row['lower']:{fmt}} – {row['upper']:{fmt}}"
+        r2, mae, rmse = (overall.loc[m, 'estimate'] for m in ('r2', 'mae', 'rmse'))
+        recall, missed = overall.loc['recall', 'estimate'], overall.loc['missed', 'estimate']
+        long_stays = int((evaluation.actual > LONG_STAY_DAYS).sum())
+    else:
+        r2, mae, rmse = metadata['test_r2'], metadata['test_mae'], metadata.get('test_rmse', 0.40)
+    
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("R² Score", f"{metadata['test_r2']:.4f}", help="Coefficient of determination - measures prediction accuracy")
+        st.metric("R² Score", f"{r2:.4f}", help="Coefficient of determination - measures prediction accuracy")
+        if intervals is not None:
+            st.caption(ci('r2', '.4f'))
     with col2:
-        st.metric("MAE", f"{metadata['test_mae']:.2f} days", help="Mean Absolute Error - average prediction error")
+        st.metric("MAE", f"{mae:.2f} days", help="Mean Absolute Error - average prediction error")
+        if intervals is not None:
+            st.caption(ci('mae', '.2f'))
     with col3:
-        st.metric("RMSE", f"{metadata.get('test_rmse', 0.40):.2f} days", help="Root Mean Squared Error - penalizes larger errors")
+        st.metric("RMSE", f"{rmse:.2f} days", help="Root Mean Squared Error - penalizes larger errors")
+        if intervals is not None:
+            st.caption(ci('rmse', '.2f'))
     with col4:
-        st.metric("Dataset Size", "100,000 patients", help="Total training + test data")
+        if intervals is not None:
+            st.metric("Long-Stay Recall", f"{recall:.1%}",
+                      help=f"Share of stays over {LONG_STAY_DAYS} days that were predicted over {LONG_STAY_DAYS} days")
+            st.caption(ci('recall', '.1%'))
+        else:
+            st.metric("Dataset Size", "100,000 patients", help="Total training + test data")
+    
+    if intervals is None:
+        st.caption("Test-split metrics recorded when the model was trained.")
+    else:
+        st.caption(f"Scored on {len(evaluation):,} admissions held out of training ({evaluation.split}); "
+                   f"intervals from 2,000 bootstrap resamples. Without an evaluation set the training-time "
+                   f"test metrics are shown.")
+        
+        st.markdown("#### 📏 By Facility and Stay Category")
+        table = intervals.pivot(index='group', columns='metric', values=['estimate', 'lower', 'upper'])
+        table = table.reindex(intervals['group'].unique())
+        patients = intervals.drop_duplicates('group').set_index('group')['patients']
+        def cell(group, metric, fmt):
+            if np.isnan(table.loc[group, ('estimate', metric)]):
+                return "—"
+            return (f"{table.loc[group, ('estimate', metric)]:{fmt}} "
+                    f"({table.loc[group, ('lower', metric)]:{fmt}} – {table.loc[group, ('upper', metric)]:{fmt}})")
+        st.dataframe(pd.DataFrame({
+            'Group': table.index,
+            'Patients': [f"{patients[g]:,}" for g in table.index],
+            'MAE (days)': [cell(g, 'mae', '.2f') for g in table.index],
+            'RMSE (days)': [cell(g, 'rmse', '.2f') for g in table.index],
+            'R²': [cell(g, 'r2', '.3f') for g in table.index],
+            'Long-Stay Recall': [cell(g, 'recall', '.1%') for g in table.index],
+            'Long Stays Missed': [cell(g, 'missed', ',.0f') for g in table.index],
+        }), use_container_width=True, hide_index=True)
+        
+        fig = go.Figure(go.Scatter(
+            x=table[('estimate', 'mae')], y=table.index, mode='markers', marker=dict(size=10, color='#3b82f6'),
+            error_x=dict(type='data', symmetric=False,
+                         array=table[('upper', 'mae')] - table[('estimate', 'mae')],
+                         arrayminus=table[('estimate', 'mae')] - table[('lower', 'mae')]),
+            hovertemplate='%{y}<br>MAE %{x:.3f} days<extra></extra>'))
+        fig.update_layout(title="MAE with 95% Bootstrap Interval", xaxis_title="MAE (days)",
+                          yaxis=dict(autorange='reversed'), height=380)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.markdown("---")
+    
+    st.markdown("### 🔬 Predicted vs. Actual Explorer")
+    
+    if evaluation is None:
+        st.info("📭 No evaluation set of held-out admissions for this model yet. Build it once from the "
+                "ingested admissions with `python -m okoamaisha.evaluation data/admissions.parquet`; a set "
+                "scored by an earlier bundle is not shown. It needs the bundle's "
+                "recorded test split (bundles from `okoamaisha.tuning` have one) or `--holdout-eids`.")
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            explorer_facilities = st.multiselect("Facilities", FACILITIES, default=FACILITIES, key="explorer_facilities")
+        with col2:
+            upper = float(np.ceil(max(evaluation.predicted.max(), evaluation.actual.max())))
+            x_range = st.slider("Predicted LoS range (days)", 0.0, upper, (0.0, upper), 0.5)
+        with col3:
+            y_range = st.slider("Actual LoS range (days)", 0.0, upper, (0.0, upper), 0.5)
+        
+        if explorer_facilities and x_range[1] > x_range[0] and y_range[1] > y_range[0]:
+            started = datetime.now()
+            dense, x_edges, y_edges, points = evaluation.view(x_range, y_range, facilities=explorer_facilities)
+            bin_ms = (datetime.now() - started).total_seconds() * 1000
+            explorer_metrics = evaluation.metrics(explorer_facilities)
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Patients", f"{explorer_metrics['rows']:,}")
+            with col2:
+                st.metric("MAE", f"{explorer_metrics['mae']:.2f} days")
+            with col3:
+                st.metric("RMSE", f"{explorer_metrics['rmse']:.2f} days")
+            with col4:
+                st.metric("Re-bin Time", f"{bin_ms:.1f} ms")
+            
+            fig = go.Figure()
+            fig.add_trace(go.Heatmap(x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+                                     z=np.log10(dense.T), colorscale='Blues', name='Dense bins',
+                                     colorbar=dict(title='log₁₀ patients'),
+                                     hovertemplate='Predicted %{x:.1f}<br>Actual %{y:.1f}<extra></extra>'))
+            fig.add_trace(go.Scattergl(x=points['predicted'], y=points['actual'], mode='markers',
+                                       marker=dict(size=4, color='#f59e0b', opacity=0.6), name='Sparse points',
+                                       text=points['facility'],
+                                       hovertemplate='Facility %{text}<br>Predicted %{x:.2f}<br>Actual %{y}<extra></extra>'))
+            lo, hi = max(x_range[0], y_range[0]), min(x_range[1], y_range[1])
+            fig.add_trace(go.Scatter(x=[lo, hi], y=[lo, hi], mode='lines', name='Perfect prediction',
+                                     line=dict(color='#ef4444', dash='dash')))
+            fig.update_layout(title="Predicted vs. Actual Length of Stay", xaxis_title="Predicted (days)",
+                              yaxis_title="Actual (days)", height=520, xaxis_range=list(x_range),
+                              yaxis_range=list(y_range))
+            st.plotly_chart(fig, use_container_width=True)
+            
+            fig = go.Figure()
+            for fac in explorer_facilities:
+                centers, counts = evaluation.residual_histogram(fac)
+                fig.add_trace(go.Scatter(x=centers, y=counts / max(counts.sum(), 1), mode='lines',
+                                         line_shape='hvh', name=f"Facility {fac}"))
+            fig.update_layout(title="Residual Distribution by Facility (actual − predicted)",
+                              xaxis_title="Residual (days)", yaxis_title="Share of patients", height=380)
+            st.plotly_chart(fig, use_container_width=True)
     
     st.markdown("---")
     
@@ -872,16 +1058,19 @@ elif page == "📈 Model Performance":
         """, unsafe_allow_html=True)
     
     with col2:
-        st.markdown("""
+        long_stay_items = (
+            f"<li><strong>True Positives:</strong> Correctly flagged {long_stays - missed:,.0f} of {long_stays:,} long-stay patients</li>"
+            f"<li><strong>False Negatives:</strong> {missed:,.0f} long-stay patients predicted as shorter stays ({1 - recall:.1%})</li>"
+        ) if intervals is not None else ""
+        st.markdown(f"""
         <div class='metric-card' style='border-left-color: #10b981;'>
-            <h4 style='color: #10b981;'>✅ Validation Results (Gradient Boosting)</h4>
+            <h4 style='color: #10b981;'>✅ Validation Results ({metadata['model_name']})</h4>
             <ul style='color: #475569; line-height: 2;'>
-                <li><strong>Top Performing Model:</strong> Gradient Boosting Regressor</li>
-                <li><strong>R²:</strong> 97.21%</li>
-                <li><strong>MAE:</strong> 0.31 days</li>
-                <li><strong>RMSE:</strong> 0.40 days</li>
-                <li><strong>True Positives:</strong> Correctly flagged 1,682 of 1,713 long-stay patients</li>
-                <li><strong>False Negatives:</strong> Only 31 long-stay patients incorrectly flagged as short-stay patients(1.8%)</li>
+                <li><strong>Top Performing Model:</strong> {metadata['model_name']}</li>
+                <li><strong>R²:</strong> {r2:.2%}</li>
+                <li><strong>MAE:</strong> {mae:.2f} days</li>
+                <li><strong>RMSE:</strong> {rmse:.2f} days</li>
+                {long_stay_items}
             </ul>
         </div>
         """, unsafe_allow_html=True)
@@ -895,30 +1084,30 @@ elif page == "📈 Model Performance":
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.info("""
-            **R² Score (0.9721)**
+            st.info(f"""
+            **R² Score ({r2:.4f})**
             
             Explains how much variation in length of stay our model predicts. 
             
-            **97.21%** means the model is highly accurate - only **2.79%** of variation is unexplained.
+            **{r2:.2%}** of the variation is explained; **{1 - r2:.2%}** is unexplained.
             """)
         
         with col2:
-            st.info("""
-            **MAE - Mean Absolute Error (0.31 days)**
+            st.info(f"""
+            **MAE - Mean Absolute Error ({mae:.2f} days)**
             
-            On average, predictions are off by just **7.4 hours**. 
+            On average, predictions are off by **{mae * 24:.1f} hours**. 
             
-            If we predict 5 days, actual stay is typically between **4.7-5.3 days**.
+            If we predict 5 days, actual stay is typically between **{5 - mae:.1f}–{5 + mae:.1f} days**.
             """)
         
         with col3:
-            st.info("""
-            **RMSE (0.40 days)**
+            st.info(f"""
+            **RMSE ({rmse:.2f} days)**
             
             Similar to MAE but penalizes larger errors more heavily. 
             
-            If we predict 5 days, even "worst-case" patient length of stay is typically between **4.6–5.4 days**.
+            If we predict 5 days, even "worst-case" patient length of stay is typically between **{5 - rmse:.1f}–{5 + rmse:.1f} days**.
             """)
     
     st.markdown("---")
@@ -955,9 +1144,27 @@ elif page == "📈 Model Performance":
         fig.update_traces(texttemplate='%{text:.2f} days', textposition='outside')
         fig.update_layout(showlegend=False)
         st.plotly_chart(fig, use_container_width=True)
-    
+
+    tuning = metadata.get('tuning')
+    if tuning:
+        profile = tuning['profile']
+        st.markdown("#### 🎛️ Tuned Configuration")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("CV MAE", f"{tuning['cv_mae']:.3f} days", help=f"{tuning['n_folds']}-fold cross-validation")
+        with col2:
+            st.metric("Boosting Stages", f"{tuning['stages']}")
+        with col3:
+            st.metric("Refit Time", f"{profile['refit_seconds']:.1f}s")
+        with col4:
+            st.metric("Predict Time", f"{profile['predict_us_per_row']:.1f} µs/row")
+        st.caption(f"{metadata['model_name']}: " + ", ".join(f"{k}={v}" for k, v in tuning['params'].items()))
+        st.dataframe(pd.DataFrame(profile['rungs']).rename(columns={
+            'stages': 'Stages', 'candidates': 'Candidates', 'fits': 'Fits', 'cached': 'Cached Folds', 'seconds': 'Seconds'}),
+            use_container_width=True, hide_index=True)
+
     st.markdown("---")
-    
+
     st.markdown("### 🔍 Top Predictive Features")
     
     importance_data = {
@@ -991,18 +1198,339 @@ elif page == "📈 Model Performance":
         """, unsafe_allow_html=True)
     
     with col2:
-        st.markdown("""
+        long_stay_items = (
+            f"<li><strong>Recall:</strong> {recall:.1%} detection rate ({long_stays - missed:,.0f}/{long_stays:,}), {ci('recall', '.1%')}</li>"
+            f"<li><strong>Missed cases:</strong> {missed:,.0f} patients ({ci('missed', ',.0f')})</li>"
+        ) if intervals is not None else "<li><strong>Recall:</strong> build the evaluation set to measure long-stay detection</li>"
+        st.markdown(f"""
         <div class='capability-card' style='border-left-color: #10b981;'>
             <h4 style='color: #10b981;'>🎯 Long-Stay Performance</h4>
             <ul>
-                <li><strong>Accuracy:</strong> 97% for extended stays</li>
-                <li><strong>Recall:</strong> 98% detection rate (1,682/1,713)</li>
-                <li><strong>Missed cases:</strong> Only 31 patients</li>
+                {long_stay_items}
                 <li><strong>Impact:</strong> Enables proactive resource optimization and capacity planning</li>
             </ul>
         </div>
         """, unsafe_allow_html=True)
 
+# COHORT ANALYTICS PAGE
+elif page == "🧮 Cohort Analytics":
+    st.title("🧮 Cohort Analytics")
+    
+    st.markdown("""
+    <div style='background: linear-gradient(135deg, #eff6ff 0%, #dbeafe 100%); padding: 1.5rem; border-radius: 12px; margin-bottom: 2rem; border-left: 5px solid #3b82f6;'>
+        <p style='color: #1e3a8a; font-size: 1.1rem; margin: 0; line-height: 1.7;'>
+            Slice <strong>predicted and actual length of stay</strong> across every logged prediction by facility, 
+            admission month, day of week, comorbidity count and readmission count. Aggregates are precomputed 
+            and updated as new predictions are logged, so every filter answers instantly.
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    cube = load_cohort_cube()
+    new_rows = cube.refresh(prediction_log)
+    if new_rows:
+        cube.save()
+    
+    dimension_labels = {
+        'facility': 'Facility', 'admission_month': 'Admission Month', 'admission_dayofweek': 'Day of Week',
+        'total_comorbidities': 'Comorbidity Count', 'rcount': 'Readmissions (180d)'
+    }
+    levels = dict(DIMENSIONS)
+    
+    with st.expander("🔎 **Filters**", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            facilities = st.multiselect("Facility", levels['facility'], default=levels['facility'])
+            months = st.slider("Admission Month", 1, 12, (1, 12))
+        with col2:
+            days = st.multiselect("Day of Week", DAY_NAMES, default=DAY_NAMES)
+            comorbidities = st.multiselect("Comorbidity Count", levels['total_comorbidities'],
+                                           default=levels['total_comorbidities'])
+        with col3:
+            readmissions = st.multiselect("Readmissions (180d)", levels['rcount'], default=levels['rcount'])
+            group_by = st.selectbox("Group by", list(dimension_labels), format_func=dimension_labels.get)
+    
+    started = datetime.now()
+    cohort = cube.query(by=group_by, facility=facilities,
+                        admission_month=list(range(months[0], months[1] + 1)),
+                        admission_dayofweek=days, total_comorbidities=comorbidities, rcount=readmissions)
+    query_ms = (datetime.now() - started).total_seconds() * 1000
+    
+    total = int(cohort['patients'].sum())
+    if total == 0:
+        st.info("📭 No logged predictions match these filters yet. Predictions from the Home page and "
+                "`python -m okoamaisha.batch_score ... --log-predictions` appear here automatically.")
+    else:
+        with_actual = int(cohort['with_actual'].sum())
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Patients", f"{total:,}")
+        with col2:
+            st.metric("Mean Predicted LoS", f"{(cohort['mean_predicted_los'] * cohort['patients']).sum() / total:.2f} days")
+        with col3:
+            if with_actual:
+                st.metric("Mean Actual LoS",
+                          f"{(cohort['mean_actual_los'].fillna(0) * cohort['with_actual']).sum() / with_actual:.2f} days")
+            else:
+                st.metric("Mean Actual LoS", "—")
+        with col4:
+            st.metric("Query Time", f"{query_ms:.1f} ms")
+        
+        chart = cohort[cohort['patients'] > 0].reset_index()
+        chart[group_by] = chart[group_by].astype(str)
+        fig = go.Figure([
+            go.Bar(name='Predicted', x=chart[group_by], y=chart['mean_predicted_los'], marker_color='#3b82f6'),
+            go.Bar(name='Actual', x=chart[group_by], y=chart['mean_actual_los'], marker_color='#10b981'),
+        ])
+        fig.update_layout(barmode='group', title=f"Mean Length of Stay by {dimension_labels[group_by]}",
+                          xaxis_title=dimension_labels[group_by], yaxis_title="Days", height=420)
+        st.plotly_chart(fig, use_container_width=True)
+        
+        st.markdown("### 📋 Cohort Table")
+        st.dataframe(cohort.rename(columns={
+            'patients': 'Patients', 'mean_predicted_los': 'Mean Predicted', 'std_predicted_los': 'SD Predicted',
+            'with_actual': 'With Actual', 'mean_actual_los': 'Mean Actual', 'std_actual_los': 'SD Actual', 'mae': 'MAE'
+        }).round(2), use_container_width=True)
+
+# DISCHARGE WORKLIST PAGE
+elif page == "📋 Discharge Worklist":
+    st.title("📋 Discharge Planning Worklist")
+    
+    st.markdown("""
+    <div style='background: linear-gradient(135deg, #eff6ff 0%, #dbeafe 100%); padding: 1.5rem; border-radius: 12px; margin-bottom: 2rem; border-left: 5px solid #3b82f6;'>
+        <p style='color: #1e3a8a; font-size: 1.1rem; margin: 0; line-height: 1.7;'>
+            The patients currently in hospital with the <strong>longest predicted stays</strong> and the 
+            <strong>highest risk scores</strong>, across all facilities. Admissions scored with an encounter id 
+            join the worklist, re-scores move them, and discharges remove them as soon as they are logged.
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        top_k = st.slider("Patients per list", 10, 200, 50, 10)
+    with col2:
+        live = st.toggle("Live (refresh every 5s)", value=True)
+    
+    worklist = load_worklist()
+    
+    @st.fragment(run_every=5 if live else None)
+    def show_worklist():
+        started = datetime.now()
+        new_rows = worklist.refresh(prediction_log)
+        refresh_ms = (datetime.now() - started).total_seconds() * 1000
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Patients on Census", f"{len(worklist):,}")
+        with col2:
+            st.metric("New Log Rows", f"{new_rows:,}")
+        with col3:
+            st.metric("Update Time", f"{refresh_ms:.1f} ms")
+        
+        if len(worklist) == 0:
+            st.info("📭 No admitted patients yet. Score a census file with encounter ids, e.g. "
+                    "`python -m okoamaisha.batch_score census.csv --log-predictions`, or run "
+                    "`python -m okoamaisha.server --log-predictions` and send patients with an `eid`.")
+            return
+        
+        labels = {'eid': 'Encounter', 'facility': 'Facility', 'predicted_los': 'Predicted LoS',
+                  'stay_category': 'Stay', 'risk_score': 'Risk Score', 'total_comorbidities': 'Comorbidities',
+                  'rcount': 'Readmissions (180d)'}
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown(f"### ⏳ Top {top_k} by Predicted Stay")
+            st.dataframe(worklist.top(top_k, 'predicted_los')[list(labels)].rename(columns=labels).round(2),
+                         use_container_width=True)
+        with col2:
+            st.markdown(f"### ⚠️ Top {top_k} by Risk Score")
+            st.dataframe(worklist.top(top_k, 'risk_score')[list(labels)].rename(columns=labels).round(2),
+                         use_container_width=True)
+    
+    show_worklist()
+
+# MY WORKLIST PAGE
+elif page == "🗒️ My Worklist":
+    st.title("🗒️ My Worklist")
+    
+    st.markdown("""
+    <div style='background: linear-gradient(135deg, #eff6ff 0%, #dbeafe 100%); padding: 1.5rem; border-radius: 12px; margin-bottom: 2rem; border-left: 5px solid #3b82f6;'>
+        <p style='color: #1e3a8a; font-size: 1.1rem; margin: 0; line-height: 1.7;'>
+            Patients you added from the Home page stay here for this session. <strong>Edit a lab value or vital 
+            directly in the table</strong> and only the patients you changed are re-scored; everyone else keeps 
+            their cached prediction.
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    if len(my_worklist) == 0:
+        st.info("📭 Your worklist is empty. Fill in a patient on the Home page and use "
+                "**🗒️ Keep this patient in My Worklist**.")
+    else:
+        editable = {'rcount': 'Readmissions', 'bmi': 'BMI', 'pulse': 'Pulse', 'respiration': 'Respiration',
+                    'hematocrit': 'Hematocrit', 'neutrophils': 'Neutrophils', 'glucose': 'Glucose',
+                    'sodium': 'Sodium', 'creatinine': 'Creatinine', 'bloodureanitro': 'BUN'}
+        
+        # Score anything added since the last visit before showing the table
+        my_worklist.rescore(predict_batch)
+        table = my_worklist.table()
+        
+        edited = st.data_editor(
+            table[['predicted_los', 'stay_category', 'risk_score', 'facility'] + list(editable)],
+            column_config={
+                'predicted_los': st.column_config.NumberColumn("Predicted LoS", format="%.1f days"),
+                'stay_category': st.column_config.TextColumn("Stay"),
+                'risk_score': st.column_config.NumberColumn("Risk Score"),
+                'facility': st.column_config.TextColumn("Facility"),
+                **{field: st.column_config.NumberColumn(label, min_value=bounds(field)[0], max_value=bounds(field)[1])
+                   for field, label in editable.items()},
+            },
+            disabled=['predicted_los', 'stay_category', 'risk_score', 'facility'],
+            use_container_width=True, key="my_worklist_editor")
+        
+        changed = my_worklist.update(edited[list(editable)])
+        if changed:
+            my_worklist.rescore(predict_batch)
+            st.rerun()
+        
+        rescored, seconds = my_worklist.last_rescore
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Patients", len(my_worklist))
+        with col2:
+            st.metric("Re-scored Last Update", f"{rescored} of {len(my_worklist)}")
+        with col3:
+            st.metric("Re-score Time", f"{seconds * 1000:.1f} ms")
+        
+        remove = st.multiselect("Remove patients", list(my_worklist.inputs.index))
+        if remove and st.button("🗑️ Remove Selected"):
+            my_worklist.remove(remove)
+            st.rerun()
+
+# WARD REPORTS PAGE
+elif page == "📄 Ward Reports":
+    st.title("📄 Ward Discharge-Planning Reports")
+    
+    st.markdown("""
+    <div style='background: linear-gradient(135deg, #eff6ff 0%, #dbeafe 100%); padding: 1.5rem; border-radius: 12px; margin-bottom: 2rem; border-left: 5px solid #3b82f6;'>
+        <p style='color: #1e3a8a; font-size: 1.1rem; margin: 0; line-height: 1.7;'>
+            Upload a census file and download a <strong>full discharge-planning report for every patient</strong> 
+            in one zip: inputs, predicted stay and interval, resource planning protocol, clinical risk factors 
+            and the comparison chart. Reports are rendered in parallel.
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    uploaded = st.file_uploader("Census CSV (dataset schema or Home page input fields)", type=["csv"])
+    ward = st.selectbox("Facility", ["All"] + FACILITIES)
+    
+    if uploaded is not None:
+        raw = pd.read_csv(uploaded)
+        inputs = from_admissions(raw) if is_admissions_schema(raw) else raw
+        if 'eid' in raw and 'eid' not in inputs:
+            inputs = inputs.assign(eid=raw['eid'].to_numpy())
+        cleaned, codes = validate_batch(inputs)
+        cleaned = cleaned[codes == 0]
+        if ward != "All":
+            cleaned = cleaned[cleaned['facility'] == ward]
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Patients in File", f"{len(raw):,}")
+        with col2:
+            st.metric("Invalid Rows Skipped", f"{int(np.count_nonzero(codes)):,}")
+        with col3:
+            st.metric("Reports to Generate", f"{len(cleaned):,}")
+        
+        if len(cleaned) and st.button("🗂️ Generate Ward Reports", type="primary", use_container_width=True):
+            with st.spinner(f"Rendering {len(cleaned):,} reports..."):
+                started = datetime.now()
+                predictions = predict_batch(cleaned)
+                archive = BytesIO()
+                n = write_ward_reports(cleaned, predictions, archive, metadata)
+                elapsed = (datetime.now() - started).total_seconds()
+            st.success(f"✅ {n:,} reports generated in {elapsed:.1f}s")
+            st.download_button("📥 Download Reports (zip)", data=archive.getvalue(),
+                               file_name=f"ward_reports_{ward}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                               mime="application/zip", use_container_width=True)
+
+# MEMORY PAGE
+elif page == "🧠 Memory":
+    st.title("🧠 Memory Accounting")
+    
+    st.markdown("""
+    <div style='background: linear-gradient(135deg, #eff6ff 0%, #dbeafe 100%); padding: 1.5rem; border-radius: 12px; margin-bottom: 2rem; border-left: 5px solid #3b82f6;'>
+        <p style='color: #1e3a8a; font-size: 1.1rem; margin: 0; line-height: 1.7;'>
+            Memory of this app process, of every active session and of the shared model caches. 
+            Growth across reruns is flagged so leaks show up before a long-lived worker runs out of memory.
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    memory_monitor.register_cache("model artifacts", (model, scaler, feature_names, metadata))
+    memory_monitor.register_cache("cohort cube", load_cohort_cube())
+    memory_monitor.register_cache("discharge worklist", load_worklist())
+    memory_monitor.register_cache("evaluation set", load_evaluation())
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("📸 Sample Now", use_container_width=True):
+            memory_monitor.measure_caches()
+            memory_monitor.sample()
+    with col2:
+        if st.button("💾 Write Dump", use_container_width=True):
+            st.success(f"Wrote `{memory_monitor.dump()}`")
+    
+    samples = pd.DataFrame(list(memory_monitor.samples))
+    windows = pd.DataFrame(list(memory_monitor.windows))
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Process RSS", f"{samples['rss_mb'].iloc[-1] or 0:,.0f} MB" if len(samples) else "—")
+    with col2:
+        st.metric("Kept by Last Traced Rerun", f"{windows['retained_bytes'].iloc[-1] / 1024:,.0f} KB" if len(windows)
+                  else "off" if not memory_monitor.profile else "pending")
+    with col3:
+        st.metric("Reruns", f"{memory_monitor.reruns:,}")
+    with col4:
+        st.metric("Active Sessions", f"{len(memory_monitor.sessions)}")
+    
+    if not memory_monitor.profile:
+        st.info("📭 Call-site tracing is off. Start the app with `OKOA_MEMORY_PROFILE=1` to trace one rerun "
+                f"in every {memory_monitor.sample_every}.")
+    
+    leaks = memory_monitor.leaks()
+    for warning in leaks:
+        st.warning(f"⚠️ {warning}")
+    if not leaks:
+        st.success("✅ No memory growth flagged across reruns")
+    
+    if len(samples) > 1:
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=samples['reruns'], y=samples['rss_mb'], name='RSS (MB)', mode='lines+markers',
+                                 line=dict(color='#3b82f6')))
+        if len(windows):
+            fig.add_trace(go.Bar(x=windows['reruns'], y=windows['retained_bytes'] / 1e6, name='Kept by traced rerun (MB)',
+                                 marker_color='#f59e0b', yaxis='y2'))
+        fig.update_layout(title='Memory Across Reruns', xaxis_title='Reruns (all sessions)', yaxis_title='RSS (MB)',
+                          yaxis2=dict(title='Kept (MB)', overlaying='y', side='right', showgrid=False),
+                          height=350, plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)')
+        st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("### 👥 Sessions")
+        st.dataframe(memory_monitor.session_table().round(1), use_container_width=True, hide_index=True)
+    with col2:
+        st.markdown("### 🗄️ Shared Caches")
+        st.dataframe(memory_monitor.cache_table().round(2), use_container_width=True, hide_index=True)
+    
+    if memory_monitor.sites:
+        st.markdown("### 📍 Kept Alive by the Last Traced Rerun")
+        st.dataframe(memory_monitor.site_table().round(1), use_container_width=True, hide_index=True)
+    
+    st.download_button("📥 Download Report (JSON)", json.dumps(memory_monitor.report(), indent=2, default=float),
+                       file_name=f"memory_{datetime.now():%Y%m%d_%H%M%S}.json", mime="application/json")
+
 # DATASET INFO PAGE
 else:  # Dataset Info
     st.title("📁 Training Dataset Information")
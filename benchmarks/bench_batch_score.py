@@ -0,0 +1,53 @@
+"""
+Batch scoring speedup at 1, 2, 4 and 8 workers
+
+Usage:
+    python benchmarks/bench_batch_score.py --rows 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.batch_score import ParallelScorer
+from okoamaisha.scoring import Scorer
+from okoamaisha.synthetic import synthetic_inputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    scorer = Scorer.load()
+    features = scorer.features(synthetic_inputs(args.rows))
+
+    started = time.perf_counter()
+    expected = scorer.predict_features(features)
+    baseline = time.perf_counter() - started
+    print(f"{args.rows:,} rows on {os.cpu_count()} cores")
+    print(f"{'single-process predict':>30}: {baseline:7.3f}s")
+
+    for workers in args.workers:
+        with ParallelScorer(workers) as pool:
+            pool.warm_up()
+            timings = []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                predictions = pool.score(features)
+                timings.append(time.perf_counter() - started)
+        assert np.array_equal(predictions, expected), "parallel output differs from single-process output"
+        best = min(timings)
+        print(f"{f'{workers} worker(s)':>30}: {best:7.3f}s  speedup x{baseline / best:.2f}")
+
+
+if __name__ == '__main__':
+    main()
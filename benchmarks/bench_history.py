@@ -0,0 +1,94 @@
+"""
+Sorted-array history store vs. per-patient scans
+
+Builds a synthetic history of millions of visits, then times batch rcount
+queries through `HistoryStore` against a loop that filters each patient's
+visits, checking that both agree on a sample. Also times incremental adds
+of daily-sized batches.
+
+Usage:
+    python benchmarks/bench_history.py --visits 5000000 --patients 1000000 --queries 100000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.history import RCOUNT_CAP, WINDOW_DAYS, HistoryStore
+
+START = np.datetime64('2015-01-01')
+YEARS = 5
+
+
+def synthetic_visits(n, patients, rng):
+    return pd.DataFrame({'eid': rng.integers(0, patients, n),
+                         'vdate': START + rng.integers(0, 365 * YEARS, n).astype('timedelta64[D]')})
+
+
+def scan_rcount(visits, patients, dates):
+    by_patient = {p: np.unique(g.to_numpy()) for p, g in visits.groupby('eid')['vdate']}
+    out = np.zeros(len(patients), dtype=np.int64)
+    for i, (patient, date) in enumerate(zip(patients, dates)):
+        days = by_patient.get(patient)
+        if days is not None:
+            out[i] = np.count_nonzero((days < date) & (days >= date - np.timedelta64(WINDOW_DAYS, 'D')))
+    return np.minimum(out, RCOUNT_CAP)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--visits', type=int, default=5_000_000)
+    parser.add_argument('--patients', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=100_000)
+    parser.add_argument('--scan-queries', type=int, default=2_000, help="Queries checked against the scan")
+    parser.add_argument('--daily', type=int, default=5_000, help="Visits per incremental add")
+    parser.add_argument('--days', type=int, default=30, help="Incremental adds to time")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    visits = synthetic_visits(args.visits, args.patients, rng)
+    started = time.perf_counter()
+    store = HistoryStore.from_admissions(visits)
+    build_s = time.perf_counter() - started
+    print(f"built {len(store):,} visits of {args.patients:,} patients in {build_s:.2f}s "
+          f"({store.main.nbytes / 2 ** 20:.0f} MB)")
+
+    queries = synthetic_visits(args.queries, args.patients, rng)
+    patients, dates = queries['eid'].to_numpy(), queries['vdate'].to_numpy()
+    started = time.perf_counter()
+    rcount = store.rcount(patients, dates)
+    query_s = time.perf_counter() - started
+
+    n = args.scan_queries
+    started = time.perf_counter()
+    expected = scan_rcount(visits[visits['eid'].isin(patients[:n])], patients[:n], dates[:n])
+    scan_s = (time.perf_counter() - started) / n * args.queries
+    assert np.array_equal(rcount[:n], expected), "history store disagrees with the per-patient scan"
+
+    print(f"\n{'path':>28} {'seconds':>8} {'per query':>10}")
+    print(f"{'sorted arrays':>28} {query_s:8.3f} {query_s / args.queries * 1e6:8.2f}us")
+    print(f"{'per-patient scan (est.)':>28} {scan_s:8.3f} {scan_s / args.queries * 1e6:8.2f}us")
+    print(f"rcount distribution: {np.bincount(rcount, minlength=RCOUNT_CAP + 1).tolist()}")
+
+    timings = []
+    for day in range(args.days):
+        batch = synthetic_visits(args.daily, args.patients, rng)
+        started = time.perf_counter()
+        store.add(batch['eid'].to_numpy(), batch['vdate'].to_numpy())
+        timings.append(time.perf_counter() - started)
+    ms = np.asarray(timings) * 1000
+    started = time.perf_counter()
+    store.rcount(patients, dates)
+    print(f"\n{args.days} adds of {args.daily:,} visits: p50 {np.percentile(ms, 50):.1f} ms, "
+          f"max {ms.max():.1f} ms (merges at {len(store.delta):,} pending); "
+          f"query after adds {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Load time and memory: raw CSV vs. typed Parquet with projection and pushdown
+
+Usage:
+    python benchmarks/bench_ingest.py --rows 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.ingest import MODEL_INPUT_COLUMNS, convert_csv, read_admissions
+from okoamaisha.synthetic import synthetic_admissions
+
+
+def measure(label, load):
+    started = time.perf_counter()
+    frame = load()
+    elapsed = time.perf_counter() - started
+    print(f"{label:>38}: {elapsed * 1000:8.1f} ms {frame.memory_usage(deep=True).sum() / 1e6:8.2f} MB "
+          f"{len(frame):>8,} rows x {frame.shape[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'LengthOfStay.csv')
+        parquet_path = os.path.join(tmp, 'admissions.parquet')
+        synthetic_admissions(args.rows).to_csv(csv_path, index=False)
+
+        started = time.perf_counter()
+        convert_csv(csv_path, parquet_path)
+        print(f"one-off conversion: {time.perf_counter() - started:.2f}s, "
+              f"{os.path.getsize(csv_path) / 1e6:.1f} MB CSV -> {os.path.getsize(parquet_path) / 1e6:.1f} MB Parquet")
+
+        measure('pandas read_csv, all columns', lambda: pd.read_csv(csv_path))
+        measure('parquet, all columns', lambda: read_admissions(parquet_path))
+        measure('parquet, model input columns', lambda: read_admissions(parquet_path, MODEL_INPUT_COLUMNS))
+        measure('parquet, 3 columns, facility C, Q1',
+                lambda: read_admissions(parquet_path, ['eid', 'vdate', 'lengthofstay'],
+                                        facility='C', months=(1, 3)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Prediction latency during a burst of logins
+
+Single-patient predictions run back to back while N users sign in at once,
+either through `auth.login` (bcrypt on the bounded shared pool) or with one
+unbounded thread per login calling bcrypt directly. Also times the signed
+token check that every Streamlit rerun performs.
+
+Usage:
+    python benchmarks/bench_login.py --users 50 --rounds 12
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha import auth
+from okoamaisha.scoring import Scorer
+from okoamaisha.synthetic import synthetic_inputs
+
+
+def predict_latencies(scorer, patient, done):
+    latencies = []
+    while not done.is_set():
+        started = time.perf_counter()
+        scorer.predict_records([patient])
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies) * 1000
+
+
+def run_burst(label, scorer, patient, logins):
+    done = threading.Event()
+    result = {}
+    predictor = threading.Thread(target=lambda: result.update(ms=predict_latencies(scorer, patient, done)))
+    predictor.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=login) for login in logins]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    predictor.join()
+    ms = result['ms']
+    print(f"{label:>22}: logins done in {elapsed:6.2f}s | prediction p50 {np.percentile(ms, 50):6.2f} ms, "
+          f"p99 {np.percentile(ms, 99):7.2f} ms, max {ms.max():7.2f} ms ({len(ms):,} predictions)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=auth.BCRYPT_ROUNDS)
+    args = parser.parse_args()
+
+    scorer = Scorer.load()
+    patient = synthetic_inputs(1).to_dict('records')[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = auth.UserStore(os.path.join(tmp, 'users.json'))
+        for i in range(args.users):
+            store.add_user(f'user{i}', f'password{i}', rounds=args.rounds)
+        users = store.users()
+
+        # Baseline: predictions with nothing else running
+        done = threading.Event()
+        timer = threading.Timer(2.0, done.set)
+        timer.start()
+        ms = predict_latencies(scorer, patient, done)
+        print(f"{'no logins':>22}: prediction p50 {np.percentile(ms, 50):6.2f} ms, p99 {np.percentile(ms, 99):7.2f} ms")
+
+        run_burst("shared bcrypt pool", scorer, patient,
+                  [lambda i=i: auth.login(store, f'user{i}', f'password{i}', timeout=None)
+                   for i in range(args.users)])
+        run_burst("thread per login", scorer, patient,
+                  [lambda i=i: auth.bcrypt.checkpw(f'password{i}'.encode(), users[f'user{i}']['hash'].encode())
+                   for i in range(args.users)])
+
+        token = auth.login(store, 'user0', 'password0')
+        started = time.perf_counter()
+        for _ in range(10_000):
+            auth.verify_token(token)
+        print(f"token check per rerun: {(time.perf_counter() - started) / 10_000 * 1e6:.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
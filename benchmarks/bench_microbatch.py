@@ -0,0 +1,70 @@
+"""
+Micro-batching throughput and latency under light and heavy load
+
+Each simulated client sends single-patient requests back to back. The same
+workload is run with per-request scoring (batch size 1) and with the
+micro-batcher, at increasing numbers of concurrent clients.
+
+Usage:
+    python benchmarks/bench_microbatch.py --clients 1 8 64 --requests 2000
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.microbatch import MicroBatcher
+from okoamaisha.scoring import Scorer
+from okoamaisha.synthetic import synthetic_inputs
+
+
+async def run(scorer, patients, clients, max_batch_size, max_delay_ms):
+    executor = ThreadPoolExecutor(max_workers=2)
+    batcher = MicroBatcher(lambda rows: scorer.predict_records(rows).tolist(),
+                           max_batch_size, max_delay_ms, executor)
+    await batcher.start()
+    latencies = []
+
+    async def client(rows):
+        for row in rows:
+            started = time.perf_counter()
+            await batcher.submit(row)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(patients[i::clients]) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    await batcher.stop()
+    executor.shutdown()
+    return len(patients) / elapsed, np.percentile(np.asarray(latencies) * 1000, [50, 99]), batcher.metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-delay-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    scorer = Scorer.load()
+    patients = synthetic_inputs(args.requests).to_dict('records')
+
+    print(f"{'clients':>8} {'mode':>12} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    for clients in args.clients:
+        for label, size, delay in [('per-request', 1, 0.0),
+                                   ('micro-batch', args.max_batch_size, args.max_delay_ms)]:
+            throughput, (p50, p99), metrics = asyncio.run(run(scorer, patients, clients, size, delay))
+            print(f"{clients:>8} {label:>12} {throughput:>10,.0f} {p50:>8.2f} {p99:>8.2f} "
+                  f"{metrics['mean_batch_size']:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
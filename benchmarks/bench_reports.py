@@ -0,0 +1,43 @@
+"""
+Ward report generation throughput by worker count
+
+Usage:
+    python benchmarks/bench_reports.py --patients 1000 --workers 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.reports import write_ward_reports
+from okoamaisha.scoring import Scorer
+from okoamaisha.synthetic import synthetic_inputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    scorer = Scorer.load()
+    inputs = synthetic_inputs(args.patients)
+    predictions = scorer.predict_frame(inputs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            path = os.path.join(tmp, f'reports_{workers}.zip')
+            started = time.perf_counter()
+            n = write_ward_reports(inputs, predictions, path, scorer.metadata, workers=workers)
+            elapsed = time.perf_counter() - started
+            print(f"workers={workers:>2}: {n:,} reports in {elapsed:.2f}s "
+                  f"({n / elapsed:,.0f} reports/s), zip {os.path.getsize(path) / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Per-facility models vs. the single global model: accuracy, size and latency
+
+Trains facility models into a temporary directory from an ingested
+admissions file (or synthetic admissions when none is given) and compares
+them with the global model on the same held-out rows: the global bundle's
+recorded split or --holdout-eids. The global model never saw synthetic
+admissions, so without either a random fifth of those is held out.
+
+Usage:
+    python benchmarks/bench_router.py --data data/admissions.parquet --mode specialist
+    python benchmarks/bench_router.py --data data/admissions.parquet --holdout-eids test_eids.csv
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.artifacts import load_holdout_eids, read_eids
+from okoamaisha.features import from_admissions
+from okoamaisha.ingest import MODEL_INPUT_COLUMNS, read_admissions
+from okoamaisha.router import MODES, ModelRouter, train_facility_models
+from okoamaisha.scoring import Scorer
+from okoamaisha.synthetic import synthetic_admissions
+
+
+def best_of(fn, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def _nan(value):
+    return np.nan if value is None else value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', help="Ingested admissions Parquet (default: synthetic)")
+    parser.add_argument('--rows', type=int, default=100_000, help="Synthetic rows when --data is omitted")
+    parser.add_argument('--mode', choices=MODES, default='specialist')
+    parser.add_argument('--holdout-eids', help="CSV or .npy of eids held out of the global model's training")
+    args = parser.parse_args()
+
+    if args.data:
+        admissions = read_admissions(args.data, columns=MODEL_INPUT_COLUMNS + ['lengthofstay'])
+    else:
+        admissions = synthetic_admissions(args.rows)
+    holdout_eids = read_eids(args.holdout_eids) if args.holdout_eids else load_holdout_eids()
+    if holdout_eids is None:
+        if args.data:
+            parser.error("the global bundle records no held-out eids; pass --holdout-eids")
+        eids = admissions['eid'].to_numpy()
+        holdout_eids = eids[np.random.default_rng(0).random(len(eids)) < 0.2]
+    scorer = Scorer.load()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        manifest = train_facility_models(admissions, out_dir, args.mode, holdout_eids=holdout_eids, scorer=scorer)
+        router = ModelRouter(scorer, out_dir)
+
+        inputs = from_admissions(admissions)
+        X = scorer.transform(scorer.features(inputs))
+        facility = inputs['facility'].to_numpy()
+        router.predict_scaled(X[:10], facility[:10])
+
+        global_pred, global_s = best_of(lambda: scorer.model.predict(X))
+        routed_pred, routed_s = best_of(lambda: router.predict_scaled(X, facility))
+
+        print(f"mode: {args.mode}, {len(X):,} rows")
+        print(f"{'facility':>8} {'trees':>6} {'KB':>7} {'held out':>9} {'holdout MAE':>12} {'global MAE':>11}")
+        for fac, entry in manifest['facilities'].items():
+            print(f"{fac:>8} {entry['n_trees']:>6} {entry['nbytes'] / 1e3:>7.0f} {entry['holdout_rows']:>9,} "
+                  f"{_nan(entry['holdout_mae']):>12.4f} {_nan(entry['global_holdout_mae']):>11.4f}")
+        print(f"latency, all rows: global {global_s * 1000:.0f} ms, router {routed_s * 1000:.0f} ms")
+        print(f"mean |router - global| = {np.abs(routed_pred - global_pred).mean():.4f} days")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Vectorized rules engine vs. per-patient rule calls
+
+Builds millions of synthetic patients and times `clinical.evaluate` (every
+code and the risk-factor bitmask in one pass) against calling the
+single-patient rules row by row, checking on a sample that both agree.
+
+Usage:
+    python benchmarks/bench_rules.py --rows 5000000 --loop-rows 20000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha import clinical
+
+
+def synthetic_patients(n, rng):
+    return pd.DataFrame({
+        'rcount': rng.integers(0, 6, n).astype(np.int8),
+        'total_comorbidities': rng.binomial(11, 0.1, n).astype(np.int8),
+        'glucose': rng.normal(140, 30, n).astype(np.float32),
+        'sodium': rng.normal(137, 3, n).astype(np.float32),
+        'creatinine': rng.normal(1.1, 0.3, n).astype(np.float32),
+        'bmi': rng.normal(29, 2, n).astype(np.float32),
+    })
+
+
+def per_patient(patients, predicted):
+    rows = []
+    for patient, los in zip(patients.to_dict('records'), predicted):
+        score = int(clinical.risk_score(patient['total_comorbidities'], patient['rcount']))
+        rows.append((score, str(clinical.risk_level(score)), str(clinical.stay_category(los)),
+                     str(clinical.protocol_for(los)),
+                     clinical.risk_factors(patient['rcount'], patient['total_comorbidities'], patient['glucose'],
+                                           patient['sodium'], patient['creatinine'], patient['bmi'])))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--loop-rows', type=int, default=20_000, help="Rows checked against the per-patient loop")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    patients = synthetic_patients(args.rows, rng)
+    predicted = rng.gamma(2.0, 2.0, args.rows)
+
+    started = time.perf_counter()
+    codes = clinical.evaluate(patients, predicted)
+    engine_s = time.perf_counter() - started
+
+    n = args.loop_rows
+    started = time.perf_counter()
+    expected = per_patient(patients.iloc[:n], predicted[:n])
+    loop_s = (time.perf_counter() - started) / n * args.rows
+
+    sample = codes.iloc[:n]
+    values = patients.iloc[:n].to_dict('records')
+    decoded = [(score, clinical.RISK_LEVELS[level], clinical.STAY_CATEGORIES[stay], clinical.PROTOCOL_KEYS[protocol],
+                clinical.risk_factor_messages(mask, patient))
+               for (score, level, stay, protocol, mask), patient in zip(sample.itertuples(index=False), values)]
+    assert decoded == expected, "rules engine disagrees with the per-patient rules"
+
+    print(f"{args.rows:,} patients, codes take {codes.memory_usage(index=False).sum() / 2 ** 20:.0f} MB")
+    print(f"\n{'path':>24} {'seconds':>8} {'rows/s':>14}")
+    print(f"{'rules engine':>24} {engine_s:8.3f} {args.rows / engine_s:14,.0f}")
+    print(f"{'per patient (est.)':>24} {loop_s:8.3f} {args.rows / loop_s:14,.0f}")
+    fired = {name: np.count_nonzero(codes['risk_factors'].to_numpy() & bit) / args.rows
+             for name, bit in clinical.RISK_FACTOR_BITS.items()}
+    print("risk factors: " + ", ".join(f"{name} {share:.1%}" for name, share in fired.items()))
+
+
+if __name__ == '__main__':
+    main()
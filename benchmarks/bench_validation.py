@@ -0,0 +1,77 @@
+"""
+Throughput of vectorized input validation vs. a per-row Python check
+
+A share of the synthetic rows is corrupted (out-of-range counts and months,
+missing labs, unknown facility) so both paths do real work.
+
+Usage:
+    python benchmarks/bench_validation.py --rows 1000000 --bad 0.05
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.synthetic import synthetic_inputs
+from okoamaisha.validation import INPUT_SCHEMA, error_summary, validate_batch
+
+
+def corrupt(inputs, share, seed=1):
+    rng = np.random.default_rng(seed)
+    inputs = inputs.copy()
+    for column, value in [('rcount', 9), ('sodium', np.nan), ('glucose', np.nan),
+                          ('admission_month', 13), ('facility', 'Z')]:
+        rows = rng.random(len(inputs)) < share / 5
+        inputs[column] = inputs[column].astype(object if column == 'facility' else np.float64)
+        inputs.loc[rows, column] = value
+    return inputs
+
+
+def check_row(row):
+    problems = []
+    for name, spec in INPUT_SCHEMA.items():
+        value = row.get(name, spec.get('default'))
+        if value is None or value != value:
+            if spec.get('required', True):
+                problems.append(name)
+        elif 'allowed' in spec:
+            if value not in spec['allowed']:
+                problems.append(name)
+        elif 'min' in spec and not spec['min'] <= value <= spec['max']:
+            problems.append(name)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--bad', type=float, default=0.05, help="Share of corrupted rows")
+    parser.add_argument('--loop-rows', type=int, default=20_000)
+    args = parser.parse_args()
+
+    inputs = corrupt(synthetic_inputs(args.rows), args.bad)
+
+    started = time.perf_counter()
+    _, codes = validate_batch(inputs)
+    elapsed = time.perf_counter() - started
+    print(f"vectorized: {args.rows:,} rows in {elapsed:.3f}s ({args.rows / elapsed:,.0f} rows/s), "
+          f"{np.count_nonzero(codes):,} rejected")
+
+    sample = inputs.iloc[:args.loop_rows]
+    started = time.perf_counter()
+    rejected = sum(bool(check_row(row)) for row in sample.to_dict('records'))
+    elapsed = time.perf_counter() - started
+    print(f"  per-row : {len(sample):,} rows in {elapsed:.3f}s ({len(sample) / elapsed:,.0f} rows/s), "
+          f"{rejected:,} rejected")
+
+    for field, counts in error_summary(codes).items():
+        print(f"  {field:>12}: {counts['missing']:,} missing, {counts['invalid']:,} invalid")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Incremental top-K worklist vs. re-sorting the census after every event
+
+A census of synthetic scored admissions is loaded, then a stream of
+re-scores and discharges is applied. The baseline keeps the census in a
+DataFrame and re-sorts it for the top K after each event.
+
+Usage:
+    python benchmarks/bench_worklist.py --census 100000 --events 2000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from okoamaisha.prediction_log import prediction_records
+from okoamaisha.synthetic import synthetic_inputs
+from okoamaisha.worklist import Worklist
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--census', type=int, default=100_000)
+    parser.add_argument('--events', type=int, default=2_000)
+    parser.add_argument('--top', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    inputs = synthetic_inputs(args.census)
+    rows = prediction_records(inputs, rng.gamma(2.0, 2.5, args.census), eids=np.arange(args.census))
+
+    worklist = Worklist()
+    started = time.perf_counter()
+    worklist.apply(rows)
+    print(f"load census : {args.census:,} patients in {time.perf_counter() - started:.2f}s")
+
+    # Each event re-scores a patient, or discharges one (actual LoS known)
+    events = rows.sample(args.events, random_state=1).copy()
+    events['predicted_los'] = rng.gamma(2.0, 2.5, args.events)
+    discharge = rng.random(args.events) < 0.3
+    events.loc[discharge, 'actual_los'] = 4.0
+    event_rows = [events.iloc[[i]] for i in range(args.events)]
+
+    started = time.perf_counter()
+    for event in event_rows:
+        worklist.apply(event)
+        worklist.top(args.top)
+    incremental = time.perf_counter() - started
+
+    census = rows.set_index('eid')
+    started = time.perf_counter()
+    for event in event_rows:
+        eid = event['eid'].iloc[0]
+        if event['actual_los'].notna().iloc[0]:
+            census = census.drop(index=eid, errors='ignore')
+        else:
+            census.loc[eid, 'predicted_los'] = event['predicted_los'].iloc[0]
+        census.sort_values('predicted_los', ascending=False).head(args.top)
+    resort = time.perf_counter() - started
+
+    print(f"incremental : {incremental / args.events * 1e3:.2f} ms/event (update + top {args.top})")
+    print(f"full re-sort: {resort / args.events * 1e3:.2f} ms/event")
+    print(f"census after events: {len(worklist):,} (re-sort baseline {len(census):,})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+OkoaMaisha scoring toolkit
+
+Non-UI building blocks shared by the Streamlit app, the command line tools
+and the benchmarks: artifact loading, feature engineering and batch scoring.
+"""
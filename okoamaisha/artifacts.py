@@ -0,0 +1,44 @@
+"""
+Model artifact loading
+"""
+
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Artifacts live next to app.py unless OKOA_MODEL_DIR points elsewhere
+MODEL_DIR = Path(os.environ.get('OKOA_MODEL_DIR', Path(__file__).resolve().parent.parent))
+
+# Historical and derived data (admissions, prediction logs, caches)
+DATA_DIR = Path(os.environ.get('OKOA_DATA_DIR', MODEL_DIR / 'data'))
+ADMISSIONS_PATH = DATA_DIR / 'admissions.parquet'
+
+# Encounter ids (eid) held out of training, saved with bundles that record their split
+HOLDOUT_FILE = 'holdout_eids.npy'
+
+
+def load_artifacts(model_dir=None):
+    """Return (model, scaler, feature_names, metadata) from a model directory."""
+    model_dir = Path(model_dir or MODEL_DIR)
+    model = joblib.load(model_dir / 'best_model.pkl')
+    scaler = joblib.load(model_dir / 'scaler.pkl')
+    feature_names = joblib.load(model_dir / 'feature_names.pkl')
+    metadata = joblib.load(model_dir / 'model_metadata.pkl')
+    return model, scaler, feature_names, metadata
+
+
+def load_holdout_eids(model_dir=None):
+    """eids of the bundle's held-out test rows, or None if it recorded no split."""
+    path = Path(model_dir or MODEL_DIR) / HOLDOUT_FILE
+    return np.load(path) if path.exists() else None
+
+
+def read_eids(path):
+    """eids from a .npy file, or from the eid column (else the first column) of a CSV."""
+    if str(path).endswith('.npy'):
+        return np.load(path)
+    frame = pd.read_csv(path)
+    return frame['eid' if 'eid' in frame else frame.columns[0]].to_numpy()
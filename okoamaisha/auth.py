@@ -0,0 +1,179 @@
+"""
+Clinician login, roles and signed session tokens
+
+Credentials are bcrypt hashes in a local JSON file (data/users.json). bcrypt
+is deliberately slow, so each login is verified exactly once, on a small
+shared thread pool: bcrypt releases the GIL, other Streamlit sessions keep
+running, and a burst of logins queues on the pool instead of taking every
+core. A successful login returns an HMAC-SHA256 signed token carrying the
+user, role and expiry; Streamlit reruns only check that signature, which
+takes microseconds.
+
+Usage:
+    python -m okoamaisha.auth add-user alice --role clinician
+    python -m okoamaisha.auth list
+"""
+
+import argparse
+import base64
+import functools
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from okoamaisha.artifacts import DATA_DIR
+
+USERS_PATH = DATA_DIR / 'users.json'
+SECRET_KEY_PATH = DATA_DIR / 'session.key'
+
+# Each role also has the access of the roles before it
+ROLES = ('clinician', 'planner', 'admin')
+
+BCRYPT_ROUNDS = 12
+# bcrypt only reads this many bytes of a password; bcrypt >= 5 raises ValueError beyond it
+MAX_PASSWORD_BYTES = 72
+TOKEN_TTL_SECONDS = 8 * 3600
+
+# Bounded so a login burst cannot take every core away from scoring
+_verify_pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2),
+                                  thread_name_prefix='bcrypt')
+
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    encoded = password.encode('utf-8')
+    if len(encoded) > MAX_PASSWORD_BYTES:
+        raise ValueError(f"password is {len(encoded)} bytes in UTF-8; bcrypt allows at most {MAX_PASSWORD_BYTES}")
+    return bcrypt.hashpw(encoded, bcrypt.gensalt(rounds)).decode('ascii')
+
+
+def has_role(role, required):
+    return ROLES.index(role) >= ROLES.index(required)
+
+
+class UserStore:
+    def __init__(self, path=USERS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def users(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def add_user(self, username, password, role='clinician', name=None, rounds=BCRYPT_ROUNDS):
+        if role not in ROLES:
+            raise ValueError(f"role must be one of {ROLES}")
+        with self._lock:
+            users = self.users()
+            users[username] = {'hash': hash_password(password, rounds), 'role': role, 'name': name or username}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(users, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def verify(self, username, password):
+        """The user's record if `password` matches, else None. Slow: runs bcrypt."""
+        user = self.users().get(username)
+        # Unknown users are checked against a dummy hash so they take as long as a wrong password
+        stored = user['hash'].encode('ascii') if user else _dummy_hash()
+        try:
+            ok = bcrypt.checkpw(password.encode('utf-8'), stored)
+        except ValueError:
+            # Longer than MAX_PASSWORD_BYTES, so it cannot match any stored hash
+            return None
+        return {'username': username, 'role': user['role'], 'name': user['name']} if ok and user else None
+
+
+def login(store, username, password, timeout=30):
+    """Verify on the shared bcrypt pool and return a session token, or None."""
+    user = _verify_pool.submit(store.verify, username, password).result(timeout)
+    return issue_token(user) if user else None
+
+
+@functools.lru_cache(maxsize=1)
+def _dummy_hash():
+    return bcrypt.hashpw(b'unused', bcrypt.gensalt(BCRYPT_ROUNDS))
+
+
+@functools.lru_cache(maxsize=1)
+def _signing_key():
+    key = os.environ.get('OKOA_SECRET_KEY')
+    if key:
+        return key.encode('utf-8')
+    if not os.path.exists(SECRET_KEY_PATH):
+        os.makedirs(os.path.dirname(SECRET_KEY_PATH), exist_ok=True)
+        fd = os.open(SECRET_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+    with open(SECRET_KEY_PATH) as f:
+        return f.read().strip().encode('utf-8')
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def issue_token(user, ttl=TOKEN_TTL_SECONDS):
+    claims = {'sub': user['username'], 'role': user['role'], 'name': user['name'], 'exp': int(time.time() + ttl)}
+    payload = _b64(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    signature = _b64(hmac.new(_signing_key(), payload.encode('ascii'), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+
+def verify_token(token):
+    """Claims of a valid, unexpired token, else None. Fast: one HMAC."""
+    if not token or '.' not in token:
+        return None
+    payload, _, signature = token.partition('.')
+    try:
+        expected = _b64(hmac.new(_signing_key(), payload.encode('ascii'), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature.encode('ascii'), expected.encode('ascii')):
+            return None
+        claims = json.loads(_unb64(payload))
+    except ValueError:
+        # Includes non-ASCII tokens and undecodable payloads
+        return None
+    return claims if claims['exp'] > time.time() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage app users.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    add = sub.add_parser('add-user', help="Add a user or reset their password")
+    add.add_argument('username')
+    add.add_argument('--role', choices=ROLES, default='clinician')
+    add.add_argument('--name', default=None)
+    sub.add_parser('list', help="List users and roles")
+    args = parser.parse_args(argv)
+
+    store = UserStore()
+    if args.command == 'add-user':
+        password = getpass.getpass(f"Password for {args.username}: ")
+        if password != getpass.getpass("Repeat password: "):
+            parser.error("passwords do not match")
+        try:
+            store.add_user(args.username, password, args.role, args.name)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Saved {args.username} ({args.role}) -> {store.path}")
+    else:
+        for username, user in store.users().items():
+            print(f"{username:<20} {user['role']:<10} {user['name']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Multi-core batch scoring
+
+The compact engineered feature matrix (see features.FEATURE_DTYPES) is packed
+once into a shared memory block and worker processes score row ranges of it in
+place, so chunks are never pickled.
+Each worker loads the model a single time in its initializer and writes its
+predictions into a shared output array at the rows it was given, which keeps
+the output in input order regardless of which worker finishes first.
+
+Usage:
+    python -m okoamaisha.batch_score admissions.csv -o predictions.csv --workers 4
+    python -m okoamaisha.batch_score data/admissions.parquet -o predictions.csv
+    python -m okoamaisha.batch_score census.csv --history   # rcount from the history store
+    python -m okoamaisha.batch_score census.csv --rules     # plus clinical rule codes
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha import clinical
+from okoamaisha.artifacts import MODEL_DIR
+from okoamaisha.features import from_admissions, is_admissions_schema
+from okoamaisha.history import HistoryStore
+from okoamaisha.ingest import MODEL_INPUT_COLUMNS, read_admissions
+from okoamaisha.prediction_log import PredictionLog, prediction_records
+from okoamaisha.scoring import Scorer
+from okoamaisha.validation import error_summary, validate_batch
+
+# Rows per task; small enough to balance load, large enough to amortize dispatch
+DEFAULT_CHUNK_ROWS = 8192
+
+
+class SharedFrame:
+    """Column-wise copy of a DataFrame in one shared memory block.
+
+    Each column is stored contiguously with its own dtype, so workers can
+    rebuild zero-copy views from the small picklable `spec`.
+    """
+
+    def __init__(self, frame):
+        layout = []
+        offset = 0
+        for name in frame.columns:
+            dtype = frame[name].to_numpy().dtype
+            offset = -(-offset // dtype.alignment) * dtype.alignment
+            layout.append((name, dtype.str, offset))
+            offset += dtype.itemsize * len(frame)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.spec = (self.shm.name, len(frame), layout)
+        for name, column in zip(frame.columns, _column_views(self.shm.buf, len(frame), layout)):
+            column[:] = frame[name].to_numpy()
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _column_views(buf, n_rows, layout):
+    return [np.ndarray(n_rows, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+            for _, dtype, offset in layout]
+
+
+# Worker state, populated once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(model_dir):
+    _worker['scorer'] = Scorer.load(model_dir)
+
+
+def _ping(_):
+    return os.getpid()
+
+
+def _score_range(frame_spec, out_name, start, stop):
+    name, n_rows, layout = frame_spec
+    shm = shared_memory.SharedMemory(name=name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        views = _column_views(shm.buf, n_rows, layout)
+        chunk = pd.DataFrame({col: view[start:stop] for (col, _, _), view in zip(layout, views)})
+        out = np.ndarray(n_rows, dtype=np.float64, buffer=out_shm.buf)
+        out[start:stop] = _worker['scorer'].predict_features(chunk)
+        del views, out, chunk
+    finally:
+        shm.close()
+        out_shm.close()
+    return stop - start
+
+
+class ParallelScorer:
+    """Process pool that scores engineered feature matrices in shared memory."""
+
+    def __init__(self, workers=None, model_dir=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.model_dir = str(model_dir or MODEL_DIR)
+        self.chunk_rows = chunk_rows
+        self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                         initializer=_init_worker,
+                                         initargs=(self.model_dir,))
+
+    def warm_up(self):
+        """Start every worker and load its model before timing anything."""
+        list(self._pool.map(_ping, range(self.workers * 4)))
+
+    def score(self, features):
+        n = len(features)
+        if n == 0:
+            return np.empty(0, dtype=np.float64)
+
+        # At least one chunk per worker, otherwise fixed-size chunks
+        chunk = min(self.chunk_rows, -(-n // self.workers))
+        out_shm = shared_memory.SharedMemory(create=True, size=n * 8)
+        try:
+            with SharedFrame(features) as shared:
+                futures = [self._pool.submit(_score_range, shared.spec, out_shm.name,
+                                             start, min(start + chunk, n))
+                           for start in range(0, n, chunk)]
+                for future in futures:
+                    future.result()
+            return np.ndarray(n, dtype=np.float64, buffer=out_shm.buf).copy()
+        finally:
+            out_shm.close()
+            out_shm.unlink()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_inputs(path):
+    """Load a file of patients as model inputs, accepting either input schema.
+
+    Parquet files written by `okoamaisha.ingest` are read with column
+    projection, so only the columns the model needs are decoded.
+    """
+    if str(path).endswith('.parquet'):
+        frame = read_admissions(path, columns=MODEL_INPUT_COLUMNS + ['lengthofstay'])
+        return frame, from_admissions(frame)
+    frame = pd.read_csv(path)
+    if is_admissions_schema(frame):
+        return frame, from_admissions(frame)
+    return frame, frame
+
+
+def score_file(path, output, workers=None, model_dir=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+               log_predictions=False, history=None, rules=False):
+    """Score `path` into `output`; returns (rows, error codes, scoring seconds).
+
+    Rows failing validation are not scored: their predicted_los is empty and
+    error_code (see okoamaisha.validation) is non-zero. With a `history`
+    store (okoamaisha.history), rcount is counted from admission history by
+    eid and vdate instead of taken from the file. With `rules`, the output
+    also holds the okoamaisha.clinical codes of each scored row.
+    """
+    raw, inputs = read_inputs(path)
+    if history is not None:
+        if not {'eid', 'vdate'} <= set(raw):
+            raise ValueError("counting rcount from history needs eid and vdate columns")
+        inputs = inputs.assign(rcount=history.rcount(raw['eid'].to_numpy(), raw['vdate'].to_numpy()))
+    cleaned, codes = validate_batch(inputs)
+    valid = codes == 0
+    features = Scorer.load(model_dir).features(cleaned[valid])
+
+    with ParallelScorer(workers, model_dir, chunk_rows) as scorer:
+        started = time.perf_counter()
+        predictions = np.full(len(inputs), np.nan)
+        predictions[valid] = scorer.score(features)
+        elapsed = time.perf_counter() - started
+
+    result = pd.DataFrame({'predicted_los': predictions, 'error_code': codes})
+    if 'eid' in raw:
+        result.insert(0, 'eid', raw['eid'].to_numpy())
+    if rules:
+        # Nullable, so rejected rows stay empty like their predicted_los
+        codes_frame = clinical.evaluate(cleaned[valid], predictions[valid]).astype('Int16')
+        result = result.join(codes_frame.set_axis(np.flatnonzero(valid)))
+    result.to_csv(output, index=False)
+
+    if log_predictions:
+        actuals = raw['lengthofstay'].to_numpy()[valid] if 'lengthofstay' in raw else None
+        eids = raw['eid'].to_numpy()[valid] if 'eid' in raw else None
+        PredictionLog().append(prediction_records(cleaned[valid], predictions[valid], eids, actuals))
+    return len(result), codes, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a file of admissions in parallel.")
+    parser.add_argument('input', help="CSV in the dataset schema or the app's input schema, or ingested Parquet")
+    parser.add_argument('-o', '--output', default='predictions.csv')
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Default: all cores")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--model-dir', default=None)
+    parser.add_argument('--log-predictions', action='store_true',
+                        help="Append predictions (and lengthofstay, if present) to the prediction log")
+    parser.add_argument('--history', action='store_true',
+                        help="Count rcount from the admission history store instead of the file")
+    parser.add_argument('--rules', action='store_true',
+                        help="Add risk score, risk level, stay category, protocol and risk-factor mask codes")
+    args = parser.parse_args(argv)
+
+    history = None
+    if args.history:
+        history = HistoryStore.load()
+        if history is None:
+            parser.error("no admission history store; run `python -m okoamaisha.history build` first")
+    n, codes, elapsed = score_file(args.input, args.output, args.workers, args.model_dir, args.chunk_rows,
+                                   args.log_predictions, history, args.rules)
+    scored = n - int(np.count_nonzero(codes))
+    print(f"Scored {scored:,} of {n:,} rows in {elapsed:.2f}s ({scored / max(elapsed, 1e-9):,.0f} rows/s) "
+          f"-> {args.output}")
+    for field, counts in error_summary(codes).items():
+        print(f"  rejected on {field}: {counts['missing']:,} missing, {counts['invalid']:,} out of range")
+
+
+if __name__ == '__main__':
+    main()
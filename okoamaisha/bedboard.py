@@ -0,0 +1,270 @@
+"""
+Live bed-board push channel
+
+Wall-mounted bed boards subscribe to `GET /beds/stream` on the scoring
+service (okoamaisha.server) and receive server-sent events, so they do not
+have to poll and re-render the census. A board gets one `snapshot` when it
+connects. After that it only gets `delta` events, which carry just the
+patients whose displayed prediction or category changed:
+
+    id: 42
+    event: delta
+    data: {"v":42,"t":1792396543.91,"u":[[1017,"C",5.3,"M"]],"d":[988]}
+
+Each `u` row is [eid, facility, predicted LoS to one decimal, stay category
+S/M/L]. `d` lists discharged eids.
+
+Scores published within one COALESCE_MS window are merged per patient. A
+burst of re-scores of one patient therefore sends a single row, and a
+re-score that leaves the displayed values unchanged sends nothing. Each
+delta is serialized once per facility filter (`?facility=C`), and every
+board with that filter is queued the same bytes, so hundreds of displays
+cost one encode and one queue put each. If a stalled display fills its
+queue, its backlog is dropped and it is sent a fresh snapshot once it
+catches up, rather than the server buffering without bound. A board that
+reconnects with `Last-Event-ID` is replayed the deltas it missed from the
+last HISTORY_DELTAS. Only when it is further behind than that does it get a
+snapshot.
+
+`GET /beds/board` serves a minimal self-contained board page that applies
+the deltas in the browser.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from okoamaisha.clinical import stay_category
+
+# Window in which updates to the same patient are merged into one delta
+COALESCE_MS = 250
+
+# Events buffered per board before it is resynced, and deltas kept for reconnects
+QUEUE_EVENTS = 256
+HISTORY_DELTAS = 1024
+
+# Comment lines keep idle connections open through proxies and detect gone boards
+KEEPALIVE_SECONDS = 15
+
+CATEGORY_CODES = {'Short': 'S', 'Medium': 'M', 'Long': 'L'}
+
+STREAM_HEAD = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+               b"X-Accel-Buffering: no\r\n\r\n")
+
+# Sentinel queued for a board whose backlog was dropped
+RESYNC = None
+
+
+def _event(name, version, payload):
+    data = json.dumps(payload, separators=(',', ':'))
+    return f"id: {version}\nevent: {name}\ndata: {data}\n\n".encode()
+
+
+class Board:
+    def __init__(self, facility, queue_events):
+        self.facility = facility
+        self.queue = asyncio.Queue(queue_events)
+
+
+class BedBoard:
+    def __init__(self, coalesce_ms=COALESCE_MS, queue_events=QUEUE_EVENTS, history_deltas=HISTORY_DELTAS):
+        self.coalesce = coalesce_ms / 1000
+        self.queue_events = queue_events
+        self.beds = {}
+        self.version = 0
+        self.history = deque(maxlen=history_deltas)
+        self.boards = set()
+        self.stats = Counter()
+        self._pending = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def publish(self, records):
+        """Queue prediction log rows (LOG_COLUMNS) for the next delta; safe from any thread."""
+        records = records[records['eid'] >= 0]
+        if len(records) == 0:
+            return
+        predicted = records['predicted_los'].to_numpy(dtype=np.float64)
+        categories = [CATEGORY_CODES[c] for c in stay_category(predicted)]
+        discharged = records['actual_los'].notna().to_numpy()
+        rows = zip(records['eid'].to_numpy().tolist(), records['facility'].astype(str).tolist(),
+                   np.round(predicted, 1).tolist(), categories, discharged)
+        with self._lock:
+            for eid, facility, los, category, done in rows:
+                self._pending[eid] = None if done else (facility, los, category)
+            self.stats['published'] += len(records)
+
+    def discharge(self, eids):
+        with self._lock:
+            for eid in eids:
+                self._pending[int(eid)] = None
+
+    def _take_changes(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        upserts, removes = [], []
+        for eid, bed in pending.items():
+            old = self.beds.get(eid)
+            if bed == old:
+                continue
+            if old is not None and (bed is None or bed[0] != old[0]):
+                # Discharged, or moved off the boards filtered on its old facility
+                removes.append((eid, old[0]))
+            if bed is None:
+                del self.beds[eid]
+            else:
+                self.beds[eid] = bed
+                upserts.append((eid, bed))
+        return upserts, removes
+
+    @staticmethod
+    def _delta(version, t, upserts, removes, facility):
+        return {'v': version, 't': t,
+                'u': [[eid, *bed] for eid, bed in upserts if facility is None or bed[0] == facility],
+                'd': [eid for eid, old_facility in removes
+                      if facility is None or old_facility == facility]}
+
+    def snapshot(self, facility=None):
+        """Current beds as a payload ({"v", "t", "beds": [[eid, facility, los, category], ...]})."""
+        return {'v': self.version, 't': round(time.time(), 3),
+                'beds': [[eid, *bed] for eid, bed in self.beds.items() if facility is None or bed[0] == facility]}
+
+    def _snapshot_event(self, facility):
+        # Boards connecting together share one encoded snapshot per version
+        cached = self._snapshots.get(facility)
+        if cached is None or cached[0] != self.version:
+            cached = self.version, _event('snapshot', self.version, self.snapshot(facility))
+            self._snapshots[facility] = cached
+            self.stats['snapshots_encoded'] += 1
+        return cached[1]
+
+    def flush(self):
+        """Send one delta with the changes since the last flush; returns the boards it went to."""
+        upserts, removes = self._take_changes()
+        if not upserts and not removes:
+            return 0
+        self.version += 1
+        t = round(time.time(), 3)
+        self.history.append((self.version, t, upserts, removes))
+        encoded, sent = {}, 0
+        for board in list(self.boards):
+            if board.facility not in encoded:
+                delta = self._delta(self.version, t, upserts, removes, board.facility)
+                encoded[board.facility] = _event('delta', self.version, delta) if delta['u'] or delta['d'] else None
+            message = encoded[board.facility]
+            if message is None:
+                continue
+            try:
+                board.queue.put_nowait((self.version, message))
+            except asyncio.QueueFull:
+                while not board.queue.empty():
+                    board.queue.get_nowait()
+                board.queue.put_nowait(RESYNC)
+                self.stats['resyncs'] += 1
+                continue
+            self.stats['bytes_sent'] += len(message)
+            sent += 1
+        self.stats['deltas'] += 1
+        self.stats['delta_rows'] += len(upserts) + len(removes)
+        self.stats['delta_events'] += sent
+        return sent
+
+    def subscribe(self, facility=None, last_event_id=None):
+        """Register a board; returns it with the events that bring it up to date."""
+        board = Board(facility, self.queue_events)
+        self.boards.add(board)
+        if last_event_id is not None and self.history and self.history[0][0] <= last_event_id + 1 \
+                and last_event_id <= self.version:
+            catch_up = []
+            for version, t, upserts, removes in self.history:
+                if version > last_event_id:
+                    delta = self._delta(version, t, upserts, removes, facility)
+                    if delta['u'] or delta['d']:
+                        catch_up.append(_event('delta', version, delta))
+            self.stats['replays'] += 1
+            return board, catch_up
+        return board, [self._snapshot_event(facility)]
+
+    def unsubscribe(self, board):
+        self.boards.discard(board)
+
+    async def stream(self, writer, facility=None, last_event_id=None):
+        """Serve one board connection until it goes away."""
+        board, initial = self.subscribe(facility, last_event_id)
+        current = self.version
+        try:
+            writer.write(STREAM_HEAD + b''.join(initial))
+            await writer.drain()
+            while True:
+                try:
+                    item = await asyncio.wait_for(board.queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+                    continue
+                if item is RESYNC:
+                    current, message = self.version, self._snapshot_event(facility)
+                else:
+                    version, message = item
+                    if version <= current:
+                        # Already covered by the snapshot that replaced this board's backlog
+                        continue
+                    current = version
+                writer.write(message)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.unsubscribe(board)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.coalesce)
+            self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def metrics(self):
+        return {'boards': len(self.boards), 'beds': len(self.beds), 'version': self.version,
+                'coalesce_ms': self.coalesce * 1000, **self.stats}
+
+
+BOARD_HTML = b"""<!doctype html>
+<html><head><meta charset="utf-8"><title>OkoaMaisha bed board</title>
+<style>
+body { font-family: sans-serif; margin: 1rem; background: #f8fafc; }
+table { border-collapse: collapse; width: 100%; font-size: 1.4rem; }
+td, th { padding: 0.4rem 0.8rem; border-bottom: 1px solid #e2e8f0; text-align: left; }
+.S { color: #10b981; } .M { color: #f59e0b; } .L { color: #ef4444; font-weight: bold; }
+</style></head>
+<body><h1>Bed board <small id="status"></small></h1>
+<table><thead><tr><th>EID</th><th>Facility</th><th>Predicted LoS</th><th>Category</th></tr></thead>
+<tbody id="beds"></tbody></table>
+<script>
+const names = {S: 'Short', M: 'Medium', L: 'Long'};
+const rows = new Map();
+const body = document.getElementById('beds');
+function upsert([eid, facility, los, cat]) {
+  let tr = rows.get(eid);
+  if (!tr) { tr = body.insertRow(); rows.set(eid, tr); for (let i = 0; i < 4; i++) tr.insertCell(); }
+  tr.cells[0].textContent = eid; tr.cells[1].textContent = facility;
+  tr.cells[2].textContent = los.toFixed(1) + ' days';
+  tr.cells[3].textContent = names[cat]; tr.className = cat;
+}
+function remove(eid) { const tr = rows.get(eid); if (tr) { tr.remove(); rows.delete(eid); } }
+const source = new EventSource('/beds/stream' + location.search);
+source.addEventListener('snapshot', e => {
+  rows.forEach(tr => tr.remove()); rows.clear(); JSON.parse(e.data).beds.forEach(upsert);
+});
+source.addEventListener('delta', e => { const d = JSON.parse(e.data); d.u.forEach(upsert); d.d.forEach(remove); });
+source.onopen = () => document.getElementById('status').textContent = 'live';
+source.onerror = () => document.getElementById('status').textContent = 'reconnecting';
+</script></body></html>
+"""
@@ -0,0 +1,177 @@
+"""
+Clinical heuristics shown next to the model prediction
+
+The Home page's risk score, stay categories, care protocols and risk-factor
+messages. Every rule is declared once in the tables below: ordered labels
+with the cutoffs between them, the risk-score points, and RISK_FACTOR_RULES.
+`evaluate` applies all of them to a whole batch with one NumPy comparison
+per cutoff or rule and returns compact codes: an index into each label list
+and a risk-factor bitmask (bit i set when rule i fires). A few million rows
+take well under a second. The single-patient view, reports, worklists and
+batch scoring render from the same tables, so they cannot drift apart.
+"""
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.features import COMORBIDITY_COLS
+
+# Ordered labels and the cutoffs between them: a value gets the label at the
+# number of cutoffs it is strictly above (NaN is above none)
+RISK_LEVELS = ['Low', 'Medium', 'High']
+RISK_LEVEL_CUTOFFS = (20, 40)
+STAY_CATEGORIES = ['Short', 'Medium', 'Long']
+STAY_CUTOFFS = (3, 7)
+PROTOCOL_KEYS = ['fast_track', 'standard', 'high_intensity']
+PROTOCOL_CUTOFFS = (4, 7)
+
+# Risk-score points per comorbidity and per readmission in the past 180 days
+RISK_POINTS = {'total_comorbidities': 10, 'rcount': 15}
+
+# Risk factors, most serious first: (name, field, comparison, threshold, message).
+# Messages are formatted with the patient's field values.
+RISK_FACTOR_RULES = [
+    ('readmissions', 'rcount', '>=', 2,
+     "🔴 High readmission count ({rcount}) - Strong predictor of extended stay"),
+    ('comorbidities', 'total_comorbidities', '>=', 3,
+     "🔴 Multiple comorbidities ({total_comorbidities}) - Complex care needs"),
+    ('glucose', 'glucose', '>', 140, "🟡 Elevated glucose ({glucose:.0f} mg/dL) - Diabetes management protocol"),
+    ('sodium', 'sodium', '<', 135, "🟡 Hyponatremia ({sodium:.0f} mEq/L) - Monitor electrolytes closely"),
+    ('creatinine', 'creatinine', '>', 1.3,
+     "🟡 Elevated creatinine ({creatinine:.1f} mg/dL) - Renal function monitoring"),
+    ('low_bmi', 'bmi', '<', 18.5, "🟡 Low BMI ({bmi:.1f}) - Nutritional support recommended"),
+    ('high_bmi', 'bmi', '>', 30, "🟡 Elevated BMI ({bmi:.1f}) - Consider mobility support"),
+]
+RISK_FACTOR_BITS = {name: 1 << bit for bit, (name, *_) in enumerate(RISK_FACTOR_RULES)}
+RISK_FACTOR_DTYPE = np.min_scalar_type((1 << len(RISK_FACTOR_RULES)) - 1)
+COMPARISONS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal}
+
+# Fields `evaluate` reads, besides the predicted LoS
+RULE_FIELDS = ['rcount', 'total_comorbidities', 'glucose', 'sodium', 'creatinine', 'bmi']
+
+# Every predicted-LoS cutoff a stay category or protocol depends on
+LOS_CUTOFFS = tuple(sorted(set(STAY_CUTOFFS) | set(PROTOCOL_CUTOFFS)))
+
+
+def category_codes(values, cutoffs):
+    """Index into the label list of `cutoffs` for each value, as uint8."""
+    values = np.asarray(values)
+    codes = np.zeros(values.shape, dtype=np.uint8)
+    for cutoff in cutoffs:
+        codes += values > cutoff
+    return codes
+
+
+def risk_score(total_comorbidities, rcount):
+    """10 points per comorbidity plus 15 per readmission in the past 180 days."""
+    # int16 points widen compact int8 counts before they can overflow
+    return (np.asarray(total_comorbidities) * np.int16(RISK_POINTS['total_comorbidities'])
+            + np.asarray(rcount) * np.int16(RISK_POINTS['rcount']))
+
+
+def risk_level(score):
+    """High above 40, Medium above 20, otherwise Low."""
+    return np.asarray(RISK_LEVELS)[category_codes(score, RISK_LEVEL_CUTOFFS)]
+
+
+def stay_category(predicted_los):
+    """Short up to 3 days, Medium up to 7, Long beyond."""
+    return np.asarray(STAY_CATEGORIES)[category_codes(predicted_los, STAY_CUTOFFS)]
+
+
+# Resource planning protocol per predicted stay; 'style' is the Streamlit alert used
+PROTOCOLS = {
+    'high_intensity': {'style': 'error', 'title': "🔴 High-Intensity Care Protocol", 'sections': [
+        ("✅ Immediate Actions", ["Reserve extended-care bed immediately",
+                                 "Assign case manager within 24 hours",
+                                 "Order 10+ day medication supply",
+                                 "Initiate discharge planning on day 1"]),
+        ("✅ Coordination", ["Schedule multi-specialty care coordination",
+                            "Alert social services for post-discharge support",
+                            "Arrange family meeting within 48 hours"]),
+    ]},
+    'standard': {'style': 'warning', 'title': "🟡 Standard Care Protocol", 'sections': [
+        ("✅ Standard Actions", ["Standard acute care bed assignment",
+                                "Regular nursing staff ratios",
+                                "7-day medication supply",
+                                "Routine monitoring and assessments"]),
+        ("✅ Planning", ["Discharge planning by day 3",
+                        "Regular team rounds"]),
+    ]},
+    'fast_track': {'style': 'success', 'title': "🟢 Short-Stay Fast-Track Protocol", 'sections': [
+        ("✅ Optimized Actions", ["Short-stay unit eligible",
+                                 "Standard staffing sufficient",
+                                 "Early discharge planning opportunity",
+                                 "Minimal supply requirements"]),
+        ("✅ Efficiency", ["Consider same-day discharge protocols",
+                          "Streamlined documentation"]),
+    ]},
+}
+
+
+def protocol_for(predicted_los):
+    """PROTOCOLS key: high-intensity beyond 7 days, standard beyond 4, else fast-track."""
+    return np.asarray(PROTOCOL_KEYS)[category_codes(predicted_los, PROTOCOL_CUTOFFS)]
+
+
+def protocol_markdown(key):
+    protocol = PROTOCOLS[key]
+    lines = [f"**{protocol['title']}**", ""]
+    for heading, actions in protocol['sections']:
+        lines += [f"**{heading}:**"] + [f"- {action}" for action in actions] + [""]
+    return "\n".join(lines).rstrip()
+
+
+def risk_factor_mask(values):
+    """Bitmask of RISK_FACTOR_RULES per patient; `values` maps each rule field to a scalar or array."""
+    mask = np.zeros(np.shape(values[RISK_FACTOR_RULES[0][1]]), dtype=RISK_FACTOR_DTYPE)
+    for bit, (_, field, comparison, threshold, _) in enumerate(RISK_FACTOR_RULES):
+        fired = COMPARISONS[comparison](np.asarray(values[field]), threshold)
+        mask |= fired.astype(RISK_FACTOR_DTYPE) << RISK_FACTOR_DTYPE.type(bit)
+    return mask
+
+
+def risk_factor_messages(mask, values):
+    """Messages for the rules set in one patient's `mask`, most serious first."""
+    mask = int(mask)
+    return [message.format(**values) for bit, (*_, message) in enumerate(RISK_FACTOR_RULES) if mask >> bit & 1]
+
+
+def risk_factors(rcount, comorbidities, glucose, sodium, creatinine, bmi):
+    """Risk-factor messages for one patient, most serious first."""
+    values = {'rcount': rcount, 'total_comorbidities': comorbidities, 'glucose': glucose, 'sodium': sodium,
+              'creatinine': creatinine, 'bmi': bmi}
+    return risk_factor_messages(risk_factor_mask(values), values)
+
+
+def evaluate(patients, predicted_los):
+    """All rule codes for a batch, one row per patient.
+
+    `patients` is a DataFrame or a mapping of equal-length arrays (or of
+    scalars, for one patient) holding RULE_FIELDS; total_comorbidities is
+    counted from the COMORBIDITY_COLS flags when absent. Returns risk_score
+    (int16), risk_level, stay_category and protocol as indices into
+    RISK_LEVELS, STAY_CATEGORIES and PROTOCOL_KEYS (uint8), and the
+    risk_factors bitmask.
+    """
+    if 'total_comorbidities' in patients:
+        comorbidities = patients['total_comorbidities']
+    else:
+        comorbidities = sum(np.asarray(patients[c], dtype=np.int16) for c in COMORBIDITY_COLS)
+    values = {field: np.atleast_1d(np.asarray(patients[field])) for field in RULE_FIELDS
+              if field != 'total_comorbidities'}
+    values['total_comorbidities'] = np.atleast_1d(np.asarray(comorbidities))
+    los = np.atleast_1d(np.asarray(predicted_los, dtype=np.float64))
+    score = risk_score(values['total_comorbidities'], values['rcount']).astype(np.int16)
+    return pd.DataFrame({
+        'risk_score': score,
+        'risk_level': category_codes(score, RISK_LEVEL_CUTOFFS),
+        'stay_category': category_codes(los, STAY_CUTOFFS),
+        'protocol': category_codes(los, PROTOCOL_CUTOFFS),
+        'risk_factors': risk_factor_mask(values),
+    })
+
+
+# Reference bars of the "Length of Stay Comparison" chart
+CATEGORY_AVERAGES = [('Average Short Stay', 2.5, '#10b981'), ('Average Medium Stay', 5.5, '#f59e0b'),
+                     ('Average Long Stay', 10.0, '#ef4444')]
@@ -0,0 +1,177 @@
+"""
+Precomputed cohort aggregates over logged predictions
+
+Predicted and actual LoS are summed into a dense cube indexed by facility,
+admission month, day of week, comorbidity count and readmission count
+(5 x 12 x 7 x 6 x 6 = 15,120 cells). Every filter/group-by the analytics page
+offers is a slice and a sum over that cube, so answering a query never
+touches the raw rows. New log rows are folded in incrementally with one
+`np.bincount` per measure, and the cube is cached on disk together with the
+log offset it has consumed.
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.artifacts import DATA_DIR
+from okoamaisha.features import FACILITIES
+from okoamaisha.prediction_log import PredictionLog
+
+COHORT_CUBE_PATH = DATA_DIR / 'cohort_cube.npz'
+
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# (log column, level labels); counts above the last level are folded into it
+DIMENSIONS = [
+    ('facility', FACILITIES),
+    ('admission_month', list(range(1, 13))),
+    ('admission_dayofweek', DAY_NAMES),
+    ('total_comorbidities', ['0', '1', '2', '3', '4', '5+']),
+    ('rcount', ['0', '1', '2', '3', '4', '5+']),
+]
+DIMENSION_NAMES = [name for name, _ in DIMENSIONS]
+SHAPE = tuple(len(levels) for _, levels in DIMENSIONS)
+
+MEASURES = ['n', 'pred_sum', 'pred_sq', 'n_actual', 'actual_sum', 'actual_sq', 'abs_err']
+
+
+def cell_index(rows):
+    """Flat cube index for each log row."""
+    facility = pd.Categorical(rows['facility'].astype(str), categories=FACILITIES).codes
+    month = rows['admission_month'].to_numpy(dtype=np.int64) - 1
+    day = rows['admission_dayofweek'].to_numpy(dtype=np.int64)
+    comorbidities = np.minimum(rows['total_comorbidities'].to_numpy(dtype=np.int64), SHAPE[3] - 1)
+    rcount = np.minimum(rows['rcount'].to_numpy(dtype=np.int64), SHAPE[4] - 1)
+    coords = (facility, month, day, comorbidities, rcount)
+    valid = np.ones(len(rows), dtype=bool)
+    for axis, coord in enumerate(coords):
+        valid &= (coord >= 0) & (coord < SHAPE[axis])
+    flat = np.ravel_multi_index(tuple(np.where(valid, c, 0) for c in coords), SHAPE)
+    return flat, valid
+
+
+class CohortCube:
+    def __init__(self, sums=None, offset=0):
+        self.sums = sums if sums is not None else np.zeros((len(MEASURES),) + SHAPE)
+        self.offset = offset
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=COHORT_CUBE_PATH):
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            if tuple(data['sums'].shape[1:]) != SHAPE:
+                return cls()
+            return cls(data['sums'], int(data['offset']))
+
+    def save(self, path=COHORT_CUBE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(tmp, sums=self.sums, offset=self.offset)
+        os.replace(tmp, path)
+
+    def add(self, rows):
+        """Fold log rows (LOG_COLUMNS) into the cube."""
+        if len(rows) == 0:
+            return
+        flat, valid = cell_index(rows)
+        flat = flat[valid]
+        pred = rows['predicted_los'].to_numpy(dtype=np.float64)[valid]
+        actual = rows['actual_los'].to_numpy(dtype=np.float64)[valid]
+        has_actual = ~np.isnan(actual)
+        actual_0 = np.where(has_actual, actual, 0.0)
+
+        size = self.sums[0].size
+        weights = [None, pred, pred ** 2, has_actual.astype(np.float64), actual_0, actual_0 ** 2,
+                   np.where(has_actual, np.abs(pred - actual_0), 0.0)]
+        for i, w in enumerate(weights):
+            self.sums[i] += np.bincount(flat, weights=w, minlength=size).reshape(SHAPE)
+
+    def refresh(self, log):
+        """Consume rows appended to `log` since the last refresh; returns the count."""
+        with self._lock:
+            size = log.size()
+            if size < self.offset:
+                # The log was rotated or replaced; rebuild from scratch
+                self.sums[:] = 0
+                self.offset = 0
+            if size <= self.offset:
+                return 0
+            rows, self.offset = log.read_since(self.offset)
+            self.add(rows)
+            return len(rows)
+
+    def query(self, by='facility', **filters):
+        """Aggregate over the cells selected by `filters`, grouped by one dimension.
+
+        Filters are keyed by dimension name and take a list of level labels
+        (e.g. facility=['A', 'C'], admission_month=[1, 2, 3]); omitted
+        dimensions are not filtered.
+        """
+        selection = []
+        for name, levels in DIMENSIONS:
+            wanted = filters.get(name)
+            if wanted is None:
+                selection.append(np.arange(len(levels)))
+            else:
+                wanted = {str(w) for w in wanted}
+                selection.append(np.array([i for i, level in enumerate(levels) if str(level) in wanted], dtype=np.intp))
+
+        sliced = self.sums[(slice(None),) + np.ix_(*selection)]
+        group_axis = DIMENSION_NAMES.index(by)
+        other_axes = tuple(1 + a for a in range(len(DIMENSIONS)) if a != group_axis)
+        totals = sliced.sum(axis=other_axes)
+
+        levels = [DIMENSIONS[group_axis][1][i] for i in selection[group_axis]]
+        result = pd.DataFrame(dict(zip(MEASURES, totals)), index=pd.Index(levels, name=by))
+        return summarize(result)
+
+
+def summarize(sums):
+    """Turn summed measures into counts, means, spread and MAE."""
+    n = sums['n']
+    n_actual = sums['n_actual']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_pred = sums['pred_sum'] / n
+        mean_actual = sums['actual_sum'] / n_actual
+        summary = pd.DataFrame({
+            'patients': n.astype(np.int64),
+            'mean_predicted_los': mean_pred,
+            'std_predicted_los': np.sqrt(np.maximum(sums['pred_sq'] / n - mean_pred ** 2, 0)),
+            'with_actual': n_actual.astype(np.int64),
+            'mean_actual_los': mean_actual,
+            'std_actual_los': np.sqrt(np.maximum(sums['actual_sq'] / n_actual - mean_actual ** 2, 0)),
+            'mae': sums['abs_err'] / n_actual,
+        }, index=sums.index)
+    return summary
+
+
+def refresh_cube(log_path=None, cube_path=COHORT_CUBE_PATH):
+    """Bring the on-disk cube up to date with the prediction log."""
+    log = PredictionLog(log_path) if log_path else PredictionLog()
+    cube = CohortCube.load(cube_path)
+    if cube.refresh(log):
+        cube.save(cube_path)
+    return cube
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the cohort aggregate cube.")
+    parser.add_argument('--log', default=None, help="Prediction log (default: data/predictions.csv)")
+    parser.add_argument('--cube', default=str(COHORT_CUBE_PATH))
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    cube = refresh_cube(args.log, args.cube)
+    print(f"Cube covers {int(cube.sums[0].sum()):,} predictions "
+          f"(refreshed in {(time.perf_counter() - started) * 1000:.0f} ms) -> {args.cube}")
+
+
+if __name__ == '__main__':
+    main()
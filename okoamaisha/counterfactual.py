@@ -0,0 +1,251 @@
+"""
+Counterfactual search for actionable length-of-stay reductions
+
+"What would bring this patient under 4 days?" Only MODIFIABLE_FIELDS, the
+labs and vitals, may change. History, comorbidities, demographics and the
+admission itself stay fixed. A tree ensemble's prediction only moves when an
+input crosses one of its split thresholds. For a Gradient Boosting bundle a
+field's candidates are therefore one value on each side of every threshold
+the model splits it on, mapped back from scaled to raw units. Other models
+(for example histogram gradient boosting, whose bins are quantiles of the
+training data) do not expose their trees the same way; their candidates are
+the field's CANDIDATE_QUANTILES, read from the training distribution the
+fitted scaler records (mean and scale). The engineered flag boundaries (for
+example glucose > 140) are added, and every value is rounded to the field's
+STEP and kept within CANDIDATE_SDS standard deviations of the training mean.
+That gives a few hundred candidates per field instead of a grid. For each
+patient, only values that move a field toward or within its typical range,
+TYPICAL_SDS standard deviations either side of the training mean, are
+tried. Both ranges come from the fitted scaler rather than clinical
+reference ranges, because the training data does not use clinical units
+for every field (see okoamaisha.validation).
+
+The search is a beam search over the number of changed fields. Each level
+is scored as one batch through the vectorized feature and model path. After
+the first level each field keeps only its Pareto-optimal values: those for
+which no smaller change predicts as short a stay. Deeper levels combine the
+`beam` best partial plans with those values. A plan costs the sum of its
+changes, each measured in standard deviations of that feature (the fitted
+scaler's scale). The search stops at the first level that reaches the
+target and returns the cheapest plan for each set of fields found there.
+
+Usage:
+    python -m okoamaisha.counterfactual census.csv --target 4 -o counterfactuals.csv
+"""
+
+import argparse
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.batch_score import read_inputs
+from okoamaisha.clinical import LOS_CUTOFFS
+from okoamaisha.scoring import Scorer
+from okoamaisha.validation import validate_batch
+
+# Labs and vitals a care plan can act on, with the resolution values are shown in
+STEP = {
+    'glucose': 1.0,
+    'sodium': 0.1,
+    'creatinine': 0.01,
+    'bloodureanitro': 0.1,
+    'hematocrit': 0.1,
+    'neutrophils': 0.1,
+    'pulse': 1.0,
+    'respiration': 0.1,
+}
+MODIFIABLE_FIELDS = list(STEP)
+
+# Typical range of a field, in training standard deviations either side of
+# its training mean; a plan may move a value into or within it, never further out
+TYPICAL_SDS = 1.0
+# Candidates stay this many training standard deviations from the mean (and
+# non-negative: every modifiable field is a count, concentration or rate)
+CANDIDATE_SDS = 4.0
+
+# Boundaries of the engineered flags in features.engineer_batch
+FLAG_CUTS = {
+    'glucose': [140],
+    'sodium': [135],
+    'creatinine': [1.3],
+    'pulse': [60, 100],
+    'respiration': [12, 20],
+}
+
+# Fast-track protocol applies at or below 4 days
+TARGET_DAYS = LOS_CUTOFFS[1]
+# Quantiles of the training distribution tried when the model's split
+# thresholds are not available
+CANDIDATE_QUANTILES = np.linspace(0.005, 0.995, 199)
+
+MAX_CHANGES = 3
+BEAM = 16
+TOP = 5
+
+
+def _decimals(step):
+    return max(0, -int(np.floor(np.log10(step))))
+
+
+class CounterfactualSearch:
+    def __init__(self, scorer=None, fields=MODIFIABLE_FIELDS):
+        self.scorer = scorer or Scorer.load()
+        names = list(self.scorer.feature_names)
+        scaler = self.scorer.scaler
+        self.fields = [f for f in fields if f in names]
+        self.mean = {f: float(scaler.mean_[names.index(f)]) if scaler.with_mean else 0.0 for f in self.fields}
+        self.scale = {f: float(scaler.scale_[names.index(f)]) if scaler.with_std else 1.0 for f in self.fields}
+        self.candidates = {f: self._candidates(f, names.index(f)) for f in self.fields}
+
+    def _thresholds(self, column):
+        """Scaled values of feature `column` to place candidates around."""
+        estimators = getattr(self.scorer.model, 'estimators_', None)
+        if estimators is not None and all(hasattr(est, 'tree_') for est in np.ravel(estimators)):
+            return np.unique(np.concatenate([
+                est.tree_.threshold[(est.tree_.children_left != -1) & (est.tree_.feature == column)]
+                for est in np.ravel(estimators)]))
+        return np.array([NormalDist().inv_cdf(q) for q in CANDIDATE_QUANTILES])
+
+    def _candidates(self, field, column):
+        thresholds = self._thresholds(column)
+        step = STEP[field]
+        below = np.floor(thresholds * self.scale[field] / step + self.mean[field] / step) * step
+        flags = np.asarray(FLAG_CUTS.get(field, []), dtype=np.float64)
+        values = np.concatenate([below, below + step, flags - step, flags, flags + step])
+        lo, hi = self._range(field, CANDIDATE_SDS)
+        return np.unique(np.round(np.clip(values, lo, hi), _decimals(step)))
+
+    def _range(self, field, sds):
+        """Training mean ± `sds` standard deviations of `field`, floored at 0."""
+        return max(0.0, self.mean[field] - sds * self.scale[field]), self.mean[field] + sds * self.scale[field]
+
+    def allowed(self, patient, field):
+        """Candidates for `field` other than its current value, no further from its typical range than it is."""
+        lo, hi = self._range(field, TYPICAL_SDS)
+        value = patient[field]
+        values = self.candidates[field]
+        return values[(values >= min(value, lo)) & (values <= max(value, hi)) & (values != value)]
+
+    def cost(self, patient, plan):
+        return sum(abs(value - patient[field]) / self.scale[field] for field, value in plan.items())
+
+    def _predict(self, patient, plans):
+        frame = pd.DataFrame([patient]).iloc[np.zeros(len(plans), dtype=np.intp)].reset_index(drop=True)
+        for field in {f for plan in plans for f in plan}:
+            column = frame[field].to_numpy(dtype=np.float64, copy=True)
+            for i, plan in enumerate(plans):
+                if field in plan:
+                    column[i] = plan[field]
+            frame[field] = column
+        return self.scorer.predict_frame(frame)
+
+    def search(self, patient, target=TARGET_DAYS, max_changes=MAX_CHANGES, beam=BEAM, top=TOP):
+        """(current prediction, frame of up to `top` plans predicted under `target`, cheapest first).
+
+        Plan rows carry `plan` (field -> new value), `changes` (text),
+        `n_changes`, `cost` and `predicted_los`; the frame is empty when the
+        patient is already under the target or no plan within `max_changes`
+        fields gets there.
+        """
+        current = float(self.scorer.predict_records([patient])[0])
+        columns = ['plan', 'changes', 'n_changes', 'cost', 'predicted_los']
+        if current < target:
+            return current, pd.DataFrame(columns=columns)
+
+        singles = [{f: float(v)} for f in self.fields for v in self.allowed(patient, f)]
+        predicted = self._predict(patient, singles)
+        options = {}
+        for plan, p in sorted(zip(singles, predicted), key=lambda item: self.cost(patient, item[0])):
+            (field, value), = plan.items()
+            best = options.setdefault(field, [])
+            if p < (best[-1][1] if best else current):
+                best.append((value, p))
+
+        level = [({field: value}, p) for field, values in options.items() for value, p in values]
+        solutions = []
+        for n_changes in range(1, max_changes + 1):
+            solutions = [(plan, p) for plan, p in level if p < target]
+            if solutions or n_changes == max_changes:
+                break
+            frontier = sorted(level, key=lambda item: (item[1], self.cost(patient, item[0])))[:beam]
+            seen, plans = set(), []
+            for plan, _ in frontier:
+                for field, values in options.items():
+                    if field in plan:
+                        continue
+                    for value, _ in values:
+                        extended = {**plan, field: value}
+                        key = frozenset(extended.items())
+                        if key not in seen:
+                            seen.add(key)
+                            plans.append(extended)
+            if not plans:
+                break
+            level = list(zip(plans, self._predict(patient, plans)))
+
+        # The cheapest plan per set of changed fields; costlier variants of it only differ in degree
+        cheapest = {}
+        for plan, p in sorted(solutions, key=lambda item: (self.cost(patient, item[0]), item[1])):
+            cheapest.setdefault(frozenset(plan), (plan, p))
+        rows = [{'plan': plan, 'changes': self.describe(patient, plan), 'n_changes': len(plan),
+                 'cost': self.cost(patient, plan), 'predicted_los': float(p)}
+                for plan, p in list(cheapest.values())[:top]]
+        return current, pd.DataFrame(rows, columns=columns)
+
+    def describe(self, patient, plan):
+        return "; ".join(f"{field} {patient[field]:.{_decimals(STEP[field])}f} → {value:.{_decimals(STEP[field])}f}"
+                         for field, value in sorted(plan.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the smallest lab/vital changes that bring predicted LoS under a target.")
+    parser.add_argument('input', help="CSV in the dataset schema or the app's input schema, or ingested Parquet")
+    parser.add_argument('-o', '--output', default='counterfactuals.csv')
+    parser.add_argument('--target', type=float, default=TARGET_DAYS)
+    parser.add_argument('--max-changes', type=int, default=MAX_CHANGES)
+    parser.add_argument('--beam', type=int, default=BEAM)
+    parser.add_argument('--rows', type=int, default=None, help="Only search the first N rows")
+    parser.add_argument('--model-dir', default=None)
+    args = parser.parse_args(argv)
+
+    raw, inputs = read_inputs(args.input)
+    if args.rows:
+        raw, inputs = raw.iloc[:args.rows], inputs.iloc[:args.rows]
+    cleaned, codes = validate_batch(inputs)
+    search = CounterfactualSearch(Scorer.load(args.model_dir))
+
+    rows, timings = [], []
+    for i, patient in enumerate(cleaned.to_dict('records')):
+        if codes[i]:
+            rows.append({'error_code': int(codes[i])})
+            continue
+        started = time.perf_counter()
+        current, plans = search.search(patient, args.target, args.max_changes, args.beam)
+        timings.append(time.perf_counter() - started)
+        best = plans.iloc[0] if len(plans) else None
+        rows.append({'predicted_los': current,
+                     'changes': best['changes'] if best is not None else '',
+                     'n_changes': best['n_changes'] if best is not None else 0,
+                     'counterfactual_los': best['predicted_los'] if best is not None else np.nan,
+                     'error_code': 0})
+    result = pd.DataFrame(rows, columns=['predicted_los', 'changes', 'n_changes', 'counterfactual_los', 'error_code'])
+    if 'eid' in raw:
+        result.insert(0, 'eid', raw['eid'].to_numpy())
+    result.to_csv(args.output, index=False)
+
+    valid = result['error_code'] == 0
+    above = valid & (result['predicted_los'] >= args.target)
+    found = above & (result['n_changes'] > 0)
+    ms = np.asarray(timings) * 1000
+    print(f"{int(above.sum()):,} of {int(valid.sum()):,} patients predicted at or above {args.target:g} days; "
+          f"plans found for {int(found.sum()):,} -> {args.output}")
+    if len(ms):
+        print(f"  search time per patient: p50 {np.percentile(ms, 50):.0f} ms, p95 {np.percentile(ms, 95):.0f} ms, "
+              f"max {ms.max():.0f} ms")
+    print(result.loc[found, 'n_changes'].value_counts().sort_index().rename('patients').to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""
+Predicted-vs-actual data for the Model Performance explorer
+
+The model's held-out admissions in a labelled dataset are scored once and
+stored as compact arrays (predicted, actual, facility) together with a
+random permutation and per-facility residual histograms. The explorer then never ships all rows to
+the browser: for any viewport, `EvaluationSet.view` bins the visible points
+with one `np.histogram2d`, keeps dense bins as a heatmap and returns only a
+capped sample of the points in sparse bins for a WebGL scatter.
+
+Only rows held out of training count: the eids a bundle recorded with its
+split (artifacts.HOLDOUT_FILE, written by okoamaisha.tuning), or a file of
+eids given with `--holdout-eids` for a bundle trained elsewhere. A bundle
+with neither is not evaluated, since scoring its training rows would make
+every number in-sample. The set records which rows it used, and sets saved
+without that record are not loaded.
+
+The page's headline metrics come from the same rows, with bootstrap
+confidence intervals overall, per facility and per actual stay category.
+`bootstrap_sums` draws the resample indices as one (resamples × rows)
+matrix, in blocks to bound memory, turns each block into per-row counts
+with one `np.bincount` and gets every group's sums from one matrix product,
+so 2,000 resamples of 100k rows take seconds. The intervals are computed
+when the set is built and saved with it, so they are cached per model.
+
+Usage:
+    python -m okoamaisha.evaluation data/admissions.parquet
+    python -m okoamaisha.evaluation data/admissions.parquet --holdout-eids test_eids.csv
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha import clinical
+from okoamaisha.artifacts import ADMISSIONS_PATH, DATA_DIR, HOLDOUT_FILE, load_holdout_eids, read_eids
+from okoamaisha.batch_score import read_inputs
+from okoamaisha.features import FACILITIES
+from okoamaisha.router import facility_codes
+from okoamaisha.scoring import Scorer
+from okoamaisha.validation import validate_batch
+
+EVALUATION_PATH = DATA_DIR / 'evaluation.npz'
+
+# Residual (actual - predicted) histogram edges, shared by every facility
+RESIDUAL_EDGES = np.linspace(-4, 4, 81)
+
+# A long stay is one the Home page would put in the Long category
+LONG_STAY_DAYS = clinical.LOS_CUTOFFS[-1]
+N_RESAMPLES = 2000
+# Resamples per block: the (block × rows) count matrix stays near 100 MB at 100k rows
+BOOTSTRAP_BLOCK = 100
+CONFIDENCE = 0.95
+METRICS = ['r2', 'mae', 'rmse', 'recall', 'missed']
+# Per-row statistics summed for every group; METRICS are functions of these sums
+SUM_STATS = ['rows', 'abs_error', 'sq_error', 'actual', 'sq_actual', 'long', 'caught']
+
+
+def residual_histograms(residual, facility):
+    """Counts per RESIDUAL_EDGES bin for each facility code (rows) and overall (last row)."""
+    clipped = np.clip(residual, RESIDUAL_EDGES[0], RESIDUAL_EDGES[-1])
+    bins = np.minimum(np.searchsorted(RESIDUAL_EDGES, clipped, side='right') - 1, len(RESIDUAL_EDGES) - 2)
+    n_bins = len(RESIDUAL_EDGES) - 1
+    counts = np.bincount(facility * n_bins + bins, minlength=len(FACILITIES) * n_bins)
+    per_facility = counts.reshape(len(FACILITIES), n_bins)
+    return np.vstack([per_facility, per_facility.sum(axis=0)])
+
+
+def metric_groups(facility, actual):
+    """(labels, rows × groups membership) for all rows, each facility and each actual stay category."""
+    category = clinical.category_codes(actual, clinical.STAY_CUTOFFS)
+    labels = (['All'] + [f"Facility {f}" for f in FACILITIES]
+              + [f"{c} stay" for c in clinical.STAY_CATEGORIES])
+    members = np.column_stack([np.ones(len(actual), dtype=bool)]
+                              + [facility == i for i in range(len(FACILITIES))]
+                              + [category == i for i in range(len(clinical.STAY_CATEGORIES))])
+    return labels, members
+
+
+def row_stats(predicted, actual):
+    """Rows × SUM_STATS matrix of per-row terms."""
+    actual = actual.astype(np.float64)
+    residual = actual - predicted
+    long = actual > LONG_STAY_DAYS
+    return np.column_stack([np.ones_like(actual), np.abs(residual), residual ** 2, actual, actual ** 2,
+                            long, long & (predicted > LONG_STAY_DAYS)])
+
+
+def metrics_from_sums(sums):
+    """METRICS from SUM_STATS sums (last axis); NaN where a group has no rows or no long stays."""
+    rows, abs_error, sq_error, actual, sq_actual, long, caught = np.moveaxis(sums, -1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ss_tot = sq_actual - actual ** 2 / rows
+        return {
+            'r2': 1 - sq_error / ss_tot,
+            'mae': abs_error / rows,
+            'rmse': np.sqrt(sq_error / rows),
+            'recall': np.where(long > 0, caught / long, np.nan),
+            'missed': np.where(rows > 0, long - caught, np.nan),
+        }
+
+
+def bootstrap_sums(values, n_resamples=N_RESAMPLES, seed=0, block=BOOTSTRAP_BLOCK):
+    """Column sums of `values` (rows × k) in each of `n_resamples` bootstrap resamples of its rows.
+
+    Each block of resamples is one (block × rows) index matrix; a single
+    bincount turns it into how often each row was drawn, and the sums for
+    the whole block are one matrix product with `values`.
+    """
+    n = len(values)
+    rng = np.random.default_rng(seed)
+    sums = np.empty((n_resamples, values.shape[1]))
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        index = rng.integers(0, n, size=(size, n))
+        index += np.arange(size)[:, None] * n
+        counts = np.bincount(index.ravel(), minlength=size * n).reshape(size, n)
+        sums[start:start + size] = counts @ values
+    return sums
+
+
+def bootstrap_intervals(predicted, actual, facility, n_resamples=N_RESAMPLES, seed=0, confidence=CONFIDENCE):
+    """Estimate and percentile interval of each of METRICS for every group of `metric_groups`.
+
+    Resamples are drawn from all rows at once, so a group's size varies
+    across resamples the way it would across evaluation sets.
+    """
+    labels, members = metric_groups(facility, actual)
+    stats = row_stats(predicted, actual)
+    # Rows × (groups · stats): each group's copy of the stats, zero outside it
+    values = (members[:, :, None] * stats[:, None, :]).reshape(len(stats), -1)
+    shape = (len(labels), len(SUM_STATS))
+    estimate = metrics_from_sums(values.sum(axis=0).reshape(shape))
+    resampled = metrics_from_sums(bootstrap_sums(values, n_resamples, seed).reshape((n_resamples,) + shape))
+    tail = (1 - confidence) / 2 * 100
+    rows = []
+    for g, label in enumerate(labels):
+        for metric in METRICS:
+            lower, upper = np.nanpercentile(resampled[metric][:, g], [tail, 100 - tail]) \
+                if np.isfinite(resampled[metric][:, g]).any() else (np.nan, np.nan)
+            rows.append({'group': label, 'patients': int(members[:, g].sum()), 'metric': metric,
+                         'estimate': float(estimate[metric][g]), 'lower': float(lower), 'upper': float(upper)})
+    return pd.DataFrame(rows)
+
+
+def model_version(metadata):
+    """Model name and training date of a bundle's metadata, which an evaluation set is tied to."""
+    return f"{metadata.get('model_name', '')} {metadata.get('training_date', '')}"
+
+
+class EvaluationSet:
+    def __init__(self, predicted, actual, facility, order, histograms, model_name='', intervals=None, split='',
+                 model_version=''):
+        self.predicted = predicted
+        self.actual = actual
+        self.facility = facility
+        # Random permutation of row ids; scatter samples are its first matches
+        self.order = order
+        self.histograms = histograms
+        self.model_name = model_name
+        # model_version() of the bundle that scored the set
+        self.model_version = model_version
+        # Which rows were scored, e.g. "held-out eids recorded with the model bundle"
+        self.split = split
+        self._intervals = intervals
+
+    @classmethod
+    def build(cls, inputs, actual, scorer=None, seed=0, split=''):
+        scorer = scorer or Scorer.load()
+        predicted = scorer.predict_frame(inputs).astype(np.float32)
+        actual = np.asarray(actual, dtype=np.float32)
+        facility = facility_codes(inputs['facility']).astype(np.int8)
+        order = np.random.default_rng(seed).permutation(len(predicted)).astype(np.int32)
+        histograms = residual_histograms(actual - predicted, facility.astype(np.int64))
+        evaluation = cls(predicted, actual, facility, order, histograms, scorer.metadata.get('model_name', ''),
+                         split=split, model_version=model_version(scorer.metadata))
+        evaluation.intervals()
+        return evaluation
+
+    @classmethod
+    def load(cls, path=EVALUATION_PATH, model_version=None):
+        """The saved set, or None if there is none or it was scored by a model other than `model_version`."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if 'split' not in data or 'model_version' not in data:
+                # Built before held-out rows or the model version were recorded
+                return None
+            if model_version is not None and str(data['model_version']) != model_version:
+                return None
+            intervals = None
+            if 'interval_values' in data:
+                intervals = pd.DataFrame(data['interval_values'], columns=['patients', 'estimate', 'lower', 'upper'])
+                intervals.insert(0, 'metric', data['interval_metrics'])
+                intervals.insert(0, 'group', data['interval_groups'])
+                intervals['patients'] = intervals['patients'].astype(int)
+            return cls(data['predicted'], data['actual'], data['facility'], data['order'],
+                       data['histograms'], str(data['model_name']), intervals, str(data['split']),
+                       str(data['model_version']))
+
+    def save(self, path=EVALUATION_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        intervals = self.intervals()
+        np.savez(tmp, predicted=self.predicted, actual=self.actual, facility=self.facility,
+                 order=self.order, histograms=self.histograms, model_name=self.model_name, split=self.split,
+                 model_version=self.model_version,
+                 interval_groups=intervals['group'].to_numpy(str), interval_metrics=intervals['metric'].to_numpy(str),
+                 interval_values=intervals[['patients', 'estimate', 'lower', 'upper']].to_numpy(np.float64))
+        os.replace(tmp, path)
+
+    def intervals(self):
+        """Bootstrap intervals of METRICS per group (see `bootstrap_intervals`); computed once per set."""
+        if self._intervals is None:
+            self._intervals = bootstrap_intervals(self.predicted, self.actual, self.facility.astype(np.int64))
+        return self._intervals
+
+    def __len__(self):
+        return len(self.predicted)
+
+    def metrics(self, facilities=None):
+        rows = self._rows(facilities)
+        residual = self.actual[rows].astype(np.float64) - self.predicted[rows]
+        actual = self.actual[rows].astype(np.float64)
+        ss_tot = ((actual - actual.mean()) ** 2).sum() if len(actual) else 0.0
+        return {
+            'rows': int(len(residual)),
+            'mae': float(np.abs(residual).mean()) if len(residual) else np.nan,
+            'rmse': float(np.sqrt((residual ** 2).mean())) if len(residual) else np.nan,
+            'r2': float(1 - (residual ** 2).sum() / ss_tot) if ss_tot else np.nan,
+        }
+
+    def _rows(self, facilities):
+        if facilities is None or len(facilities) == len(FACILITIES):
+            return slice(None)
+        return np.isin(self.facility, [FACILITIES.index(f) for f in facilities])
+
+    def view(self, x_range, y_range, bins=120, dense_min=20, max_points=5000, facilities=None):
+        """Bin the rows inside a viewport of predicted (x) vs actual (y).
+
+        Returns (counts, x_edges, y_edges, points): `counts` has bins with
+        fewer than `dense_min` rows masked to NaN, and `points` is a frame of
+        at most `max_points` sampled rows from those sparse bins.
+        """
+        x, y = self.predicted, self.actual
+        inside = (x >= x_range[0]) & (x <= x_range[1]) & (y >= y_range[0]) & (y <= y_range[1])
+        if facilities is not None and len(facilities) < len(FACILITIES):
+            inside &= np.isin(self.facility, [FACILITIES.index(f) for f in facilities])
+        counts, x_edges, y_edges = np.histogram2d(x[inside], y[inside], bins=bins, range=[x_range, y_range])
+
+        # Sparse-bin membership for every row, looked up through the binned grid
+        ix = np.clip(((x - x_range[0]) / (x_range[1] - x_range[0]) * bins).astype(np.int64), 0, bins - 1)
+        iy = np.clip(((y - y_range[0]) / (y_range[1] - y_range[0]) * bins).astype(np.int64), 0, bins - 1)
+        sparse = inside & (counts[ix, iy] < dense_min)
+        sampled = self.order[sparse[self.order]][:max_points]
+        points = pd.DataFrame({'predicted': x[sampled], 'actual': y[sampled],
+                               'facility': np.asarray(FACILITIES)[self.facility[sampled]]})
+
+        dense = np.where(counts >= dense_min, counts, np.nan)
+        return dense, x_edges, y_edges, points
+
+    def residual_histogram(self, facility=None):
+        """(bin centers, counts) of residuals for one facility letter, or all rows."""
+        row = len(FACILITIES) if facility is None else FACILITIES.index(facility)
+        centers = (RESIDUAL_EDGES[:-1] + RESIDUAL_EDGES[1:]) / 2
+        return centers, self.histograms[row]
+
+
+def build_evaluation(path=ADMISSIONS_PATH, out=EVALUATION_PATH, model_dir=None, holdout_eids=None):
+    """Score the model's held-out admissions in `path` and save the set.
+
+    `holdout_eids` defaults to the split recorded with the model bundle;
+    raises ValueError when there is none, or none of its rows are in `path`.
+    """
+    if holdout_eids is None:
+        holdout_eids = load_holdout_eids(model_dir)
+        split = "held-out eids recorded with the model bundle"
+        if holdout_eids is None:
+            raise ValueError(f"the model bundle has no {HOLDOUT_FILE}, so its training rows are unknown and "
+                             f"metrics would be in-sample; pass --holdout-eids or retrain with okoamaisha.tuning")
+    else:
+        split = "held-out eids given when the set was built"
+    raw, inputs = read_inputs(path)
+    if 'lengthofstay' not in raw or 'eid' not in raw:
+        raise ValueError(f"{path} needs eid and lengthofstay columns to evaluate against")
+    held = np.isin(raw['eid'].to_numpy(), holdout_eids)
+    if not held.any():
+        raise ValueError(f"none of the {len(holdout_eids):,} held-out eids are in {path}")
+    cleaned, codes = validate_batch(inputs[held].reset_index(drop=True))
+    valid = codes == 0
+    evaluation = EvaluationSet.build(cleaned[valid].reset_index(drop=True),
+                                     raw['lengthofstay'].to_numpy()[held][valid], Scorer.load(model_dir),
+                                     split=split)
+    evaluation.save(out)
+    return evaluation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a labelled dataset for the predicted-vs-actual explorer.")
+    parser.add_argument('data', nargs='?', default=str(ADMISSIONS_PATH))
+    parser.add_argument('-o', '--output', default=str(EVALUATION_PATH))
+    parser.add_argument('--model-dir', default=None)
+    parser.add_argument('--holdout-eids', default=None,
+                        help=f"CSV or .npy of eids held out of training (default: the bundle's {HOLDOUT_FILE})")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    holdout_eids = None if args.holdout_eids is None else read_eids(args.holdout_eids)
+    try:
+        evaluation = build_evaluation(args.data, args.output, args.model_dir, holdout_eids)
+    except ValueError as e:
+        parser.error(str(e))
+    metrics = evaluation.metrics()
+    print(f"Scored {len(evaluation):,} held-out rows in {time.perf_counter() - started:.1f}s "
+          f"(MAE {metrics['mae']:.3f}, RMSE {metrics['rmse']:.3f}, R² {metrics['r2']:.4f}) -> {args.output}")
+    intervals = evaluation.intervals()
+    table = intervals.pivot(index='group', columns='metric', values=['estimate', 'lower', 'upper'])
+    table = table.reindex(intervals['group'].unique())
+    for group in table.index:
+        print(f"  {group:<14} " + "  ".join(
+            f"{metric} {table.loc[group, ('estimate', metric)]:.3f} "
+            f"[{table.loc[group, ('lower', metric)]:.3f}, {table.loc[group, ('upper', metric)]:.3f}]"
+            for metric in METRICS))
+
+
+if __name__ == '__main__':
+    main()
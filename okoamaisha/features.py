@@ -0,0 +1,169 @@
+"""
+Feature engineering for single patients and whole batches
+
+`engineer_features` mirrors the per-patient logic used by the Home page, and
+`engineer_batch` applies the same rules column-wise to a DataFrame of inputs.
+
+Batch matrices use the compact schema in FEATURE_DTYPES: most of the 38
+columns are 0/1 flags, so they are stored as uint8 instead of int64, small
+counts as int8 and labs/vitals as float32. Matrices are only widened to
+float64 by `to_model_input`, right before the scaler. Note that float32 labs
+are rounded to ~7 significant digits, so a value sitting within that rounding
+of a split threshold can land on the other side of it.
+"""
+
+import numpy as np
+import pandas as pd
+
+COMORBIDITY_COLS = [
+    'dialysisrenalendstage', 'asthma', 'irondef', 'pneum',
+    'substancedependence', 'psychologicaldisordermajor',
+    'depress', 'psychother', 'fibrosisandother', 'malnutrition', 'hemo'
+]
+
+FACILITIES = ['A', 'B', 'C', 'D', 'E']
+
+# Inputs copied straight into the feature matrix
+PASSTHROUGH_COLS = ['gender', 'rcount', 'bmi', 'pulse', 'respiration', 'hematocrit',
+                    'neutrophils', 'sodium', 'glucose', 'bloodureanitro', 'creatinine',
+                    'secondarydiagnosisnonicd9', 'admission_month', 'admission_dayofweek',
+                    'admission_quarter']
+
+LAB_VITAL_COLS = ['bmi', 'pulse', 'respiration', 'hematocrit', 'neutrophils',
+                  'sodium', 'glucose', 'bloodureanitro', 'creatinine']
+
+# Compact batch schema; anything not listed (flags, one-hots) is uint8
+FEATURE_DTYPES = {
+    **{c: np.float32 for c in LAB_VITAL_COLS},
+    'rcount': np.int8,
+    'secondarydiagnosisnonicd9': np.int8,
+    'admission_month': np.int8,
+    'admission_dayofweek': np.int8,
+    'admission_quarter': np.int8,
+}
+FLAG_DTYPE = np.uint8
+
+
+def engineer_features(input_dict, feature_names, comorbidity_cols=COMORBIDITY_COLS):
+    df = pd.DataFrame(0, index=[0], columns=feature_names)
+
+    for key in PASSTHROUGH_COLS:
+        if key in input_dict:
+            df[key] = input_dict[key]
+
+    for c in comorbidity_cols:
+        df[c] = int(input_dict.get(c, 0))
+
+    df['total_comorbidities'] = sum([input_dict.get(c, 0) for c in comorbidity_cols])
+    df['high_glucose'] = int(input_dict['glucose'] > 140)
+    df['low_sodium'] = int(input_dict['sodium'] < 135)
+    df['high_creatinine'] = int(input_dict['creatinine'] > 1.3)
+    df['low_bmi'] = int(input_dict['bmi'] < 18.5)
+    df['high_bmi'] = int(input_dict['bmi'] > 30)
+    df['abnormal_vitals'] = (
+        int((input_dict['pulse'] < 60) or (input_dict['pulse'] > 100)) +
+        int((input_dict['respiration'] < 12) or (input_dict['respiration'] > 20))
+    )
+
+    for fac in FACILITIES:
+        col_name = f'facility_{fac}'
+        if col_name in feature_names:
+            df[col_name] = int(input_dict['facility'] == fac)
+
+    return df
+
+
+def engineer_batch(inputs, feature_names, comorbidity_cols=COMORBIDITY_COLS, dtypes=FEATURE_DTYPES):
+    """Vectorized `engineer_features` over a DataFrame with one patient per row.
+
+    Columns follow `dtypes` (FLAG_DTYPE where unlisted); pass `dtypes=None`
+    for the int64/float64 layout of the single-patient path.
+    """
+    n = len(inputs)
+
+    def dtype_of(name):
+        if dtypes is None:
+            return np.int64
+        return dtypes.get(name, FLAG_DTYPE)
+
+    def column(name, values):
+        values = np.asarray(values)
+        if dtypes is None:
+            return values.astype(np.int64) if values.dtype == bool else values
+        return values.astype(dtype_of(name), copy=False)
+
+    columns = {name: np.zeros(n, dtype=dtype_of(name)) for name in feature_names}
+
+    for key in PASSTHROUGH_COLS:
+        if key in inputs:
+            columns[key] = column(key, inputs[key].to_numpy())
+
+    comorbidities = np.zeros(n, dtype=np.int64)
+    for c in comorbidity_cols:
+        flag = inputs[c].fillna(0).to_numpy().astype(np.int64) if c in inputs else np.zeros(n, dtype=np.int64)
+        columns[c] = column(c, flag)
+        comorbidities += flag
+    columns['total_comorbidities'] = column('total_comorbidities', comorbidities)
+
+    glucose = inputs['glucose'].to_numpy()
+    sodium = inputs['sodium'].to_numpy()
+    creatinine = inputs['creatinine'].to_numpy()
+    bmi = inputs['bmi'].to_numpy()
+    pulse = inputs['pulse'].to_numpy()
+    respiration = inputs['respiration'].to_numpy()
+
+    columns['high_glucose'] = column('high_glucose', glucose > 140)
+    columns['low_sodium'] = column('low_sodium', sodium < 135)
+    columns['high_creatinine'] = column('high_creatinine', creatinine > 1.3)
+    columns['low_bmi'] = column('low_bmi', bmi < 18.5)
+    columns['high_bmi'] = column('high_bmi', bmi > 30)
+    columns['abnormal_vitals'] = column('abnormal_vitals', (
+        ((pulse < 60) | (pulse > 100)).astype(np.int64) +
+        ((respiration < 12) | (respiration > 20)).astype(np.int64)
+    ))
+
+    facility = inputs['facility'].to_numpy()
+    for fac in FACILITIES:
+        col_name = f'facility_{fac}'
+        if col_name in columns:
+            columns[col_name] = column(col_name, facility == fac)
+
+    return pd.DataFrame({name: columns[name] for name in feature_names})
+
+
+def to_model_input(features):
+    """Widen a compact feature matrix to float64 for the scaler.
+
+    Without this, scaler.transform would pick float32 as the common dtype of
+    a uint8/int8/float32 frame and scale in lower precision than training.
+    """
+    return features.astype(np.float64)
+
+
+def from_admissions(raw):
+    """Map rows in the original dataset schema (eid, vdate, facid, ...) to model inputs."""
+    inputs = pd.DataFrame(index=raw.index)
+
+    for key in ['bmi', 'pulse', 'respiration', 'hematocrit', 'neutrophils', 'sodium',
+                'glucose', 'bloodureanitro', 'creatinine', 'secondarydiagnosisnonicd9']:
+        inputs[key] = pd.to_numeric(raw[key])
+
+    # rcount is recorded as 0-4 or "5+"
+    inputs['rcount'] = pd.to_numeric(raw['rcount'].astype(str).str.rstrip('+')).clip(upper=5)
+    gender = raw['gender'].astype(str).str.upper()
+    inputs['gender'] = gender.str.startswith('M').astype(np.int64)
+
+    for c in COMORBIDITY_COLS:
+        inputs[c] = pd.to_numeric(raw[c]).astype(np.int64)
+
+    vdate = pd.to_datetime(raw['vdate'])
+    inputs['admission_month'] = vdate.dt.month
+    inputs['admission_dayofweek'] = vdate.dt.dayofweek
+    inputs['admission_quarter'] = vdate.dt.quarter
+    inputs['facility'] = raw['facid'].astype(str).str.strip().str.upper()
+
+    return inputs
+
+
+def is_admissions_schema(frame):
+    return 'facid' in frame.columns and 'vdate' in frame.columns
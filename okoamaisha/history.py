@@ -0,0 +1,189 @@
+"""
+Admission history store for readmission counts
+
+`rcount` is the number of admissions in the 180 days before a visit (capped
+at 5, the model's "5+"). Rather than taking it from a form, `HistoryStore`
+keeps every known visit as one sorted int64 key,
+`patient * DAY_SPAN + visit day`. Each patient's visits are then one
+contiguous run in date order. For a whole batch, the count is two
+`np.searchsorted` calls, so no patient is scanned: visits before the
+admission day minus visits before the start of the window. A million visits
+take 8 MB.
+
+New admissions go into a small sorted delta, which is merged into the main
+array once it reaches MERGE_ROWS. Appends stay cheap and queries search
+both arrays. Visits are unique per patient and day, so re-adding a file
+changes nothing.
+
+The patient key is the dataset's `eid`. In the public extract every eid is a
+single encounter, so the counts there are 0. Feeds that carry a real
+patient identifier pass it as `key`.
+
+Usage:
+    python -m okoamaisha.history build data/admissions.parquet
+    python -m okoamaisha.history add new_admissions.csv
+    python -m okoamaisha.history rcount census.csv -o census_rcount.csv
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.artifacts import ADMISSIONS_PATH, DATA_DIR
+from okoamaisha.ingest import read_admissions
+from okoamaisha.validation import bounds
+
+HISTORY_PATH = DATA_DIR / 'history.npy'
+
+# Visit days since 1970-01-01 must fit below DAY_SPAN; patient keys below MAX_PATIENT
+DAY_SPAN = 1 << 20
+MAX_PATIENT = (1 << 63) // DAY_SPAN - 1
+WINDOW_DAYS = 180
+RCOUNT_CAP = bounds('rcount')[1]
+MERGE_ROWS = 65_536
+
+
+def _days(dates):
+    dates = np.asarray(dates)
+    if dates.dtype.kind != 'M':
+        dates = pd.to_datetime(dates).to_numpy()
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    if len(days) and (days.min() < 0 or days.max() >= DAY_SPAN):
+        raise ValueError("visit dates must fall between 1970 and 4840")
+    return days
+
+
+def encode(patients, dates):
+    """Sort keys for (patient, visit date) pairs."""
+    patients = np.asarray(patients, dtype=np.int64)
+    if len(patients) and (patients.min() < 0 or patients.max() > MAX_PATIENT):
+        raise ValueError(f"patient keys must be between 0 and {MAX_PATIENT}")
+    return patients * DAY_SPAN + _days(dates)
+
+
+def _sorted_unique(keys):
+    # np.unique's generic path is several times slower than sort + mask for int64
+    keys = np.sort(keys)
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+
+
+def _contains(sorted_keys, keys):
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[pos] == keys
+
+
+def _merge(sorted_keys, new_keys):
+    """Union of two sorted unique arrays, by insertion rather than a re-sort."""
+    new_keys = new_keys[~_contains(sorted_keys, new_keys)]
+    return np.insert(sorted_keys, np.searchsorted(sorted_keys, new_keys), new_keys)
+
+
+class HistoryStore:
+    def __init__(self, keys=None):
+        self.main = np.empty(0, dtype=np.int64) if keys is None else np.asarray(keys, dtype=np.int64)
+        self.delta = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_admissions(cls, admissions, key='eid'):
+        return cls(_sorted_unique(encode(admissions[key].to_numpy(), admissions['vdate'].to_numpy())))
+
+    @classmethod
+    def load(cls, path=HISTORY_PATH):
+        if not os.path.exists(path):
+            return None
+        return cls(np.load(path))
+
+    def save(self, path=HISTORY_PATH):
+        self.merge()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.npy"
+        np.save(tmp, self.main)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.main) + len(self.delta)
+
+    def add(self, patients, dates):
+        """Record visits; returns how many were new."""
+        keys = _sorted_unique(encode(patients, dates))
+        keys = keys[~_contains(self.main, keys)]
+        before = len(self.delta)
+        self.delta = _merge(self.delta, keys)
+        added = len(self.delta) - before
+        if len(self.delta) >= MERGE_ROWS:
+            self.merge()
+        return added
+
+    def merge(self):
+        if len(self.delta):
+            self.main = _merge(self.main, self.delta)
+            self.delta = np.empty(0, dtype=np.int64)
+
+    def counts(self, patients, dates, window=WINDOW_DAYS):
+        """Visits by each patient in the `window` days before (not on) each date."""
+        end = encode(patients, dates)
+        start = end - window
+        return sum(np.searchsorted(keys, end) - np.searchsorted(keys, start) for keys in (self.main, self.delta))
+
+    def rcount(self, patients, dates, window=WINDOW_DAYS):
+        return np.minimum(self.counts(patients, dates, window), RCOUNT_CAP).astype(np.int8)
+
+    def visits(self, patient):
+        """Visit dates of one patient, oldest first."""
+        lo, hi = int(patient) * DAY_SPAN, (int(patient) + 1) * DAY_SPAN
+        keys = np.concatenate([k[np.searchsorted(k, lo):np.searchsorted(k, hi)] for k in (self.main, self.delta)])
+        return np.sort(keys - lo).astype('datetime64[D]')
+
+
+def _read_visits(path, key):
+    if str(path).endswith('.parquet'):
+        return read_admissions(path, columns=[key, 'vdate'])
+    return pd.read_csv(path, usecols=[key, 'vdate'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the admission history store.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Index every visit of an admissions file")
+    build.add_argument('data', nargs='?', default=str(ADMISSIONS_PATH))
+    add = sub.add_parser('add', help="Append newly arrived admissions")
+    add.add_argument('data')
+    query = sub.add_parser('rcount', help="Readmission counts for a file of admissions")
+    query.add_argument('data')
+    query.add_argument('-o', '--output', default='rcount.csv')
+    for command in (build, add, query):
+        command.add_argument('--key', default='eid', help="Patient identifier column")
+        command.add_argument('--store', default=str(HISTORY_PATH))
+    args = parser.parse_args(argv)
+
+    visits = _read_visits(args.data, args.key)
+    started = time.perf_counter()
+    if args.command == 'build':
+        store = HistoryStore.from_admissions(visits, args.key)
+        store.save(args.store)
+        print(f"Indexed {len(store):,} visits in {time.perf_counter() - started:.2f}s -> {args.store}")
+        return
+
+    store = HistoryStore.load(args.store)
+    if store is None:
+        parser.error(f"no history store at {args.store}; run `build` first")
+    if args.command == 'add':
+        new = store.add(visits[args.key].to_numpy(), visits['vdate'].to_numpy())
+        store.save(args.store)
+        print(f"Added {new:,} of {len(visits):,} visits ({len(store):,} total) "
+              f"in {time.perf_counter() - started:.2f}s -> {args.store}")
+    else:
+        rcount = store.rcount(visits[args.key].to_numpy(), visits['vdate'].to_numpy())
+        elapsed = time.perf_counter() - started
+        pd.DataFrame({args.key: visits[args.key].to_numpy(), 'rcount': rcount}).to_csv(args.output, index=False)
+        print(f"Counted {len(visits):,} admissions in {elapsed * 1000:.0f} ms -> {args.output}")
+        print(pd.Series(rcount).value_counts().sort_index().rename('admissions').to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Columnar ingestion of historical admission data
+
+The raw CSV (100,000 rows x 28 columns, flags and rcount stored as strings)
+is converted once into a typed, zstd-compressed Parquet file:
+
+- comorbidity flags as bool, rcount as int8 ("5+" -> 5)
+- gender and facid as dictionary-encoded categoricals
+- vdate and discharged as dates (datetime64 in pandas)
+- admission_month / admission_dayofweek / admission_quarter precomputed
+
+Rows are sorted by facility and visit date, so row-group statistics let
+`read_admissions` skip whole row groups for facility and month filters, and
+only the requested columns are ever decoded.
+
+Usage:
+    python -m okoamaisha.ingest convert LengthOfStay.csv data/admissions.parquet
+    python -m okoamaisha.ingest inspect data/admissions.parquet --facility C --months 1 3
+"""
+
+import argparse
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from okoamaisha.artifacts import ADMISSIONS_PATH
+from okoamaisha.features import COMORBIDITY_COLS
+
+LAB_COLS = ['hematocrit', 'neutrophils', 'sodium', 'glucose', 'bloodureanitro',
+            'creatinine', 'bmi', 'pulse', 'respiration']
+
+ADMISSIONS_SCHEMA = pa.schema(
+    [('eid', pa.int64()),
+     ('vdate', pa.date32()),
+     ('rcount', pa.int8()),
+     ('gender', pa.dictionary(pa.int8(), pa.string()))]
+    + [(c, pa.bool_()) for c in COMORBIDITY_COLS]
+    + [(c, pa.float64()) for c in LAB_COLS]
+    + [('secondarydiagnosisnonicd9', pa.int8()),
+       ('discharged', pa.date32()),
+       ('facid', pa.dictionary(pa.int8(), pa.string())),
+       ('lengthofstay', pa.int16()),
+       ('admission_month', pa.int8()),
+       ('admission_dayofweek', pa.int8()),
+       ('admission_quarter', pa.int8())]
+)
+
+# Columns needed to build model inputs with features.from_admissions
+MODEL_INPUT_COLUMNS = (['eid', 'vdate', 'rcount', 'gender'] + COMORBIDITY_COLS + LAB_COLS
+                       + ['secondarydiagnosisnonicd9', 'facid'])
+
+ROW_GROUP_SIZE = 16_384
+
+
+def _read_raw_csv(csv_path):
+    column_types = {c: pa.string() for c in ['vdate', 'discharged', 'rcount', 'gender', 'facid']}
+    column_types.update({c: pa.int8() for c in COMORBIDITY_COLS})
+    column_types.update({c: pa.float64() for c in LAB_COLS})
+    return pv.read_csv(csv_path, convert_options=pv.ConvertOptions(column_types=column_types))
+
+
+def _parse_dates(column):
+    strings = pc.utf8_trim_whitespace(column)
+    for fmt in ('%m/%d/%Y', '%Y-%m-%d'):
+        try:
+            return pc.cast(pc.strptime(strings, format=fmt, unit='s'), pa.date32())
+        except pa.ArrowInvalid:
+            continue
+    raise ValueError(f"Unrecognised date format, e.g. {strings[0]}")
+
+
+def to_typed_table(raw):
+    """Convert a table in the raw CSV layout to ADMISSIONS_SCHEMA."""
+    vdate = _parse_dates(raw['vdate'])
+    rcount = pc.cast(pc.replace_substring(pc.cast(raw['rcount'], pa.string()), '+', ''), pa.int8())
+    columns = {
+        'eid': pc.cast(raw['eid'], pa.int64()),
+        'vdate': vdate,
+        'rcount': pc.min_element_wise(rcount, pa.scalar(5, pa.int8())),
+        'gender': pc.utf8_upper(pc.utf8_trim_whitespace(raw['gender'])),
+    }
+    for c in COMORBIDITY_COLS:
+        columns[c] = pc.not_equal(raw[c], 0)
+    for c in LAB_COLS:
+        columns[c] = pc.cast(raw[c], pa.float64())
+    columns['secondarydiagnosisnonicd9'] = pc.cast(raw['secondarydiagnosisnonicd9'], pa.int8())
+    columns['discharged'] = _parse_dates(raw['discharged'])
+    columns['facid'] = pc.utf8_upper(pc.utf8_trim_whitespace(pc.cast(raw['facid'], pa.string())))
+    columns['lengthofstay'] = pc.cast(raw['lengthofstay'], pa.int16())
+    columns['admission_month'] = pc.cast(pc.month(vdate), pa.int8())
+    columns['admission_dayofweek'] = pc.cast(pc.day_of_week(vdate), pa.int8())
+    columns['admission_quarter'] = pc.cast(pc.quarter(vdate), pa.int8())
+
+    table = pa.table(columns).sort_by([('facid', 'ascending'), ('vdate', 'ascending')])
+    for name in ('gender', 'facid'):
+        table = table.set_column(table.schema.get_field_index(name), name,
+                                 pc.dictionary_encode(table[name]))
+    return table.select(ADMISSIONS_SCHEMA.names).cast(ADMISSIONS_SCHEMA)
+
+
+def convert_csv(csv_path, parquet_path=ADMISSIONS_PATH, compression='zstd', row_group_size=ROW_GROUP_SIZE):
+    """Convert the raw admissions CSV to typed Parquet; returns the row count."""
+    table = to_typed_table(_read_raw_csv(csv_path))
+    pq.write_table(table, parquet_path, compression=compression,
+                   row_group_size=row_group_size, write_statistics=True)
+    return table.num_rows
+
+
+def admission_filter(facility=None, months=None, start=None, end=None):
+    """Build a pushdown predicate from the common cohort filters.
+
+    `facility` is a letter or a list of letters, `months` an inclusive
+    (first, last) pair, and `start`/`end` bound the visit date.
+    """
+    expr = None
+
+    def both(a, b):
+        return b if a is None else a & b
+
+    if facility is not None:
+        facilities = [facility] if isinstance(facility, str) else list(facility)
+        expr = both(expr, ds.field('facid').isin(facilities))
+    if months is not None:
+        first, last = months
+        expr = both(expr, (ds.field('admission_month') >= first) & (ds.field('admission_month') <= last))
+    if start is not None:
+        expr = both(expr, ds.field('vdate') >= pa.scalar(pd.Timestamp(start).date(), pa.date32()))
+    if end is not None:
+        expr = both(expr, ds.field('vdate') <= pa.scalar(pd.Timestamp(end).date(), pa.date32()))
+    return expr
+
+
+def read_admissions(path=ADMISSIONS_PATH, columns=None, facility=None, months=None,
+                    start=None, end=None, filter=None):
+    """Read only the requested columns and rows of an admissions Parquet file.
+
+    Flags come back as bool, gender/facid as categoricals and dates as
+    datetime64. Extra pyarrow dataset expressions can be passed as `filter`.
+    """
+    expr = admission_filter(facility, months, start, end)
+    if filter is not None:
+        expr = filter if expr is None else expr & filter
+    table = ds.dataset(path, format='parquet').to_table(columns=columns, filter=expr)
+    return table.to_pandas(date_as_object=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert and query columnar admission data.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    convert = sub.add_parser('convert', help="Convert the raw CSV to typed Parquet")
+    convert.add_argument('csv')
+    convert.add_argument('parquet', nargs='?', default=str(ADMISSIONS_PATH))
+
+    inspect = sub.add_parser('inspect', help="Read a projection/filter and report its size")
+    inspect.add_argument('parquet', nargs='?', default=str(ADMISSIONS_PATH))
+    inspect.add_argument('--columns', nargs='+')
+    inspect.add_argument('--facility', nargs='+')
+    inspect.add_argument('--months', nargs=2, type=int)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == 'convert':
+        rows = convert_csv(args.csv, args.parquet)
+        print(f"Wrote {rows:,} rows to {args.parquet} in {time.perf_counter() - started:.2f}s")
+    else:
+        frame = read_admissions(args.parquet, args.columns, args.facility, args.months)
+        elapsed = time.perf_counter() - started
+        print(f"{len(frame):,} rows x {frame.shape[1]} columns, "
+              f"{frame.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory, read in {elapsed * 1000:.0f} ms")
+        print(frame.dtypes.value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
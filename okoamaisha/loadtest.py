@@ -0,0 +1,399 @@
+"""
+Concurrent-user load test for the app and the scoring service
+
+`app` opens N concurrent sessions against a running Streamlit app over its
+websocket, exactly as browsers do. Each simulated clinician signs in, then
+repeatedly fills the Home page number inputs, presses PREDICT and visits
+Overview and Model Performance. `api` runs N concurrent keep-alive clients
+against the scoring service, posting single patients to /predict and a
+share of batch payloads to /predict/batch. `beds` connects N bed-board
+displays to /beds/stream while a producer re-scores a census, and reports
+how long deltas take to reach the displays and how many bytes each received.
+
+Each concurrency level reports throughput, latency percentiles per step and
+the peak resident memory of the target process (`--pid`, or the process
+started with `--spawn`), so worker counts can be sized and the point where
+one Streamlit process with its `st.cache_resource` model saturates shows up
+as rising latency at flat throughput.
+
+Usage:
+    python -m okoamaisha.loadtest app --spawn --users 1 4 16 --user alice --password ...
+    python -m okoamaisha.loadtest api --spawn --clients 1 8 32 --batch-share 0.1
+    python -m okoamaisha.loadtest beds --spawn --displays 100 500 --census 2000 --rescores 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from okoamaisha.memory import rss_mb
+from okoamaisha.synthetic import synthetic_inputs
+
+APP_PATH = Path(__file__).resolve().parent.parent / 'app.py'
+
+# Pages a clinician visits after each prediction
+CLINICIAN_PAGES = ["📊 Overview", "📈 Model Performance"]
+
+
+class MemorySampler:
+    """Peak RSS of one process, sampled while a load level runs."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._task = None
+
+    async def _run(self):
+        while True:
+            mb = rss_mb(self.pid)
+            if mb is not None:
+                self.peak = max(self.peak or 0.0, mb)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        if self.pid:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        if self._task:
+            self._task.cancel()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, step, seconds):
+        self.latencies[step].append(seconds)
+
+    def report(self, elapsed, memory_mb):
+        count = sum(len(v) for v in self.latencies.values())
+        memory = f", peak RSS {memory_mb:,.0f} MB" if memory_mb else ""
+        print(f"  {count:,} steps in {elapsed:.1f}s = {count / elapsed:,.1f}/s{memory}")
+        for step, values in self.latencies.items():
+            p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+            errors = f" ({self.errors[step]} errors)" if self.errors[step] else ""
+            print(f"  {step:>22}: n={len(values):5d}  p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  p99 {p99:8.1f} ms{errors}")
+
+
+class StreamlitSession:
+    """One browser session driven over the Streamlit websocket protocol."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/').replace('http', 'ws', 1) + '/_stcore/stream'
+        self.widgets = {}
+        # Values the user has set; resent on every rerun like the browser does
+        self.values = {}
+        self._ws = None
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+        self._ws = await connect(self.url, max_size=None)
+
+    async def close(self):
+        await self._ws.close()
+
+    async def rerun(self, trigger=None):
+        """Rerun the script with the current values (plus one button press); returns (seconds, errors)."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.page_script_hash = ''
+        for widget_id, (field, value) in self.values.items():
+            state = msg.rerun_script.widget_states.widgets.add(id=widget_id)
+            setattr(state, field, value)
+        if trigger:
+            msg.rerun_script.widget_states.widgets.add(id=trigger, trigger_value=True)
+
+        started = time.perf_counter()
+        await self._ws.send(msg.SerializeToString())
+        widgets, errors = {}, 0
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self._ws.recv())
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                name = element.WhichOneof('type')
+                errors += name == 'exception'
+                proto = getattr(element, name)
+                if getattr(proto, 'id', '') and getattr(proto, 'label', ''):
+                    widgets[proto.label] = (name, proto)
+            # st.rerun() ends a run early and the server starts the next one itself
+            elif kind == 'script_finished' and \
+                    forward.script_finished != ForwardMsg.ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN:
+                break
+        self.widgets = widgets
+        return time.perf_counter() - started, errors
+
+    def set(self, label, field, value):
+        self.values[self.widgets[label][1].id] = (field, value)
+
+    def button(self, label):
+        return self.widgets[label][1].id
+
+    def fill_number_inputs(self, rng):
+        """Random in-range values for every number input on the page."""
+        for label, (name, proto) in self.widgets.items():
+            if name != 'number_input' or not (proto.has_min and proto.has_max):
+                continue
+            if proto.data_type == proto.DataType.INT:
+                self.set(label, 'int_value', rng.randint(int(proto.min), int(proto.max)))
+            else:
+                self.set(label, 'double_value', round(rng.uniform(proto.min, proto.max), 1))
+
+
+async def clinician(url, user, password, rounds, think_seconds, recorder, seed):
+    rng = random.Random(seed)
+    session = StreamlitSession(url)
+    await session.connect()
+    try:
+        seconds, _ = await session.rerun()
+        recorder.add('open app', seconds)
+        session.set('Username', 'string_value', user)
+        session.set('Password', 'string_value', password)
+        seconds, errors = await session.rerun(trigger=session.button('🔐 Sign In'))
+        recorder.add('sign in', seconds)
+        if 'Navigation' not in session.widgets:
+            recorder.errors['sign in'] += 1
+            return
+        session.values.clear()
+
+        for _ in range(rounds):
+            session.set('Navigation', 'string_value', "🏠 Home")
+            seconds, errors = await session.rerun()
+            recorder.add('home', seconds)
+            recorder.errors['home'] += errors
+            await asyncio.sleep(rng.expovariate(1 / think_seconds) if think_seconds else 0)
+
+            session.fill_number_inputs(rng)
+            seconds, errors = await session.rerun(trigger=session.button('🚀 PREDICT LENGTH OF STAY'))
+            recorder.add('predict', seconds)
+            recorder.errors['predict'] += errors
+
+            for page in CLINICIAN_PAGES:
+                await asyncio.sleep(rng.expovariate(1 / think_seconds) if think_seconds else 0)
+                session.set('Navigation', 'string_value', page)
+                seconds, errors = await session.rerun()
+                recorder.add(page.split(' ', 1)[1].lower(), seconds)
+                recorder.errors[page.split(' ', 1)[1].lower()] += errors
+    finally:
+        await session.close()
+
+
+async def run_app_level(url, users, args, pid):
+    recorder = Recorder()
+    started = time.perf_counter()
+    with MemorySampler(pid) as memory:
+        await asyncio.gather(*(clinician(url, args.user, args.password, args.rounds, args.think,
+                                         recorder, seed) for seed in range(users)))
+    recorder.report(time.perf_counter() - started, memory.peak)
+
+
+async def http_request(reader, writer, method, path, payload):
+    body = json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: loadtest\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def api_client(host, port, patients, requests, batch_share, batch_size, recorder, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            if rng.random() < batch_share:
+                step, path = f'batch x{batch_size}', '/predict/batch'
+                payload = {'patients': rng.sample(patients, batch_size)}
+            else:
+                step, path, payload = 'single', '/predict', rng.choice(patients)
+            started = time.perf_counter()
+            status = await http_request(reader, writer, 'POST', path, payload)
+            recorder.add(step, time.perf_counter() - started)
+            recorder.errors[step] += status != 200
+    finally:
+        writer.close()
+
+
+async def run_api_level(url, clients, args, patients, pid):
+    host, _, port = url.split('://', 1)[-1].rstrip('/').partition(':')
+    recorder = Recorder()
+    started = time.perf_counter()
+    with MemorySampler(pid) as memory:
+        await asyncio.gather(*(api_client(host, int(port or 80), patients, args.requests, args.batch_share,
+                                          args.batch_size, recorder, seed) for seed in range(clients)))
+    recorder.report(time.perf_counter() - started, memory.peak)
+
+
+async def bed_display(host, port, facility, recorder, totals):
+    reader, writer = await asyncio.open_connection(host, port)
+    path = '/beds/stream' + (f'?facility={facility}' if facility else '')
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: loadtest\r\nAccept: text/event-stream\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    event = None
+    try:
+        while line := await reader.readline():
+            totals['bytes'] += len(line)
+            if line.startswith(b'event: '):
+                event = line[7:].strip().decode()
+            elif line.startswith(b'data: '):
+                payload = json.loads(line[6:])
+                totals[event] += 1
+                if event == 'delta':
+                    recorder.add('delta delivery', time.time() - payload['t'])
+                    totals['rows'] += len(payload['u']) + len(payload['d'])
+    finally:
+        writer.close()
+
+
+async def run_beds_level(url, displays, args, patients, pid):
+    host, _, port = url.split('://', 1)[-1].rstrip('/').partition(':')
+    port = int(port or 80)
+    recorder, totals = Recorder(), defaultdict(int)
+    facilities = [None, 'A', 'B', 'C', 'D', 'E']
+    # Admit the census first, so displays connect to a full board
+    reader, writer = await asyncio.open_connection(host, port)
+    for i in range(0, len(patients), 1000):
+        await http_request(reader, writer, 'POST', '/predict/batch', {'patients': patients[i:i + 1000]})
+    writer.close()
+    await asyncio.sleep(0.5)
+    tasks = [asyncio.create_task(bed_display(host, port, facilities[i % len(facilities)], recorder, totals))
+             for i in range(displays)]
+    await asyncio.sleep(1.0)
+
+    rng = random.Random(0)
+    started = time.perf_counter()
+    with MemorySampler(pid) as memory:
+        reader, writer = await asyncio.open_connection(host, port)
+        for _ in range(args.rounds):
+            batch = [dict(patient, glucose=round(patient['glucose'] * rng.uniform(0.8, 1.2), 1))
+                     for patient in rng.sample(patients, args.rescores)]
+            sent = time.perf_counter()
+            status = await http_request(reader, writer, 'POST', '/predict/batch', {'patients': batch})
+            recorder.add(f'rescore x{args.rescores}', time.perf_counter() - sent)
+            recorder.errors[f'rescore x{args.rescores}'] += status != 200
+            await asyncio.sleep(args.interval)
+        writer.close()
+        await asyncio.sleep(1.0)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    recorder.report(time.perf_counter() - started, memory.peak)
+    print(f"  {totals['snapshot']:,} snapshots, {totals['delta']:,} deltas ({totals['rows']:,} rows), "
+          f"{totals['bytes'] / displays / 1024:,.1f} KB per display")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn(target):
+    """Start the app or the scoring service on a free port; returns (process, url)."""
+    port = _free_port()
+    if target == 'app':
+        command = [sys.executable, '-m', 'streamlit', 'run', str(APP_PATH), '--server.headless', 'true',
+                   '--server.port', str(port), '--browser.gatherUsageStats', 'false']
+    else:
+        command = [sys.executable, '-m', 'okoamaisha.server', '--port', str(port)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=APP_PATH.parent, env=os.environ.copy())
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.25)
+    process.kill()
+    raise RuntimeError(f"{target} did not start listening on port {port}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app or the scoring service.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    app = sub.add_parser('app', help="Concurrent clinician sessions against the Streamlit app")
+    app.add_argument('--url', default='http://127.0.0.1:8501')
+    app.add_argument('--users', type=int, nargs='+', default=[1, 4, 16])
+    app.add_argument('--rounds', type=int, default=3, help="Predict-and-browse rounds per clinician")
+    app.add_argument('--think', type=float, default=0.5, help="Mean think time between steps (s)")
+    app.add_argument('--user', required=True)
+    app.add_argument('--password', default=os.environ.get('OKOA_LOADTEST_PASSWORD'),
+                     help="Default: $OKOA_LOADTEST_PASSWORD")
+    api = sub.add_parser('api', help="Concurrent clients against the scoring service")
+    api.add_argument('--url', default='http://127.0.0.1:8600')
+    api.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    api.add_argument('--requests', type=int, default=200, help="Requests per client")
+    api.add_argument('--batch-share', type=float, default=0.1)
+    api.add_argument('--batch-size', type=int, default=100)
+    beds = sub.add_parser('beds', help="Bed-board displays on the scoring service's event stream")
+    beds.add_argument('--url', default='http://127.0.0.1:8600')
+    beds.add_argument('--displays', type=int, nargs='+', default=[100, 500])
+    beds.add_argument('--census', type=int, default=2000, help="Patients on the boards")
+    beds.add_argument('--rescores', type=int, default=50, help="Patients re-scored per round")
+    beds.add_argument('--rounds', type=int, default=40)
+    beds.add_argument('--interval', type=float, default=0.1, help="Seconds between rounds")
+    for command in (app, api, beds):
+        command.add_argument('--spawn', action='store_true', help="Start the target on a free port for the run")
+        command.add_argument('--pid', type=int, default=None, help="Target process to sample memory from")
+    args = parser.parse_args(argv)
+    if args.command == 'app' and not args.password:
+        parser.error("--password or OKOA_LOADTEST_PASSWORD is required")
+
+    process, url, pid = None, args.url, args.pid
+    if args.spawn:
+        process, url = spawn(args.command)
+        pid = process.pid
+    try:
+        if args.command == 'app':
+            for users in args.users:
+                print(f"{users} concurrent clinician(s), {args.rounds} round(s) each -> {url}")
+                asyncio.run(run_app_level(url, users, args, pid))
+        elif args.command == 'beds':
+            census = synthetic_inputs(args.census).assign(eid=np.arange(1, args.census + 1))
+            patients = census.to_dict('records')
+            for displays in args.displays:
+                print(f"{displays} bed-board display(s), {args.rounds} round(s) of {args.rescores} re-scores -> {url}")
+                asyncio.run(run_beds_level(url, displays, args, patients, pid))
+        else:
+            patients = synthetic_inputs(1000).to_dict('records')
+            for clients in args.clients:
+                print(f"{clients} concurrent API client(s), {args.requests} request(s) each -> {url}")
+                asyncio.run(run_api_level(url, clients, args, patients, pid))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Memory accounting for the app process
+
+A `MemoryMonitor` lives in the process (one `st.cache_resource`) and is told
+about every rerun. It keeps the resident set size of the process over time,
+the footprint of each session's `st.session_state` and of the shared caches,
+and flags RSS that keeps rising with the rerun count.
+
+With OKOA_MEMORY_PROFILE=1 it also traces one rerun in every SAMPLE_EVERY:
+tracemalloc starts when that rerun begins and a snapshot is taken when the
+next one begins, so the snapshot holds exactly what the traced rerun left
+alive. Each allocation is charged to its innermost frame in this repository
+(a DataFrame built in app.py is charged to that app.py line, not to pandas).
+Some of that is just the page on screen, so call sites are not flagged on
+their own: when RSS grows, the sites that kept memory alive after
+LEAK_MIN_SAMPLES traced reruns in a row are named as the likely source.
+Tracing with deep tracebacks slows everything in the process, the Streamlit
+server included, which is why it only covers the sampled reruns.
+
+`dump` writes the history as JSON plus the latest snapshot, which
+`python -m okoamaisha.memory diff` compares offline.
+
+Usage:
+    OKOA_MEMORY_PROFILE=1 streamlit run app.py
+    python -m okoamaisha.memory show data/memory/memory-20260101-120000.json
+    python -m okoamaisha.memory diff data/memory/a.tracemalloc data/memory/b.tracemalloc
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.tree._tree import NODE_DTYPE
+
+from okoamaisha.artifacts import DATA_DIR
+
+MEMORY_DUMP_DIR = DATA_DIR / 'memory'
+PROFILE_ENV = 'OKOA_MEMORY_PROFILE'
+
+REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+
+# Deep enough to get from pandas/plotly internals back to app.py
+TRACE_FRAMES = 25
+SAMPLE_EVERY = 25
+MAX_SAMPLES = 500
+FOOTPRINT_SAMPLE = 200
+# Flagged: RSS rising faster than this per rerun over LEAK_MIN_SAMPLES samples
+# (with call sites retaining more than this per traced rerun as suspects), and
+# a session whose state grew by SESSION_GROWTH_BYTES
+LEAK_BYTES_PER_RERUN = 20 * 1024
+LEAK_MIN_SAMPLES = 5
+SESSION_GROWTH_BYTES = 5 * 1024 * 1024
+SESSION_TTL_SECONDS = 3600
+
+
+def rss_mb(pid=None):
+    """Resident memory of a process in MB (Linux /proc), or None."""
+    try:
+        with open(f'/proc/{pid or os.getpid()}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def footprint(obj, seen=None, depth=0, max_depth=6):
+    """Approximate deep size in bytes, counting each object once.
+
+    NumPy and pandas report their buffers directly; fitted sklearn trees
+    report their node and value arrays. Containers longer than
+    FOOTPRINT_SAMPLE items are estimated from an even sample of them.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or depth > max_depth:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            # e.g. a fitted ensemble's estimators_
+            return obj.nbytes + sum(footprint(v, seen, depth + 1) for v in obj.ravel())
+        return obj.nbytes if obj.base is None else 0
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True).sum() if isinstance(obj, pd.DataFrame)
+                   else obj.memory_usage(deep=True))
+    if type(obj).__name__ == 'Tree' and hasattr(obj, 'node_count'):
+        return obj.node_count * NODE_DTYPE.itemsize + obj.value.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (dict, list, tuple, set, frozenset, deque)):
+        # Large containers (the worklist's patients) are extrapolated from an even sample
+        step = max(1, len(obj) // FOOTPRINT_SAMPLE)
+        items = obj.items() if isinstance(obj, dict) else obj
+        sampled = n = 0
+        for item in itertools.islice(items, 0, None, step):
+            sampled += (footprint(item[0], seen, depth + 1) + footprint(item[1], seen, depth + 1)
+                        if isinstance(obj, dict) else footprint(item, seen, depth + 1))
+            n += 1
+        size += sampled * len(obj) // max(1, n)
+    elif hasattr(obj, '__dict__'):
+        size += footprint(vars(obj), seen, depth + 1)
+    return size
+
+
+def call_sites(snapshot, root=REPO_ROOT):
+    """{'file:line': (bytes, blocks)} charging each trace to its innermost frame under `root`."""
+    sites = {}
+    for stat in snapshot.statistics('traceback'):
+        frame = next((f for f in stat.traceback if f.filename.startswith(root)), None)
+        site = (f"{os.path.relpath(frame.filename, root)}:{frame.lineno}" if frame
+                else f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno} (external)")
+        size, count = sites.get(site, (0, 0))
+        sites[site] = (size + stat.size, count + stat.count)
+    return sites
+
+
+def growth_per_rerun(samples, key):
+    """Least-squares bytes per rerun of `key` over the samples, or None."""
+    points = [(s['reruns'], s[key]) for s in samples if s.get(key) is not None]
+    if len(points) < LEAK_MIN_SAMPLES:
+        return None
+    x, y = np.asarray(points, dtype=np.float64).T
+    if np.ptp(x) == 0:
+        return None
+    return float(np.polyfit(x, y, 1)[0])
+
+
+class MemoryMonitor:
+    def __init__(self, profile=None, sample_every=SAMPLE_EVERY):
+        self.profile = os.environ.get(PROFILE_ENV) == '1' if profile is None else profile
+        self.sample_every = sample_every
+        self.reruns = 0
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self.windows = deque(maxlen=MAX_SAMPLES)
+        self.sessions = {}
+        self.caches = {}
+        self.cache_bytes = {}
+        self.sites = {}
+        self.site_streaks = {}
+        self.snapshot = None
+        self.started = time.time()
+        self._window = None
+        self._lock = threading.Lock()
+
+    def register_cache(self, name, obj):
+        """Track a shared object (e.g. an st.cache_resource value) by name.
+
+        It is measured when registered and by `measure_caches`, not on
+        every page view: walking the worklist takes a while.
+        """
+        if self.caches.get(name) is not obj:
+            self.caches[name] = obj
+            self.cache_bytes[name] = footprint(obj)
+
+    def measure_caches(self):
+        for name, obj in list(self.caches.items()):
+            self.cache_bytes[name] = footprint(obj)
+
+    def record_rerun(self, session_id, session_state):
+        """Account one rerun of `session_id`; samples every `sample_every` reruns."""
+        size = footprint(dict(session_state))
+        now = time.time()
+        with self._lock:
+            self.reruns += 1
+            session = self.sessions.setdefault(session_id, {'first_seen': now, 'reruns': 0,
+                                                            'first_bytes': size, 'peak_bytes': size})
+            session.update(last_seen=now, reruns=session['reruns'] + 1, bytes=size,
+                           peak_bytes=max(session['peak_bytes'], size))
+            for stale in [s for s, info in self.sessions.items() if now - info['last_seen'] > SESSION_TTL_SECONDS]:
+                del self.sessions[stale]
+            window, self._window = self._window, None
+            due = self.reruns == 1 or self.reruns % self.sample_every == 0
+        if window is not None:
+            self._close_window(window)
+        if due:
+            self.sample()
+            if self.profile and self.reruns > 1:
+                self._open_window()
+
+    def _open_window(self):
+        if tracemalloc.is_tracing():
+            # Someone else is tracing (e.g. python -X tracemalloc); leave them to it
+            return
+        tracemalloc.start(TRACE_FRAMES)
+        with self._lock:
+            self._window = self.reruns
+
+    def _close_window(self, opened_at):
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sites = call_sites(snapshot)
+        with self._lock:
+            self.snapshot, self.sites = snapshot, sites
+            self.site_streaks = {site: self.site_streaks.get(site, 0) + 1
+                                 for site, (size, _) in sites.items() if size > LEAK_BYTES_PER_RERUN}
+            self.windows.append({'time': time.time(), 'reruns': opened_at, 'retained_bytes': retained,
+                                 'peak_bytes': peak})
+
+    def sample(self):
+        """Record the process RSS now."""
+        sample = {'time': time.time(), 'reruns': self.reruns, 'rss_mb': rss_mb(), 'sessions': len(self.sessions)}
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def session_table(self):
+        rows = [{'session': sid[:8], 'reruns': s['reruns'], 'kb': s['bytes'] / 1024,
+                 'peak_kb': s['peak_bytes'] / 1024, 'growth_kb': (s['bytes'] - s['first_bytes']) / 1024,
+                 'idle_s': time.time() - s['last_seen'],
+                 'flagged': s['bytes'] - s['first_bytes'] > SESSION_GROWTH_BYTES}
+                for sid, s in list(self.sessions.items())]
+        return pd.DataFrame(rows, columns=['session', 'reruns', 'kb', 'peak_kb', 'growth_kb', 'idle_s', 'flagged'])
+
+    def cache_table(self):
+        return pd.DataFrame([{'cache': name, 'mb': size / 1e6} for name, size in self.cache_bytes.items()],
+                            columns=['cache', 'mb'])
+
+    def site_table(self, limit=25):
+        """What the last traced rerun left alive, by call site, with how many traced reruns in a row did so."""
+        rows = [{'site': site, 'kb': size / 1024, 'blocks': count, 'streak': self.site_streaks.get(site, 0)}
+                for site, (size, count) in self.sites.items()]
+        table = pd.DataFrame(rows, columns=['site', 'kb', 'blocks', 'streak'])
+        return table.sort_values('kb', ascending=False).head(limit).reset_index(drop=True)
+
+    def leaks(self):
+        """Human-readable growth warnings; empty when nothing is growing."""
+        samples = list(self.samples)
+        warnings = []
+        slope = growth_per_rerun(samples, 'rss_mb')
+        if slope is not None and slope * 1024 * 1024 > LEAK_BYTES_PER_RERUN:
+            warnings.append(f"RSS grows {slope * 1024:.0f} KB per rerun over {len(samples)} samples")
+            suspects = sorted((site for site, streak in self.site_streaks.items() if streak >= LEAK_MIN_SAMPLES),
+                              key=lambda site: -self.sites[site][0])
+            for site in suspects[:5]:
+                warnings.append(f"{site} kept {self.sites[site][0] / 1024:,.0f} KB alive after each of "
+                                f"the last {self.site_streaks[site]} traced reruns")
+        flagged = self.session_table().query('flagged')
+        for row in flagged.itertuples():
+            warnings.append(f"session {row.session} grew {row.growth_kb:,.0f} KB over {row.reruns} reruns")
+        return warnings
+
+    def report(self):
+        return {
+            'pid': os.getpid(),
+            'started': self.started,
+            'profile': self.profile,
+            'reruns': self.reruns,
+            'samples': list(self.samples),
+            'windows': list(self.windows),
+            'sessions': self.session_table().to_dict('records'),
+            'caches': self.cache_table().to_dict('records'),
+            'sites': self.site_table(limit=100).to_dict('records'),
+            'leaks': self.leaks(),
+        }
+
+    def dump(self, directory=MEMORY_DUMP_DIR):
+        """Write the report as JSON and the latest snapshot for offline diffing; returns the JSON path."""
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"memory-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        with open(f'{stem}.json', 'w') as f:
+            json.dump(self.report(), f, indent=2, default=float)
+        if self.snapshot is not None:
+            self.snapshot.dump(f'{stem}.tracemalloc')
+        return f'{stem}.json'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect memory dumps written by the app.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('show', help="Summarize a JSON dump")
+    show.add_argument('dump')
+    diff = sub.add_parser('diff', help="Compare two tracemalloc snapshots by call site")
+    diff.add_argument('before')
+    diff.add_argument('after')
+    diff.add_argument('--top', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        with open(args.dump) as f:
+            report = json.load(f)
+        last = report['samples'][-1] if report['samples'] else {}
+        print(f"pid {report['pid']}: {report['reruns']:,} reruns, {len(report['sessions'])} sessions, "
+              f"RSS {last.get('rss_mb') or 0:,.0f} MB")
+        for cache in report['caches']:
+            print(f"  cache {cache['cache']:<20} {cache['mb']:8.1f} MB")
+        for site in report['sites'][:20]:
+            print(f"  {site['kb']:10,.0f} KB  x{site['streak']:<3} {site['site']}")
+        for warning in report['leaks'] or ["no growth flagged"]:
+            print(f"  ! {warning}")
+    else:
+        before = call_sites(tracemalloc.Snapshot.load(args.before))
+        after = call_sites(tracemalloc.Snapshot.load(args.after))
+        growth = sorted(((after.get(s, (0, 0))[0] - before.get(s, (0, 0))[0], s) for s in set(before) | set(after)),
+                        reverse=True)
+        for delta, site in growth[:args.top]:
+            print(f"  {delta / 1024:+10,.0f} KB  {site}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Asynchronous request micro-batching
+
+Concurrent single-row requests are queued and scored together once the batch
+reaches `max_batch_size` rows or the oldest request has waited `max_delay_ms`.
+Scoring runs in an executor thread, so requests that arrive while a batch is
+being scored simply form the next batch. The delay is only spent once traffic
+is heavy enough to produce multi-row batches: while the previous batch held a
+single row, a lone request is dispatched immediately, so light traffic sees no
+added latency.
+"""
+
+import asyncio
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+# Number of recent queueing delays kept for percentile metrics
+DELAY_WINDOW = 10_000
+
+
+class MicroBatcher:
+    """Collects rows from concurrent callers and scores them as one batch.
+
+    `score_batch` receives a list of rows and must return one result per row,
+    in the same order.
+    """
+
+    def __init__(self, score_batch, max_batch_size=64, max_delay_ms=2.0, executor=None):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.executor = executor
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._last_batch_size = 0
+
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=DELAY_WINDOW)
+        self.score_seconds = 0.0
+        self.requests = 0
+        self.batches = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_delay
+        if self._queue.empty() and self._last_batch_size <= 1:
+            return batch
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self._last_batch_size = len(batch)
+            dispatched = time.perf_counter()
+            self.queue_delays.extend(dispatched - queued for _, _, queued in batch)
+            self.batch_sizes[len(batch)] += 1
+            self.requests += len(batch)
+            self.batches += 1
+
+            rows = [row for row, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.score_batch, rows)
+            except Exception as exc:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            finally:
+                self.score_seconds += time.perf_counter() - dispatched
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def metrics(self):
+        delays_ms = np.asarray(self.queue_delays) * 1000
+        percentiles = (np.percentile(delays_ms, [50, 90, 99]).round(3).tolist()
+                       if len(delays_ms) else [0.0, 0.0, 0.0])
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_delay_ms': self.max_delay * 1000,
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'batch_size_histogram': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'queue_delay_ms': dict(zip(['p50', 'p90', 'p99'], percentiles)),
+            'queue_depth': self._queue.qsize(),
+            'score_seconds': round(self.score_seconds, 4),
+        }
@@ -0,0 +1,79 @@
+"""
+Append-only log of scored admissions
+
+Each prediction is appended as one CSV row with the cohort dimensions it
+belongs to, so aggregates can be maintained incrementally by reading only the
+bytes written since the last refresh.
+"""
+
+import os
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.artifacts import DATA_DIR
+from okoamaisha.features import COMORBIDITY_COLS
+
+PREDICTION_LOG_PATH = DATA_DIR / 'predictions.csv'
+
+LOG_COLUMNS = ['logged_at', 'eid', 'facility', 'admission_month', 'admission_dayofweek',
+               'total_comorbidities', 'rcount', 'predicted_los', 'actual_los']
+
+_write_lock = threading.Lock()
+
+
+def prediction_records(inputs, predictions, eids=None, actuals=None):
+    """Build log rows from model inputs (one patient per row) and predictions."""
+    n = len(inputs)
+    comorbidities = sum(inputs[c].fillna(0).to_numpy().astype(np.int64)
+                        for c in COMORBIDITY_COLS if c in inputs)
+    return pd.DataFrame({
+        'logged_at': np.full(n, round(time.time(), 3)),
+        'eid': np.asarray(eids) if eids is not None else np.full(n, -1),
+        'facility': inputs['facility'].astype(str).to_numpy(),
+        'admission_month': inputs['admission_month'].to_numpy(),
+        'admission_dayofweek': inputs['admission_dayofweek'].to_numpy(),
+        'total_comorbidities': comorbidities if n else np.zeros(0, dtype=np.int64),
+        'rcount': inputs['rcount'].to_numpy(),
+        'predicted_los': np.round(np.asarray(predictions, dtype=np.float64), 4),
+        'actual_los': np.asarray(actuals, dtype=np.float64) if actuals is not None else np.full(n, np.nan),
+    }, columns=LOG_COLUMNS)
+
+
+class PredictionLog:
+    def __init__(self, path=PREDICTION_LOG_PATH):
+        self.path = path
+
+    def append(self, records):
+        if len(records) == 0:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with _write_lock:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            records[LOG_COLUMNS].to_csv(self.path, mode='a', header=new_file, index=False)
+
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def read_since(self, offset=0):
+        """Return (rows appended after byte `offset`, new offset).
+
+        Only whole lines are consumed, so a row that is still being written
+        is picked up by the next call.
+        """
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=LOG_COLUMNS), offset
+        with open(self.path, 'rb') as f:
+            if offset == 0:
+                f.readline()
+                offset = f.tell()
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return pd.DataFrame(columns=LOG_COLUMNS), offset
+        rows = pd.read_csv(BytesIO(data[:end]), names=LOG_COLUMNS, header=None)
+        return rows, offset + end
@@ -0,0 +1,229 @@
+"""
+Discharge-planning reports for a whole ward
+
+One self-contained HTML report per patient with the inputs, predicted stay
+and interval, the resource planning protocol, the clinical risk factors and
+the Length of Stay Comparison chart as inline SVG. Templates are parsed once
+at import; patients are rendered in chunks by a process pool and each chunk
+is written into a single zip as soon as it is ready, so the archive is
+streamed rather than assembled in memory.
+
+Usage:
+    python -m okoamaisha.reports census.csv -o ward_reports.zip --workers 4
+    python -m okoamaisha.reports data/admissions.parquet --facility C
+"""
+
+import argparse
+import html
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from string import Template
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha import clinical
+from okoamaisha.batch_score import read_inputs
+from okoamaisha.features import COMORBIDITY_COLS
+from okoamaisha.scoring import Scorer
+from okoamaisha.validation import validate_batch
+
+REPORT_CHUNK = 50
+
+# Field -> label, in the order the Home page asks for them
+INPUT_LABELS = {
+    'facility': 'Facility', 'admission_month': 'Admission Month', 'admission_dayofweek': 'Day of Week',
+    'gender': 'Gender', 'rcount': 'Readmissions (past 180d)', 'bmi': 'BMI', 'pulse': 'Pulse (bpm)',
+    'respiration': 'Respiration (/min)', 'hematocrit': 'Hematocrit (%)', 'neutrophils': 'Neutrophils (×10³/µL)',
+    'glucose': 'Glucose (mg/dL)', 'sodium': 'Sodium (mEq/L)', 'creatinine': 'Creatinine (mg/dL)',
+    'bloodureanitro': 'BUN (mg/dL)', 'secondarydiagnosisnonicd9': 'Secondary Diagnoses',
+}
+
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+ALERT_COLORS = {'error': '#ef4444', 'warning': '#f59e0b', 'success': '#10b981'}
+
+REPORT_TEMPLATE = Template("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>OkoaMaisha report - $patient_id</title>
+<style>
+body { font-family: Inter, Arial, sans-serif; color: #1e293b; max-width: 860px; margin: 2rem auto; }
+h1 { color: #1e3a8a; } h2 { color: #1e40af; border-bottom: 2px solid #dbeafe; padding-bottom: .3rem; }
+.prediction { background: linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%); color: white;
+              padding: 1.5rem; border-radius: 12px; text-align: center; }
+.prediction h2 { color: white; border: none; font-size: 2.4rem; margin: 0; }
+table { border-collapse: collapse; width: 100%; } td { padding: .3rem .6rem; border-bottom: 1px solid #e2e8f0; }
+.protocol { border-left: 5px solid $protocol_color; background: #f8fafc; padding: .8rem 1.2rem; border-radius: 8px; }
+.risk { background: #fffbeb; border-left: 4px solid #f59e0b; padding: .4rem .8rem; margin: .3rem 0; }
+</style></head>
+<body>
+<h1>🏥 Discharge Planning Report</h1>
+<p>Patient <strong>$patient_id</strong> · generated $generated_at · model $model_name</p>
+<div class="prediction"><h2>$predicted_los days</h2>
+<p>Predicted Length of Stay · ±$mae days confidence interval (95%) · $stay_category stay · risk score $risk_score/100 ($risk_level)</p></div>
+<h2>Patient Inputs</h2>
+<table>$input_rows</table>
+<p><strong>Comorbidities ($comorbidity_count):</strong> $comorbidities</p>
+<h2>📋 Resource Planning Recommendations</h2>
+<div class="protocol"><h3>$protocol_title</h3>$protocol_sections</div>
+<h2>⚠️ Clinical Risk Factors Identified</h2>
+$risk_factors
+<h2>📊 Length of Stay Comparison</h2>
+$chart
+</body></html>
+""")
+
+ROW_TEMPLATE = Template("<tr><td>$label</td><td><strong>$value</strong></td></tr>")
+
+BAR_TEMPLATE = Template(
+    '<rect x="$x" y="$y" width="$width" height="$height" fill="$color" rx="4"/>'
+    '<text x="$cx" y="$ty" text-anchor="middle" font-size="13" fill="#1e293b">$days</text>'
+    '<text x="$cx" y="$ly" text-anchor="middle" font-size="12" fill="#475569">$category</text>')
+
+CHART_TEMPLATE = Template(
+    '<svg xmlns="http://www.w3.org/2000/svg" width="$width" height="$height" viewBox="0 0 $width $height">'
+    '<text x="$half" y="20" text-anchor="middle" font-size="15" fill="#1e3a8a">'
+    'Predicted Stay vs. Category Averages</text>'
+    '<line x1="30" y1="$axis" x2="$axis_end" y2="$axis" stroke="#94a3b8"/>$bars</svg>')
+
+
+def render_chart(predicted_los, width=640, height=320):
+    """The Home page comparison bar chart as an SVG string."""
+    bars = [('Your Patient', predicted_los, '#3b82f6')] + clinical.CATEGORY_AVERAGES
+    top, axis = 40, height - 40
+    scale = (axis - top - 20) / max(max(days for _, days, _ in bars), 1e-9)
+    slot = (width - 60) / len(bars)
+    rendered = []
+    for i, (category, days, color) in enumerate(bars):
+        bar_height = days * scale
+        x = 30 + i * slot + slot * 0.15
+        rendered.append(BAR_TEMPLATE.substitute(
+            x=f"{x:.1f}", y=f"{axis - bar_height:.1f}", width=f"{slot * 0.7:.1f}", height=f"{bar_height:.1f}",
+            color=color, cx=f"{x + slot * 0.35:.1f}", ty=f"{axis - bar_height - 6:.1f}", days=f"{days:.1f}",
+            ly=f"{axis + 18:.1f}", category=category))
+    return CHART_TEMPLATE.substitute(width=width, height=height, half=width // 2, axis=axis,
+                                     axis_end=width - 30, bars=''.join(rendered))
+
+
+def _format_input(field, value):
+    if field == 'gender':
+        return 'Male' if value == 1 else 'Female'
+    if field == 'admission_dayofweek':
+        return DAY_NAMES[int(value)]
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+def render_report(patient, predicted_los, mae, model_name, generated_at):
+    """One patient's report as HTML; `patient` holds the Home page input fields."""
+    comorbidities = [c for c in COMORBIDITY_COLS if patient.get(c)]
+    values = {**patient, 'rcount': int(patient['rcount']), 'total_comorbidities': len(comorbidities)}
+    rules = clinical.evaluate(values, predicted_los).iloc[0]
+    protocol = clinical.PROTOCOLS[clinical.PROTOCOL_KEYS[rules['protocol']]]
+    risks = clinical.risk_factor_messages(rules['risk_factors'], values)
+
+    sections = ''.join(
+        f"<p><strong>{html.escape(heading)}:</strong></p><ul>"
+        + ''.join(f"<li>{html.escape(action)}</li>" for action in actions) + "</ul>"
+        for heading, actions in protocol['sections'])
+    risk_html = ''.join(f'<div class="risk">{html.escape(risk)}</div>' for risk in risks) \
+        or "<p>✅ No major risk factors identified - Standard protocols apply</p>"
+
+    return REPORT_TEMPLATE.substitute(
+        patient_id=html.escape(str(patient['eid'])),
+        generated_at=generated_at,
+        model_name=html.escape(model_name),
+        predicted_los=f"{predicted_los:.1f}",
+        mae=f"{mae:.2f}",
+        stay_category=clinical.STAY_CATEGORIES[rules['stay_category']],
+        risk_score=rules['risk_score'],
+        risk_level=clinical.RISK_LEVELS[rules['risk_level']],
+        input_rows=''.join(ROW_TEMPLATE.substitute(label=label, value=html.escape(_format_input(f, patient[f])))
+                           for f, label in INPUT_LABELS.items() if f in patient),
+        comorbidity_count=len(comorbidities),
+        comorbidities=html.escape(', '.join(comorbidities) or 'None'),
+        protocol_color=ALERT_COLORS[protocol['style']],
+        protocol_title=html.escape(protocol['title']),
+        protocol_sections=sections,
+        risk_factors=risk_html,
+        chart=render_chart(predicted_los),
+    )
+
+
+def _render_chunk(patients, predictions, mae, model_name, generated_at):
+    return [(f"report_{patient['eid']}.html",
+             render_report(patient, prediction, mae, model_name, generated_at).encode('utf-8'))
+            for patient, prediction in zip(patients, predictions)]
+
+
+def write_ward_reports(inputs, predictions, output, metadata, workers=None, chunk=REPORT_CHUNK):
+    """Render a report per row of `inputs` into the zip file `output` (path or file object).
+
+    Returns the number of reports written. With `workers=1` rendering stays
+    in-process, which is faster for a handful of patients.
+    """
+    inputs = inputs.reset_index(drop=True)
+    if 'eid' not in inputs:
+        inputs = inputs.assign(eid=np.arange(1, len(inputs) + 1))
+    patients = inputs.to_dict('records')
+    predictions = np.asarray(predictions, dtype=np.float64).tolist()
+    mae = metadata.get('test_mae', 0.0)
+    model_name = metadata.get('model_name', 'model')
+    generated_at = time.strftime('%Y-%m-%d %H:%M')
+    tasks = [(patients[start:start + chunk], predictions[start:start + chunk], mae, model_name, generated_at)
+             for start in range(0, len(patients), chunk)]
+
+    workers = workers or os.cpu_count() or 1
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        if workers == 1:
+            rendered = (_render_chunk(*task) for task in tasks)
+            for files in rendered:
+                for name, data in files:
+                    archive.writestr(name, data)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # map yields chunks in order as they complete, so writing overlaps rendering
+                for files in pool.map(_render_chunk, *zip(*tasks)):
+                    for name, data in files:
+                        archive.writestr(name, data)
+
+        summary = pd.DataFrame({
+            'eid': inputs['eid'],
+            'facility': inputs['facility'],
+            'predicted_los': np.round(predictions, 2),
+            'stay_category': clinical.stay_category(predictions),
+            'protocol': clinical.protocol_for(predictions),
+        })
+        archive.writestr('summary.csv', summary.to_csv(index=False))
+    return len(patients)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate discharge-planning reports for a ward.")
+    parser.add_argument('input', help="CSV in either input schema, or ingested Parquet")
+    parser.add_argument('-o', '--output', default='ward_reports.zip')
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Default: all cores")
+    parser.add_argument('--facility', default=None, help="Only patients of this facility")
+    parser.add_argument('--model-dir', default=None)
+    args = parser.parse_args(argv)
+
+    raw, inputs = read_inputs(args.input)
+    if 'eid' in raw and 'eid' not in inputs:
+        inputs = inputs.assign(eid=raw['eid'].to_numpy())
+    cleaned, codes = validate_batch(inputs)
+    cleaned = cleaned[codes == 0]
+    if args.facility:
+        cleaned = cleaned[cleaned['facility'] == args.facility.upper()]
+    scorer = Scorer.load(args.model_dir)
+
+    started = time.perf_counter()
+    n = write_ward_reports(cleaned, scorer.predict_frame(cleaned), args.output, scorer.metadata, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {n:,} reports in {elapsed:.2f}s -> {args.output}"
+          + (f" ({np.count_nonzero(codes):,} invalid rows skipped)" if codes.any() else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Per-facility model routing
+
+Facilities A-E are otherwise only five one-hot columns in the global
+ensemble. The router serves small per-facility models next to it, in one of
+two modes recorded in the manifest:
+
+- specialist: a compact ensemble trained on one facility's admissions
+  replaces the global model for that facility
+- residual: the global prediction plus a small ensemble fitted to the global
+  model's residuals at that facility
+
+Facility models are fitted sklearn estimators, pickled one per facility and
+loaded lazily on first use; each is a few hundred KB. A batch is split by
+facility with one stable argsort, each group is scored by its model's own
+`predict`, and results are scattered back into input order. Facilities
+without a model fall back to the global ensemble.
+
+Facility models are trained and compared with the global model on the
+global bundle's split: rows whose eid is in its held-out eids
+(okoamaisha.artifacts.HOLDOUT_FILE) are kept for the comparison, so neither
+model has seen them.
+
+Usage:
+    python -m okoamaisha.router train data/admissions.parquet --mode specialist
+    python -m okoamaisha.router train data/admissions.parquet --holdout-eids test_eids.csv
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor
+
+from okoamaisha.artifacts import ADMISSIONS_PATH, HOLDOUT_FILE, MODEL_DIR, load_holdout_eids, read_eids
+from okoamaisha.features import FACILITIES, from_admissions
+from okoamaisha.ingest import MODEL_INPUT_COLUMNS, read_admissions
+from okoamaisha.scoring import Scorer
+
+FACILITY_MODEL_DIR = MODEL_DIR / 'models' / 'facilities'
+
+MODES = ('specialist', 'residual')
+
+# Facility models are deliberately much smaller than the 150 x depth-5 global model
+DEFAULT_PARAMS = {
+    'specialist': {'n_estimators': 60, 'max_depth': 4, 'learning_rate': 0.2},
+    'residual': {'n_estimators': 20, 'max_depth': 3, 'learning_rate': 0.1},
+}
+
+
+def facility_codes(facility):
+    return pd.Categorical(np.asarray(facility).astype(str), categories=FACILITIES).codes
+
+
+class ModelRouter:
+    def __init__(self, scorer, model_dir=FACILITY_MODEL_DIR):
+        self.scorer = scorer
+        self.model_dir = model_dir
+        self.manifest = {'mode': 'specialist', 'facilities': {}}
+        manifest_path = os.path.join(model_dir, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @property
+    def mode(self):
+        return self.manifest['mode']
+
+    def model_for(self, facility):
+        """Facility model, loaded on first use; None if there is none."""
+        entry = self.manifest['facilities'].get(facility)
+        if entry is None:
+            return None
+        model = self._models.get(facility)
+        if model is None:
+            with self._lock:
+                model = self._models.get(facility)
+                if model is None:
+                    model = joblib.load(os.path.join(self.model_dir, entry['path']))
+                    self._models[facility] = model
+        return model
+
+    def predict_scaled(self, X, facility):
+        """Predict scaled features `X` for rows whose facility letters are `facility`."""
+        n = len(X)
+        out = np.empty(n, dtype=np.float64)
+        codes = facility_codes(facility)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(FACILITIES)))])
+        # Rows with an unknown facility sort first (code -1) and use the global model
+        unknown = int((codes < 0).sum())
+        groups = [(None, order[:unknown])] + [
+            (fac, order[unknown + bounds[i]:unknown + bounds[i + 1]]) for i, fac in enumerate(FACILITIES)]
+
+        fallback = []
+        for fac, rows in groups:
+            if len(rows) == 0:
+                continue
+            model = self.model_for(fac) if fac is not None else None
+            if model is None:
+                fallback.append(rows)
+            elif self.mode == 'residual':
+                out[rows] = self.scorer.model.predict(X[rows]) + model.predict(X[rows])
+            else:
+                out[rows] = model.predict(X[rows])
+        if fallback:
+            rows = np.concatenate(fallback)
+            out[rows] = self.scorer.model.predict(X[rows])
+        return out
+
+    def predict_frame(self, inputs):
+        if len(inputs) == 0:
+            return np.empty(0, dtype=np.float64)
+        X = self.scorer.transform(self.scorer.features(inputs))
+        return self.predict_scaled(X, inputs['facility'].to_numpy())
+
+    def predict_records(self, records):
+        return self.predict_frame(pd.DataFrame.from_records(records))
+
+
+def train_facility_models(admissions, out_dir=FACILITY_MODEL_DIR, mode='specialist', params=None,
+                          holdout_eids=None, seed=42, scorer=None, model_dir=None):
+    """Fit one small ensemble per facility and write them with a manifest.
+
+    `admissions` is a frame in the dataset schema including eid and
+    lengthofstay. Rows whose eid is in `holdout_eids` (default: the global
+    bundle's recorded split) are kept out of training and used to compare
+    each facility model with the global model; raises ValueError when the
+    bundle recorded no split.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    if holdout_eids is None:
+        holdout_eids = load_holdout_eids(model_dir)
+        if holdout_eids is None:
+            raise ValueError(f"the global model bundle has no {HOLDOUT_FILE}, so its training rows are unknown "
+                             f"and the comparison would favour it; pass --holdout-eids or retrain with "
+                             f"okoamaisha.tuning")
+    scorer = scorer or Scorer.load(model_dir)
+    params = {**DEFAULT_PARAMS[mode], **(params or {})}
+
+    inputs = from_admissions(admissions)
+    y = admissions['lengthofstay'].to_numpy(dtype=np.float64)
+    X = scorer.transform(scorer.features(inputs))
+    global_pred = scorer.model.predict(X)
+    facility = inputs['facility'].to_numpy()
+    test = np.isin(admissions['eid'].to_numpy(), holdout_eids)
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {'mode': mode, 'params': params, 'trained_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'facilities': {}}
+    for fac in FACILITIES:
+        rows = facility == fac
+        train, held = rows & ~test, rows & test
+        if train.sum() < 50:
+            continue
+        target = y if mode == 'specialist' else y - global_pred
+        model = GradientBoostingRegressor(random_state=seed, **params).fit(X[train], target[train])
+        path = os.path.join(out_dir, f'{fac}.pkl')
+        joblib.dump(model, path)
+
+        pred = model.predict(X[held]) if held.any() else np.empty(0)
+        if mode == 'residual':
+            pred = pred + global_pred[held]
+        manifest['facilities'][fac] = {
+            'path': f'{fac}.pkl',
+            'train_rows': int(train.sum()),
+            'holdout_rows': int(held.sum()),
+            'holdout_mae': float(np.abs(pred - y[held]).mean()) if held.any() else None,
+            'global_holdout_mae': float(np.abs(global_pred[held] - y[held]).mean()) if held.any() else None,
+            'n_trees': int(model.n_estimators_),
+            'nbytes': os.path.getsize(path),
+        }
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and inspect per-facility models.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    train = sub.add_parser('train', help="Train facility models from ingested admissions")
+    train.add_argument('data', nargs='?', default=str(ADMISSIONS_PATH))
+    train.add_argument('--mode', choices=MODES, default='specialist')
+    train.add_argument('--out', default=str(FACILITY_MODEL_DIR))
+    train.add_argument('--n-estimators', type=int)
+    train.add_argument('--max-depth', type=int)
+    train.add_argument('--model-dir', default=None, help="Global model bundle")
+    train.add_argument('--holdout-eids', default=None,
+                       help=f"CSV or .npy of eids held out of training (default: the bundle's {HOLDOUT_FILE})")
+    args = parser.parse_args(argv)
+
+    params = {k: v for k, v in [('n_estimators', args.n_estimators), ('max_depth', args.max_depth)] if v}
+    holdout_eids = None if args.holdout_eids is None else read_eids(args.holdout_eids)
+    admissions = read_admissions(args.data, columns=MODEL_INPUT_COLUMNS + ['lengthofstay'])
+    try:
+        manifest = train_facility_models(admissions, args.out, args.mode, params, holdout_eids,
+                                         model_dir=args.model_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    for fac, entry in manifest['facilities'].items():
+        mae = "n/a" if entry['holdout_mae'] is None else \
+            f"{entry['holdout_mae']:.3f} (global {entry['global_holdout_mae']:.3f})"
+        print(f"Facility {fac}: {entry['n_trees']} trees, {entry['nbytes'] / 1e3:.0f} KB, "
+              f"{entry['holdout_rows']:,} held-out rows, MAE {mae}")
+
+
+if __name__ == '__main__':
+    main()
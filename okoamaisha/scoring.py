@@ -0,0 +1,42 @@
+"""
+Batch scoring through the existing scaler + model
+"""
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.artifacts import load_artifacts
+from okoamaisha.features import COMORBIDITY_COLS, engineer_batch, to_model_input
+
+
+class Scorer:
+    """Loaded model artifacts plus the batch prediction path."""
+
+    def __init__(self, model, scaler, feature_names, metadata):
+        self.model = model
+        self.scaler = scaler
+        self.feature_names = feature_names
+        self.metadata = metadata
+        self.comorbidity_cols = metadata.get('comorbidity_cols', COMORBIDITY_COLS)
+
+    @classmethod
+    def load(cls, model_dir=None):
+        return cls(*load_artifacts(model_dir))
+
+    def features(self, inputs):
+        return engineer_batch(inputs, self.feature_names, self.comorbidity_cols)
+
+    def transform(self, features):
+        """Scaled float64 model input for an engineered feature matrix."""
+        return self.scaler.transform(to_model_input(features))
+
+    def predict_features(self, features):
+        return self.model.predict(self.transform(features))
+
+    def predict_frame(self, inputs):
+        if len(inputs) == 0:
+            return np.empty(0, dtype=np.float64)
+        return self.predict_features(self.features(inputs))
+
+    def predict_records(self, records):
+        return self.predict_frame(pd.DataFrame.from_records(records))
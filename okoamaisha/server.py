@@ -0,0 +1,316 @@
+"""
+Local scoring service
+
+A small asyncio HTTP/1.1 JSON server in front of the model. Single-patient
+requests go through a MicroBatcher so concurrent clients share one
+`scaler.transform` + `model.predict` call; batch payloads are scored directly.
+
+Endpoints:
+    POST /predict          one patient (the Home page input fields) -> prediction
+    POST /predict/batch    {"patients": [...]} -> predictions in input order;
+                           rows failing validation get null and an entry in "errors"
+    GET  /worklist         ?k=50&by=predicted_los|risk_score -> top K of the census
+    POST /discharge        {"eids": [...]} -> removes patients from the worklist
+    GET  /beds/stream      ?facility=C -> server-sent snapshot, then deltas of changed beds
+    GET  /beds             ?facility=C -> current beds as JSON
+    GET  /beds/board       a minimal bed-board page fed by /beds/stream
+    GET  /metrics          micro-batching and bed-board metrics
+    GET  /health
+
+Patients sent with an "eid" join the worklist (okoamaisha.worklist) and are
+re-ranked when scored again. Their new predictions are also pushed to the
+connected bed boards (okoamaisha.bedboard). With --shadow, copies of every
+scored request are also scored by candidate models in background processes
+(okoamaisha.shadow).
+
+Usage:
+    python -m okoamaisha.server --port 8600 --max-batch-size 64 --max-delay-ms 2
+    python -m okoamaisha.server --facility-models models/facilities
+    python -m okoamaisha.server --log-predictions
+    python -m okoamaisha.server --shadow models/tuned   # see okoamaisha.shadow
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.bedboard import BOARD_HTML, BedBoard
+from okoamaisha.microbatch import MicroBatcher
+from okoamaisha.prediction_log import PredictionLog, prediction_records
+from okoamaisha.router import ModelRouter
+from okoamaisha.scoring import Scorer
+from okoamaisha.shadow import ShadowScorer
+from okoamaisha.validation import describe_errors, validate_batch
+from okoamaisha.worklist import RANKINGS, Worklist
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON")
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+
+    path, _, query_string = target.partition('?')
+    query = dict(part.partition('=')[::2] for part in query_string.split('&') if part)
+    return Request(method.upper(), path, query, headers, body)
+
+
+def encode_response(status, payload, keep_alive=True):
+    # Handlers return JSON-serializable payloads, or bytes for the bed-board page
+    html = isinstance(payload, bytes)
+    body = payload if html else json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {'text/html; charset=utf-8' if html else 'application/json'}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+def patient_frame(patients):
+    if not all(isinstance(patient, dict) for patient in patients):
+        raise HTTPError(400, "Each patient must be a JSON object")
+    return pd.DataFrame.from_records(patients, index=range(len(patients)))
+
+
+class ScoringServer:
+    def __init__(self, scorer, max_batch_size=64, max_delay_ms=2.0, score_threads=2, router=None,
+                 log=None, shadow=None):
+        self.scorer = scorer
+        # Per-facility models, when configured, score each batch grouped by facility
+        self.router = router
+        self.log = log
+        self.shadow = shadow
+        self.worklist = Worklist()
+        self.board = BedBoard()
+        self.executor = ThreadPoolExecutor(max_workers=score_threads, thread_name_prefix='score')
+        self.batcher = MicroBatcher(self._score_rows, max_batch_size, max_delay_ms, self.executor)
+        self.routes = {
+            ('POST', '/predict'): self.predict,
+            ('POST', '/predict/batch'): self.predict_batch,
+            ('GET', '/worklist'): self.worklist_top,
+            ('POST', '/discharge'): self.discharge,
+            ('GET', '/beds'): self.beds,
+            ('GET', '/beds/board'): self.bed_board_page,
+            ('GET', '/metrics'): self.metrics,
+            ('GET', '/health'): self.health,
+        }
+
+    def _score_rows(self, rows):
+        return (self.router or self.scorer).predict_records(rows).tolist()
+
+    def _record(self, cleaned, predictions):
+        """Log scored rows, put those with an eid on the worklist and hand copies to the shadow models."""
+        if self.log is None and self.shadow is None and 'eid' not in cleaned:
+            return
+        eids = pd.to_numeric(cleaned['eid'], errors='coerce').fillna(-1).to_numpy(np.int64) \
+            if 'eid' in cleaned else None
+        if self.shadow is not None:
+            self.shadow.submit(cleaned, predictions, eids)
+        if self.log is None and eids is None:
+            return
+        records = prediction_records(cleaned, predictions, eids)
+        if self.log is not None:
+            self.log.append(records)
+        if eids is not None:
+            self.worklist.apply(records)
+            self.board.publish(records)
+
+    def _score_batch(self, patients):
+        cleaned, codes = validate_batch(patient_frame(patients))
+        valid = codes == 0
+        predictions = np.full(len(cleaned), np.nan)
+        if valid.any():
+            predictions[valid] = (self.router or self.scorer).predict_frame(cleaned[valid])
+            self._record(cleaned[valid], predictions[valid])
+        errors = {str(i): describe_errors(codes[i]) for i in np.flatnonzero(codes)}
+        return [None if np.isnan(p) else float(p) for p in predictions], errors
+
+    async def predict(self, request):
+        cleaned, codes = validate_batch(patient_frame([request.json()]))
+        if codes[0]:
+            raise HTTPError(422, "Invalid inputs: " + "; ".join(describe_errors(codes[0])))
+        # Submit the cleaned row (defaults filled, facility normalized)
+        prediction = await self.batcher.submit(cleaned.iloc[0].to_dict())
+        # Off the event loop: appending to the prediction log would stall every connection, SSE streams included
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._record, cleaned, [prediction])
+        return 200, {'predicted_los': prediction}
+
+    async def predict_batch(self, request):
+        payload = request.json()
+        patients = payload.get('patients') if isinstance(payload, dict) else payload
+        if not isinstance(patients, list):
+            raise HTTPError(400, "Expected a list of patients or {\"patients\": [...]}")
+        loop = asyncio.get_running_loop()
+        predictions, errors = await loop.run_in_executor(self.executor, self._score_batch, patients)
+        return 200, {'predicted_los': predictions, 'errors': errors}
+
+    async def worklist_top(self, request):
+        by = request.query.get('by', 'predicted_los')
+        if by not in RANKINGS:
+            raise HTTPError(400, f"by must be one of {', '.join(RANKINGS)}")
+        try:
+            k = int(request.query.get('k', 50))
+        except ValueError:
+            raise HTTPError(400, "k must be an integer")
+        top = self.worklist.top(k, by)
+        return 200, {'census': len(self.worklist), 'by': by, 'patients': top.to_dict('records')}
+
+    async def discharge(self, request):
+        payload = request.json()
+        eids = payload.get('eids') if isinstance(payload, dict) else None
+        if not isinstance(eids, list):
+            raise HTTPError(400, "Expected {\"eids\": [...]}")
+        # bool is an int subclass but never an eid
+        if not all(isinstance(eid, int) and not isinstance(eid, bool) for eid in eids):
+            raise HTTPError(400, "Each eid must be an integer")
+        self.board.discharge(eids)
+        return 200, {'discharged': self.worklist.discharge(eids), 'census': len(self.worklist)}
+
+    async def beds(self, request):
+        return 200, self.board.snapshot(request.query.get('facility'))
+
+    async def bed_board_page(self, request):
+        return 200, BOARD_HTML
+
+    async def stream_beds(self, request, writer):
+        try:
+            last_event_id = int(request.headers['last-event-id']) if 'last-event-id' in request.headers else None
+        except ValueError:
+            last_event_id = None
+        await self.board.stream(writer, request.query.get('facility'), last_event_id)
+
+    async def metrics(self, request):
+        metrics = {'microbatch': self.batcher.metrics(), 'beds': self.board.metrics()}
+        if self.shadow is not None:
+            metrics['shadow'] = self.shadow.metrics()
+        return 200, metrics
+
+    async def health(self, request):
+        return 200, {'status': 'ok', 'model': self.scorer.metadata.get('model_name')}
+
+    async def dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                raise HTTPError(405, f"{request.method} not allowed on {request.path}")
+            raise HTTPError(404, f"No route for {request.path}")
+        return await handler(request)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    if (request.method, request.path) == ('GET', '/beds/stream'):
+                        # The connection stays an event stream until the board goes away
+                        await self.stream_beds(request, writer)
+                        break
+                    status, payload = await self.dispatch(request)
+                except HTTPError as exc:
+                    request = None
+                    status, payload = exc.status, {'error': exc.message}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as exc:
+                    status, payload = 500, {'error': str(exc)}
+
+                keep_alive = request is not None and request.headers.get('connection', '').lower() != 'close'
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8600):
+        await self.batcher.start()
+        await self.board.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"OkoaMaisha scoring service on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the local scoring service.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-delay-ms', type=float, default=2.0)
+    parser.add_argument('--score-threads', type=int, default=2)
+    parser.add_argument('--model-dir', default=None)
+    parser.add_argument('--facility-models', default=None,
+                        help="Directory of per-facility models (see okoamaisha.router)")
+    parser.add_argument('--log-predictions', action='store_true',
+                        help="Append scored patients to the prediction log (feeds the app's worklist)")
+    parser.add_argument('--shadow', nargs='+', default=None, metavar='MODEL_DIR',
+                        help="Candidate model bundles to score copies of the traffic with")
+    parser.add_argument('--shadow-workers', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    scorer = Scorer.load(args.model_dir)
+    router = ModelRouter(scorer, args.facility_models) if args.facility_models else None
+    log = PredictionLog() if args.log_predictions else None
+    shadow = ShadowScorer(args.shadow, args.shadow_workers) if args.shadow else None
+    server = ScoringServer(scorer, args.max_batch_size, args.max_delay_ms, args.score_threads, router, log,
+                           shadow)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if shadow is not None:
+            shadow.close()
+
+
+if __name__ == '__main__':
+    main()
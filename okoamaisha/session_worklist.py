@@ -0,0 +1,78 @@
+"""
+Per-session patient list with incremental re-scoring
+
+A ward nurse keeps a few dozen patients in `st.session_state` and edits
+their labs and vitals. Each edit marks only the changed patients dirty;
+`rescore` pushes the dirty rows through feature engineering, the scaler and
+the model as one batch and leaves every other patient's cached prediction
+untouched, so an edit costs one row rather than the whole list.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.clinical import risk_score, stay_category
+from okoamaisha.features import COMORBIDITY_COLS
+from okoamaisha.validation import FIELDS
+
+
+class SessionWorklist:
+    def __init__(self):
+        self.inputs = pd.DataFrame(columns=FIELDS, index=pd.Index([], name='patient'))
+        self.predictions = pd.Series(dtype=np.float64, name='predicted_los')
+        self.scored_at = pd.Series(dtype=np.float64, name='scored_at')
+        self.dirty = set()
+        self.last_rescore = (0, 0.0)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def __contains__(self, patient):
+        return patient in self.inputs.index
+
+    def add(self, patient, inputs):
+        """Add or replace a patient from a Home page input dict."""
+        self.inputs.loc[patient] = pd.Series(inputs).reindex(FIELDS)
+        self.dirty.add(patient)
+
+    def remove(self, patients):
+        self.inputs = self.inputs.drop(index=patients, errors='ignore')
+        self.predictions = self.predictions.drop(index=patients, errors='ignore')
+        self.scored_at = self.scored_at.drop(index=patients, errors='ignore')
+        self.dirty.difference_update(patients)
+
+    def update(self, edited):
+        """Apply edited numeric input columns for some patients; returns the patients that changed."""
+        current = self.inputs.loc[edited.index, edited.columns]
+        # A cleared cell keeps its previous value
+        edited = edited.fillna(current)
+        changed = edited.index[(edited.astype(np.float64) != current.astype(np.float64)).any(axis=1)]
+        self.inputs.loc[changed, edited.columns] = edited.loc[changed]
+        self.dirty.update(changed)
+        return list(changed)
+
+    def rescore(self, predict):
+        """Score only the dirty patients with `predict(frame) -> array`; returns how many."""
+        dirty = [p for p in self.inputs.index if p in self.dirty]
+        started = time.perf_counter()
+        if dirty:
+            batch = self.inputs.loc[dirty].infer_objects()
+            self.predictions = self.predictions.reindex(self.inputs.index)
+            self.predictions.loc[dirty] = predict(batch)
+            self.scored_at = self.scored_at.reindex(self.inputs.index)
+            self.scored_at.loc[dirty] = time.time()
+            self.dirty.clear()
+        self.last_rescore = (len(dirty), time.perf_counter() - started)
+        return len(dirty)
+
+    def table(self):
+        """Inputs with the cached prediction, stay category and risk score per patient."""
+        table = self.inputs.copy()
+        predicted = self.predictions.reindex(table.index).to_numpy(dtype=np.float64)
+        comorbidities = table[COMORBIDITY_COLS].astype(np.int64).sum(axis=1).to_numpy()
+        table.insert(0, 'predicted_los', predicted)
+        table.insert(1, 'stay_category', np.where(np.isnan(predicted), '', stay_category(predicted)))
+        table.insert(2, 'risk_score', risk_score(comorbidities, table['rcount'].astype(np.int64).to_numpy()))
+        return table
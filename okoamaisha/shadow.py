@@ -0,0 +1,246 @@
+"""
+Shadow scoring of candidate models
+
+Before a candidate bundle (for example the output of okoamaisha.tuning)
+replaces `best_model.pkl`, it can score live traffic in the shadow of the
+active model. The scoring service answers every request with the active
+model as before. It then hands a copy of the validated inputs and the
+answer to `ShadowScorer.submit`. That call is a non-blocking put on a
+bounded queue. The copy is pickled by the queue's feeder thread, not the
+request thread, and is shed rather than waited for when the queue is full.
+
+Worker processes, started at a lower CPU priority, drain the queue in
+micro-batches. They score the rows with every candidate and append one row
+per patient and candidate to `data/shadow_log.csv`: both predictions, their
+difference, whether they disagree (more than DISAGREE_DAYS apart, or in
+different stay categories) and the candidate's scoring time.
+
+`report` joins the shadow log with actual LoS as it arrives, taken from
+the prediction log or from a file of finished stays. For each candidate it
+shows the MAE of both models on the same patients and the MAE difference,
+with a paired bootstrap interval.
+
+Usage:
+    python -m okoamaisha.server --shadow models/tuned
+    python -m okoamaisha.shadow report
+    python -m okoamaisha.shadow report --actuals data/admissions.parquet
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.artifacts import DATA_DIR
+from okoamaisha.clinical import stay_category
+from okoamaisha.evaluation import CONFIDENCE, N_RESAMPLES, bootstrap_sums
+from okoamaisha.ingest import read_admissions
+from okoamaisha.prediction_log import PredictionLog
+from okoamaisha.scoring import Scorer
+
+SHADOW_LOG_PATH = DATA_DIR / 'shadow_log.csv'
+
+SHADOW_COLUMNS = ['logged_at', 'candidate', 'eid', 'primary_los', 'shadow_los', 'difference',
+                  'disagree', 'shadow_ms_per_row']
+
+# Predictions further apart than this, or in different stay categories, are disagreements
+DISAGREE_DAYS = 1.0
+
+# Submitted batches waiting for a worker before new ones are shed, and rows scored at once
+QUEUE_BATCHES = 1024
+MAX_BATCH_ROWS = 4096
+
+# Workers yield the CPU to the request path
+WORKER_NICENESS = 19
+
+
+def shadow_records(candidate, primary, shadow, eids, seconds):
+    primary = np.asarray(primary, dtype=np.float64)
+    shadow = np.asarray(shadow, dtype=np.float64)
+    difference = shadow - primary
+    disagree = (np.abs(difference) > DISAGREE_DAYS) | (stay_category(shadow) != stay_category(primary))
+    return pd.DataFrame({
+        'logged_at': np.full(len(primary), round(time.time(), 3)),
+        'candidate': candidate,
+        'eid': eids,
+        'primary_los': np.round(primary, 4),
+        'shadow_los': np.round(shadow, 4),
+        'difference': np.round(difference, 4),
+        'disagree': disagree.astype(np.int8),
+        'shadow_ms_per_row': round(seconds * 1000 / max(len(primary), 1), 4),
+    }, columns=SHADOW_COLUMNS)
+
+
+def _drain(jobs, first):
+    batch = [first]
+    rows = len(first[0])
+    while rows < MAX_BATCH_ROWS:
+        try:
+            item = jobs.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            jobs.put(None)
+            break
+        batch.append(item)
+        rows += len(item[0])
+    return batch
+
+
+def _shadow_worker(candidates, jobs, log_path, niceness):
+    os.nice(niceness)
+    scorers = {name: Scorer.load(path) for name, path in candidates}
+    while True:
+        first = jobs.get()
+        if first is None:
+            return
+        batch = _drain(jobs, first)
+        inputs = pd.concat([item[0] for item in batch], ignore_index=True)
+        primary = np.concatenate([item[1] for item in batch])
+        eids = np.concatenate([item[2] for item in batch])
+        records = []
+        for name, scorer in scorers.items():
+            started = time.perf_counter()
+            try:
+                shadow = scorer.predict_frame(inputs)
+            except Exception:
+                shadow = np.full(len(inputs), np.nan)
+            records.append(shadow_records(name, primary, shadow, eids, time.perf_counter() - started))
+        # One append per batch; O_APPEND keeps concurrent workers' batches whole
+        data = pd.concat(records).to_csv(header=False, index=False).encode()
+        with open(log_path, 'ab') as f:
+            f.write(data)
+
+
+class ShadowScorer:
+    """Scores copies of primary traffic with candidate bundles in background processes.
+
+    `candidates` maps a name to a model directory. Names default to the
+    directory's base name when a list of directories is given.
+    """
+
+    def __init__(self, candidates, workers=1, log_path=SHADOW_LOG_PATH, queue_batches=QUEUE_BATCHES):
+        if not isinstance(candidates, dict):
+            candidates = {Path(path).name: str(path) for path in candidates}
+        self.candidates = candidates
+        self.log_path = str(log_path)
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+            pd.DataFrame(columns=SHADOW_COLUMNS).to_csv(self.log_path, index=False)
+
+        # Spawned, not forked: the parent runs scoring threads and an event loop
+        context = multiprocessing.get_context('spawn')
+        self.jobs = context.Queue(queue_batches)
+        self.workers = [context.Process(target=_shadow_worker, daemon=True,
+                                        args=(list(candidates.items()), self.jobs, self.log_path, WORKER_NICENESS))
+                        for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+        self.stats = Counter()
+
+    def submit(self, inputs, primary, eids=None):
+        """Queue validated model inputs and the active model's predictions; never blocks."""
+        n = len(inputs)
+        if n == 0:
+            return True
+        eids = np.full(n, -1, dtype=np.int64) if eids is None else np.asarray(eids, dtype=np.int64)
+        try:
+            self.jobs.put_nowait((inputs, np.asarray(primary, dtype=np.float64), eids))
+        except queue.Full:
+            self.stats['shed_rows'] += n
+            return False
+        self.stats['queued_rows'] += n
+        return True
+
+    def close(self, timeout=10.0):
+        for _ in self.workers:
+            try:
+                self.jobs.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+    def metrics(self):
+        return {'candidates': list(self.candidates), 'workers': sum(w.is_alive() for w in self.workers),
+                **self.stats}
+
+
+def read_actuals(path=None):
+    """Actual LoS by eid, from a file of finished stays or from the prediction log."""
+    if path is None:
+        rows, _ = PredictionLog().read_since(0)
+        rows = rows[(rows['eid'] >= 0) & rows['actual_los'].notna()]
+        return rows.groupby('eid')['actual_los'].last()
+    if str(path).endswith('.parquet'):
+        frame = read_admissions(path, columns=['eid', 'lengthofstay'])
+    else:
+        frame = pd.read_csv(path, usecols=['eid', 'lengthofstay'])
+    return frame.groupby('eid')['lengthofstay'].last().astype(np.float64)
+
+
+def shadow_report(log_path=SHADOW_LOG_PATH, actuals=None, n_resamples=N_RESAMPLES, confidence=CONFIDENCE):
+    """One row per candidate: agreement with the active model and, where actuals exist, MAE of both."""
+    log = pd.read_csv(log_path)
+    actuals = read_actuals() if actuals is None else actuals
+    tail = (1 - confidence) / 2 * 100
+    rows = []
+    for candidate, shadowed in log.groupby('candidate', sort=False):
+        ms = shadowed['shadow_ms_per_row'].to_numpy()
+        row = {'candidate': candidate, 'scored': len(shadowed),
+               'disagreement': shadowed['disagree'].mean(),
+               'mean_abs_difference': shadowed['difference'].abs().mean(),
+               'shadow_ms_per_row_p50': np.percentile(ms, 50), 'shadow_ms_per_row_p95': np.percentile(ms, 95)}
+
+        # The last score of each finished stay, for both models
+        latest = shadowed[shadowed['eid'] >= 0].groupby('eid').last()
+        actual = actuals.reindex(latest.index)
+        latest = latest[actual.notna().to_numpy()]
+        actual = actual.dropna().to_numpy()
+        row['with_actuals'] = len(latest)
+        if len(latest):
+            primary_error = np.abs(latest['primary_los'].to_numpy() - actual)
+            shadow_error = np.abs(latest['shadow_los'].to_numpy() - actual)
+            paired = (shadow_error - primary_error)[:, None]
+            resampled = bootstrap_sums(paired, n_resamples)[:, 0] / len(paired)
+            lower, upper = np.percentile(resampled, [tail, 100 - tail])
+            row.update(primary_mae=primary_error.mean(), shadow_mae=shadow_error.mean(),
+                       mae_difference=paired.mean(), lower=lower, upper=upper)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare shadow-scored candidate models with the active model.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    report = sub.add_parser('report', help="Agreement and MAE difference per candidate")
+    report.add_argument('--log', default=str(SHADOW_LOG_PATH))
+    report.add_argument('--actuals', default=None,
+                        help="CSV or Parquet with eid and lengthofstay (default: the prediction log)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log):
+        parser.error(f"no shadow log at {args.log}; run the scoring service with --shadow")
+    result = shadow_report(args.log, read_actuals(args.actuals))
+    for row in result.to_dict('records'):
+        print(f"{row['candidate']}: {row['scored']:,} rows shadowed, {row['disagreement']:.1%} disagree, "
+              f"mean |difference| {row['mean_abs_difference']:.2f} days, "
+              f"{row['shadow_ms_per_row_p50']:.3f} ms/row (p95 {row['shadow_ms_per_row_p95']:.3f})")
+        if row['with_actuals']:
+            print(f"  {row['with_actuals']:,} finished stays: MAE active {row['primary_mae']:.3f}, "
+                  f"candidate {row['shadow_mae']:.3f}, difference {row['mae_difference']:+.3f} "
+                  f"({CONFIDENCE:.0%} CI {row['lower']:+.3f} to {row['upper']:+.3f})")
+        else:
+            print("  no finished stays with actual LoS yet")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Compile feature engineering and the fitted ensemble to SQL
+
+Nightly scoring can run inside the admissions database instead of pulling
+rows into Python. `compile_sql` emits two views over a table in the ingested
+admissions schema (see okoamaisha.ingest):
+
+- los_features: the 38 engineered features (threshold flags, comorbidity
+  sum, facility one-hots) computed from raw columns
+- los_predictions: eid plus the ensemble as one CASE expression per tree
+
+The scaler is folded into the trees. Each split `scaled(x) <= threshold` is
+monotone in the raw value, so it is replaced by `x <= cut`, where cut is the
+largest raw value that goes left through exactly the Python path
+(float32 labs, float64 scaling, float32 model input). Leaves carry
+`learning_rate * value` and the trees are summed in order, so SQLite
+reproduces `Scorer.predict_frame` exactly. The SQL sticks to what SQLite
+and DuckDB both accept; tests/test_sql_export.py checks both.
+
+Usage:
+    python -m okoamaisha.sql_export export -o score_los.sql
+    python -m okoamaisha.sql_export load data/admissions.parquet data/admissions.db
+    python -m okoamaisha.sql_export verify data/admissions.parquet --rows 100000
+"""
+
+import argparse
+import sqlite3
+import struct
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor
+
+from okoamaisha.artifacts import ADMISSIONS_PATH, DATA_DIR
+from okoamaisha.features import FACILITIES, FEATURE_DTYPES, from_admissions
+from okoamaisha.ingest import MODEL_INPUT_COLUMNS, read_admissions
+from okoamaisha.scoring import Scorer
+
+ADMISSIONS_DB_PATH = DATA_DIR / 'admissions.db'
+
+# Source columns the views read; the admission date parts are precomputed at ingest
+SQL_INPUT_COLUMNS = MODEL_INPUT_COLUMNS + ['admission_month', 'admission_dayofweek', 'admission_quarter']
+
+# Raw-column SQL for the engineered features; every other feature is a
+# column of the admissions table copied as-is
+LAB_THRESHOLD_FLAGS = {
+    'high_glucose': 'glucose > 140',
+    'low_sodium': 'sodium < 135',
+    'high_creatinine': 'creatinine > 1.3',
+    'low_bmi': 'bmi < 18.5',
+    'high_bmi': 'bmi > 30',
+}
+
+
+def require_gradient_boosting(model, purpose):
+    """Raise TypeError unless `model` is a GradientBoostingRegressor, whose trees `purpose` reads."""
+    if not isinstance(model, GradientBoostingRegressor):
+        raise TypeError(f"{purpose} reads GradientBoostingRegressor trees; this bundle holds a "
+                        f"{type(model).__name__}. Serve a Gradient Boosting bundle, e.g. one from "
+                        f"`python -m okoamaisha.tuning --families gradient_boosting`.")
+
+
+def _feature_sql(name, comorbidity_cols):
+    if name == 'rcount':
+        # rcount is 0-4 or "5+" in the raw data; CASE rather than a two-argument
+        # MIN, which DuckDB and most databases only know as an aggregate
+        count = "CAST(REPLACE(CAST(rcount AS TEXT), '+', '') AS INTEGER)"
+        return f"CASE WHEN {count} > 5 THEN 5 ELSE {count} END"
+    if name == 'gender':
+        return "CAST(UPPER(SUBSTR(CAST(gender AS TEXT), 1, 1)) = 'M' AS INTEGER)"
+    if name in comorbidity_cols:
+        return f"CAST({name} AS INTEGER)"
+    if name == 'total_comorbidities':
+        return " + ".join(f"CAST({c} AS INTEGER)" for c in comorbidity_cols)
+    if name in LAB_THRESHOLD_FLAGS:
+        return f"CAST({LAB_THRESHOLD_FLAGS[name]} AS INTEGER)"
+    if name == 'abnormal_vitals':
+        return ("CAST(pulse < 60 OR pulse > 100 AS INTEGER)"
+                " + CAST(respiration < 12 OR respiration > 20 AS INTEGER)")
+    if name.startswith('facility_') and name[len('facility_'):] in FACILITIES:
+        return f"CAST(UPPER(TRIM(CAST(facid AS TEXT))) = '{name[len('facility_'):]}' AS INTEGER)"
+    return name
+
+
+def _ordered(x):
+    """Map a float64 to an int whose order matches the float order."""
+    bits = struct.unpack('<q', struct.pack('<d', x))[0]
+    return bits if bits >= 0 else -(bits & 0x7FFFFFFFFFFFFFFF)
+
+
+def _unordered(key):
+    bits = key if key >= 0 else (-key) | -0x8000000000000000
+    return struct.unpack('<d', struct.pack('<q', bits))[0]
+
+
+def raw_cut(threshold, mean, scale, is_float32, bound=1e30):
+    """Largest raw value x with float32(scaled(x)) <= threshold, as the model sees it."""
+    def goes_left(x):
+        x64 = np.float64(np.float32(x)) if is_float32 else np.float64(x)
+        return np.float32((x64 - mean) / scale) <= threshold
+
+    lo, hi = _ordered(-bound), _ordered(bound)
+    if not goes_left(_unordered(lo)):
+        return -bound
+    if goes_left(_unordered(hi)):
+        return bound
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if goes_left(_unordered(mid)):
+            lo = mid
+        else:
+            hi = mid
+    return _unordered(lo)
+
+
+def _literal(value):
+    # repr is the shortest decimal that parses back to the same double
+    return repr(float(value))
+
+
+def compile_tree(tree, cuts, feature_names, scale, node=0, indent='    '):
+    if tree.children_left[node] == -1:
+        return _literal(scale * tree.value[node, 0, 0])
+    f = tree.feature[node]
+    left = compile_tree(tree, cuts, feature_names, scale, tree.children_left[node], indent + '  ')
+    right = compile_tree(tree, cuts, feature_names, scale, tree.children_right[node], indent + '  ')
+    return (f"CASE WHEN {feature_names[f]} <= {cuts[(f, tree.threshold[node])]}\n"
+            f"{indent}THEN {left}\n{indent}ELSE {right} END")
+
+
+def compile_sql(scorer=None, table='admissions'):
+    """SQL creating the los_features and los_predictions views over `table`."""
+    scorer = scorer or Scorer.load()
+    model, scaler = scorer.model, scorer.scaler
+    require_gradient_boosting(model, "SQL export")
+    feature_names = list(scorer.feature_names)
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(len(feature_names))
+    scale = scaler.scale_ if scaler.with_std else np.ones(len(feature_names))
+
+    cuts = {}
+    for est in model.estimators_[:, 0]:
+        tree = est.tree_
+        for f, t in zip(tree.feature[tree.children_left != -1], tree.threshold[tree.children_left != -1]):
+            if (f, t) not in cuts:
+                is_float32 = FEATURE_DTYPES.get(feature_names[f]) == np.float32
+                cut = raw_cut(t, mean[f], scale[f], is_float32)
+                cuts[(f, t)] = _literal(cut) if is_float32 else str(int(np.floor(cut)))
+
+    features = ",\n".join(f"    {_feature_sql(name, scorer.comorbidity_cols)} AS {name}"
+                          for name in feature_names)
+    init = float(np.ravel(model.init_.constant_)[0]) if model.init_ != 'zero' else 0.0
+    trees = "\n  + ".join(f"({compile_tree(est.tree_, cuts, feature_names, model.learning_rate)})"
+                          for est in model.estimators_[:, 0])
+    return (f"-- {scorer.metadata.get('model_name', 'model')} trained {scorer.metadata.get('training_date', '')}, "
+            f"{len(model.estimators_)} trees\n"
+            f"DROP VIEW IF EXISTS los_predictions;\nDROP VIEW IF EXISTS los_features;\n\n"
+            f"CREATE VIEW los_features AS\nSELECT\n    eid,\n{features}\nFROM {table};\n\n"
+            f"CREATE VIEW los_predictions AS\nSELECT\n    eid,\n    {_literal(init)}\n  + {trees}\n"
+            f"    AS predicted_los\nFROM los_features;\n")
+
+
+def load_sqlite(admissions, connection, table='admissions'):
+    """Write an admissions frame (ingested schema) to a SQLite table."""
+    frame = admissions.copy()
+    for name in frame.columns:
+        if frame[name].dtype == bool:
+            frame[name] = frame[name].astype(np.int8)
+        elif isinstance(frame[name].dtype, pd.CategoricalDtype):
+            frame[name] = frame[name].astype(str)
+    frame.to_sql(table, connection, if_exists='replace', index=False, chunksize=50_000)
+    return len(frame)
+
+
+def verify(admissions, scorer=None):
+    """Score `admissions` in SQLite and in Python; returns (sql seconds, python seconds, max |diff|, rows differing)."""
+    scorer = scorer or Scorer.load()
+    connection = sqlite3.connect(':memory:')
+    load_sqlite(admissions, connection)
+    connection.executescript(compile_sql(scorer))
+
+    started = time.perf_counter()
+    rows = connection.execute("SELECT eid, predicted_los FROM los_predictions").fetchall()
+    sql_seconds = time.perf_counter() - started
+    sql = dict(rows)
+
+    started = time.perf_counter()
+    python = scorer.predict_frame(from_admissions(admissions))
+    python_seconds = time.perf_counter() - started
+
+    from_sql = np.array([sql[eid] for eid in admissions['eid'].to_numpy().tolist()])
+    diff = np.abs(from_sql - python)
+    return sql_seconds, python_seconds, float(diff.max(initial=0.0)), int((diff > 0).sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the model and its features to SQL.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="Write the CREATE VIEW script")
+    export.add_argument('-o', '--output', default='score_los.sql')
+    export.add_argument('--table', default='admissions')
+    export.add_argument('--model-dir', default=None)
+    load = sub.add_parser('load', help="Copy ingested admissions Parquet into a SQLite table")
+    load.add_argument('data', nargs='?', default=str(ADMISSIONS_PATH))
+    load.add_argument('database', nargs='?', default=str(ADMISSIONS_DB_PATH))
+    load.add_argument('--table', default='admissions')
+    check = sub.add_parser('verify', help="Check SQLite predictions against the Python path")
+    check.add_argument('data', nargs='?', default=str(ADMISSIONS_PATH))
+    check.add_argument('--rows', type=int, default=None)
+    check.add_argument('--model-dir', default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        sql = compile_sql(Scorer.load(args.model_dir), args.table)
+        with open(args.output, 'w') as f:
+            f.write(sql)
+        print(f"Wrote {len(sql) / 1e3:,.0f} KB of SQL -> {args.output}")
+    elif args.command == 'load':
+        with sqlite3.connect(args.database) as connection:
+            n = load_sqlite(read_admissions(args.data), connection, args.table)
+        print(f"Loaded {n:,} admissions -> {args.database}:{args.table}")
+    else:
+        admissions = read_admissions(args.data, columns=SQL_INPUT_COLUMNS)
+        if args.rows and args.rows < len(admissions):
+            admissions = admissions.iloc[:args.rows]
+        sql_s, python_s, max_diff, differ = verify(admissions, Scorer.load(args.model_dir))
+        print(f"{len(admissions):,} rows: SQLite {sql_s:.2f}s, Python {python_s:.2f}s; "
+              f"{differ} rows differ, max |diff| {max_diff:.3g} days")
+        if differ:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
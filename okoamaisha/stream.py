@@ -0,0 +1,342 @@
+"""
+Streaming admission-event scoring
+
+Tails an append-only source of admission events and scores them as they
+arrive. The source is a JSON-lines file, or a spool directory of `*.jsonl`
+files read in name order, standing in for the hospital ADT feed. Each line
+is one admission in the dataset schema (eid, vdate, rcount, gender,
+comorbidity flags, labs, facid).
+
+The pipeline is a chain of generators:
+
+    read_events -> score_batches -> StreamSink.commit
+
+`read_events` yields blocks of at most `batch_rows` whole lines with the
+source position after them. `score_batches` parses, validates and scores
+each block as one vectorized batch. The sink appends the results to a CSV
+and then checkpoints the position. Every stage only runs when the next
+stage asks for more, so a slow sink slows the reader instead of letting
+events pile up in memory. Under light traffic a block holds whatever has
+arrived, so events are not held back to fill a batch.
+
+The checkpoint records the source position together with the size of the
+output it covers. On restart, rows written after the last checkpoint are
+cut off and their events are read again, so no event is scored twice or
+lost. Lines that are not valid JSON, or that fail validation, get a
+non-zero error_code (see okoamaisha.validation) instead of a prediction.
+
+Usage:
+    python -m okoamaisha.stream simulate data/adt_feed.jsonl --events 100000
+    python -m okoamaisha.stream run data/adt_feed.jsonl -o data/stream_predictions.csv
+    python -m okoamaisha.stream run data/adt_spool/ --follow
+"""
+
+import argparse
+import json
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+from okoamaisha.artifacts import DATA_DIR
+from okoamaisha.features import COMORBIDITY_COLS, from_admissions
+from okoamaisha.ingest import LAB_COLS, MODEL_INPUT_COLUMNS
+from okoamaisha.prediction_log import PredictionLog, prediction_records
+from okoamaisha.scoring import Scorer
+from okoamaisha.synthetic import synthetic_admissions
+from okoamaisha.validation import error_summary, validate_batch
+
+STREAM_OUTPUT_PATH = DATA_DIR / 'stream_predictions.csv'
+
+OUTPUT_COLUMNS = ['scored_at', 'eid', 'vdate', 'facility', 'predicted_los', 'error_code']
+
+# Events per scoring batch, and bytes read from the source per pull
+BATCH_ROWS = 8192
+BLOCK_BYTES = 8 << 20
+
+# Seconds between polls of a caught-up source in --follow mode
+POLL_SECONDS = 0.5
+
+STAGES = ['read', 'parse', 'score', 'write']
+
+
+def _source_files(source):
+    if os.path.isdir(source):
+        return sorted(name for name in os.listdir(source) if name.endswith('.jsonl'))
+    return [os.path.basename(source)] if os.path.exists(source) else []
+
+
+def read_events(source, position=None, batch_rows=BATCH_ROWS, block_bytes=BLOCK_BYTES,
+                follow=False, poll_seconds=POLL_SECONDS, timings=None):
+    """Yield (lines, position after them) from a JSON-lines file or spool directory.
+
+    `position` is a (file name, byte offset) pair. Only whole lines are
+    consumed, so a line still being written is picked up by a later pull.
+    Once a later spool file exists, the earlier one is treated as complete.
+    """
+    directory = source if os.path.isdir(source) else os.path.dirname(source)
+    name, offset = position or (None, 0)
+    while True:
+        started = time.perf_counter()
+        files = _source_files(source)
+        if name is None and files:
+            name, offset = files[0], 0
+        later = [f for f in files if name is not None and f > name]
+        data = b''
+        if name is not None:
+            with open(os.path.join(directory, name), 'rb') as f:
+                f.seek(offset)
+                data = f.read(block_bytes)
+                if data and b'\n' not in data and len(data) == block_bytes:
+                    data += f.readline()
+        end = data.rfind(b'\n') + 1
+        if later and len(data) < block_bytes:
+            # A rotated file is complete; an unterminated last line is still a line
+            end = len(data)
+        if timings is not None:
+            timings['read'] += time.perf_counter() - started
+
+        if end:
+            lines = data[:end].split(b'\n')
+            if not lines[-1]:
+                lines.pop()
+            for i in range(0, len(lines), batch_rows):
+                chunk = lines[i:i + batch_rows]
+                offset += sum(len(line) + 1 for line in chunk)
+                yield chunk, (name, offset)
+        elif later:
+            name, offset = later[0], 0
+        elif follow:
+            time.sleep(poll_seconds)
+        else:
+            return
+
+
+def parse_events(lines):
+    """One row per line; lines that are not a JSON object become rows of missing values.
+
+    A clean block is parsed by Arrow in one call. A block with a malformed
+    line, or a field whose type changes between lines, is parsed line by line.
+    """
+    try:
+        table = pa_json.read_json(BytesIO(b'\n'.join(lines)))
+        if table.num_rows == len(lines):
+            return table.to_pandas().reindex(columns=MODEL_INPUT_COLUMNS)
+    except pa.ArrowInvalid:
+        pass
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        records.append(record if isinstance(record, dict) else {})
+    return pd.DataFrame.from_records(records, columns=MODEL_INPUT_COLUMNS)
+
+
+def event_inputs(events):
+    """Model inputs for parsed events; unusable values become missing, so validation rejects them."""
+    raw = events.copy()
+    for c in LAB_COLS + ['secondarydiagnosisnonicd9']:
+        raw[c] = pd.to_numeric(raw[c], errors='coerce')
+    raw['rcount'] = pd.to_numeric(raw['rcount'].astype(str).str.rstrip('+'), errors='coerce')
+    # Comorbidity flags are optional, as in validation.INPUT_SCHEMA
+    for c in COMORBIDITY_COLS:
+        raw[c] = pd.to_numeric(raw[c], errors='coerce').fillna(0)
+    raw['vdate'] = pd.to_datetime(raw['vdate'], errors='coerce', format='mixed')
+    inputs = from_admissions(raw)
+    inputs['gender'] = inputs['gender'].where(raw['gender'].notna())
+    inputs['facility'] = inputs['facility'].where(raw['facid'].notna())
+    return inputs
+
+
+def score_batches(chunks, scorer, timings=None):
+    """Yield (results, valid model inputs, position) for each block of event lines."""
+    timings = timings if timings is not None else dict.fromkeys(STAGES, 0.0)
+    for lines, position in chunks:
+        started = time.perf_counter()
+        events = parse_events(lines)
+        events['vdate'] = pd.to_datetime(events['vdate'], errors='coerce', format='mixed')
+        inputs = event_inputs(events)
+        cleaned, codes = validate_batch(inputs)
+        parsed = time.perf_counter()
+        timings['parse'] += parsed - started
+
+        valid = codes == 0
+        predictions = np.full(len(events), np.nan)
+        if valid.any():
+            predictions[valid] = scorer.predict_frame(cleaned[valid])
+        timings['score'] += time.perf_counter() - parsed
+
+        results = pd.DataFrame({
+            'scored_at': np.full(len(events), round(time.time(), 3)),
+            'eid': pd.to_numeric(events['eid'], errors='coerce').fillna(-1).astype(np.int64).to_numpy(),
+            'vdate': events['vdate'].dt.strftime('%Y-%m-%d'),
+            'facility': inputs['facility'].to_numpy(),
+            'predicted_los': np.round(predictions, 4),
+            'error_code': codes,
+        }, columns=OUTPUT_COLUMNS)
+        yield results, cleaned[valid], position
+
+
+class StreamSink:
+    """Appends scored events to a CSV and checkpoints the source position after each batch."""
+
+    def __init__(self, output=STREAM_OUTPUT_PATH, checkpoint_path=None, log=None):
+        self.output = str(output)
+        self.checkpoint_path = checkpoint_path or f"{self.output}.checkpoint.json"
+        self.log = log
+        self.checkpoint = self._load_checkpoint()
+        self._recover()
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {'file': None, 'offset': 0, 'output_bytes': 0, 'events': 0}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _recover(self):
+        # Rows past the checkpoint belong to events that will be read again
+        if os.path.exists(self.output) and os.path.getsize(self.output) > self.checkpoint['output_bytes']:
+            with open(self.output, 'r+b') as f:
+                f.truncate(self.checkpoint['output_bytes'])
+
+    @property
+    def position(self):
+        return self.checkpoint['file'], self.checkpoint['offset']
+
+    def commit(self, results, inputs, position):
+        os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+        with open(self.output, 'ab') as f:
+            results.to_csv(f, header=f.tell() == 0, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+            output_bytes = f.tell()
+        if self.log is not None:
+            valid = results['error_code'].to_numpy() == 0
+            self.log.append(prediction_records(inputs, results['predicted_los'].to_numpy()[valid],
+                                               results['eid'].to_numpy()[valid]))
+
+        file, offset = position
+        self.checkpoint = {'file': file, 'offset': offset, 'output_bytes': output_bytes,
+                           'events': self.checkpoint['events'] + len(results), 'updated_at': time.time()}
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp, self.checkpoint_path)
+
+
+def run_stream(source, output=STREAM_OUTPUT_PATH, scorer=None, batch_rows=BATCH_ROWS, follow=False,
+               log_predictions=False, report_every=None):
+    """Score every event after the checkpoint; returns throughput stats.
+
+    With `follow`, keeps polling for new events until interrupted, printing
+    a progress line every `report_every` seconds.
+    """
+    scorer = scorer or Scorer.load()
+    sink = StreamSink(output, log=PredictionLog() if log_predictions else None)
+    timings = dict.fromkeys(STAGES, 0.0)
+    stats = {'events': 0, 'scored': 0, 'batches': 0, 'rejected_codes': []}
+    started = last_report = time.perf_counter()
+
+    chunks = read_events(source, sink.position, batch_rows, follow=follow, timings=timings)
+    try:
+        for results, inputs, position in score_batches(chunks, scorer, timings):
+            written = time.perf_counter()
+            sink.commit(results, inputs, position)
+            timings['write'] += time.perf_counter() - written
+            codes = results['error_code'].to_numpy()
+            stats['events'] += len(results)
+            stats['scored'] += int(np.count_nonzero(codes == 0))
+            stats['batches'] += 1
+            stats['rejected_codes'].append(codes[codes != 0])
+            if report_every and time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                elapsed = last_report - started
+                print(f"  {stats['events']:,} events, {stats['events'] / elapsed:,.0f}/s, at {position[0]}:{position[1]:,}")
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.perf_counter() - started
+    stats['rejected_codes'] = (np.concatenate(stats['rejected_codes']) if stats['rejected_codes']
+                               else np.zeros(0, dtype=np.uint64))
+    stats['seconds'] = elapsed
+    stats['events_per_second'] = stats['events'] / elapsed if elapsed else 0.0
+    stats['stage_seconds'] = timings
+    stats['position'] = sink.position
+    return stats
+
+
+def simulate(path, events, rate=0.0, files=1, invalid=0.0, seed=0):
+    """Write synthetic admission events as JSON lines, optionally at `rate` events per second.
+
+    With `files` > 1, `path` is a spool directory and the events are split
+    across that many files. A fraction `invalid` of lines is corrupted to
+    exercise rejection.
+    """
+    raw = synthetic_admissions(events, seed)
+    lines = raw.to_json(orient='records', lines=True).splitlines()
+    rng = np.random.default_rng(seed)
+    for i in np.flatnonzero(rng.random(len(lines)) < invalid):
+        lines[i] = lines[i][:len(lines[i]) // 2] if i % 2 else lines[i].replace('"glucose":', '"glucose":"n/a","_":')
+
+    if files > 1:
+        os.makedirs(path, exist_ok=True)
+        targets = [os.path.join(path, f"adt_{i:05d}.jsonl") for i in range(files)]
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        targets = [path]
+    per_file = -(-len(lines) // len(targets))
+    started = time.perf_counter()
+    for n, target in enumerate(targets):
+        with open(target, 'a') as f:
+            for i in range(n * per_file, min((n + 1) * per_file, len(lines))):
+                f.write(lines[i] + '\n')
+                if rate:
+                    f.flush()
+                    time.sleep(max(0.0, started + (i + 1) / rate - time.perf_counter()))
+    return len(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score admission events as they are appended to a feed.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="Score events after the checkpoint")
+    run.add_argument('source', help="JSON-lines file or spool directory of *.jsonl files")
+    run.add_argument('-o', '--output', default=str(STREAM_OUTPUT_PATH))
+    run.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    run.add_argument('--follow', action='store_true', help="Keep polling for new events until interrupted")
+    run.add_argument('--model-dir', default=None)
+    run.add_argument('--log-predictions', action='store_true',
+                     help="Also append predictions to the prediction log (at-least-once across restarts)")
+    sim = sub.add_parser('simulate', help="Append synthetic admission events to a feed")
+    sim.add_argument('path')
+    sim.add_argument('--events', type=int, default=100_000)
+    sim.add_argument('--rate', type=float, default=0.0, help="Events per second; 0 writes at once")
+    sim.add_argument('--files', type=int, default=1, help="Split across this many spool files")
+    sim.add_argument('--invalid', type=float, default=0.0, help="Fraction of corrupted lines")
+    sim.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        n = simulate(args.path, args.events, args.rate, args.files, args.invalid, args.seed)
+        print(f"Wrote {n:,} events -> {args.path}")
+        return
+
+    stats = run_stream(args.source, args.output, Scorer.load(args.model_dir), args.batch_rows, args.follow,
+                       args.log_predictions, report_every=5.0 if args.follow else None)
+    file, offset = stats['position']
+    print(f"Scored {stats['scored']:,} of {stats['events']:,} events in {stats['batches']:,} batches, "
+          f"{stats['seconds']:.2f}s ({stats['events_per_second']:,.0f} events/s) -> {args.output}")
+    print("  " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stats['stage_seconds'].items())
+          + f"; checkpoint at {file}:{offset:,}")
+    for field, counts in error_summary(stats['rejected_codes']).items():
+        print(f"  rejected on {field}: {counts['missing']:,} missing, {counts['invalid']:,} out of range")
+
+
+if __name__ == '__main__':
+    main()
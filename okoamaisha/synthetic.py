@@ -0,0 +1,65 @@
+"""
+Synthetic patient inputs for benchmarks and load tests
+
+Values follow the training data's scales (which for hematocrit, respiration
+and neutrophils are not the Home page widgets' clinical units), so the
+batches exercise the same code paths and tree splits as real admissions.
+"""
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.features import COMORBIDITY_COLS, FACILITIES
+
+
+def synthetic_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    month = rng.integers(1, 13, n)
+    inputs = pd.DataFrame({
+        'gender': rng.integers(0, 2, n),
+        'rcount': rng.choice(6, n, p=[0.55, 0.2, 0.1, 0.07, 0.05, 0.03]),
+        'bmi': rng.normal(29.8, 2.0, n).clip(10, 60).round(1),
+        'pulse': rng.normal(74, 12, n).clip(30, 200).round(),
+        'respiration': rng.normal(6.5, 0.6, n).clip(5, 60).round(1),
+        'hematocrit': rng.normal(11.9, 2.0, n).clip(4.4, 60).round(1),
+        'neutrophils': rng.lognormal(2.3, 0.4, n).clip(0.1, 245).round(1),
+        'glucose': rng.normal(141, 30, n).clip(50, 400).round(1),
+        'sodium': rng.normal(137, 3, n).clip(120, 160).round(1),
+        'creatinine': rng.normal(1.1, 0.3, n).clip(0.3, 10).round(2),
+        'bloodureanitro': rng.lognormal(2.5, 0.4, n).clip(5, 100).round(),
+        'secondarydiagnosisnonicd9': rng.integers(0, 11, n),
+        'admission_month': month,
+        'admission_dayofweek': rng.integers(0, 7, n),
+        'admission_quarter': (month - 1) // 3 + 1,
+        'facility': rng.choice(FACILITIES, n),
+    })
+    for c in COMORBIDITY_COLS:
+        inputs[c] = (rng.random(n) < 0.05).astype(np.int64)
+    return inputs
+
+
+def synthetic_admissions(n, seed=0, start='2012-01-01'):
+    """Rows in the original dataset schema (eid, vdate, ..., facid, lengthofstay)."""
+    rng = np.random.default_rng(seed)
+    inputs = synthetic_inputs(n, seed)
+    vdate = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, 365, n), unit='D')
+    comorbidities = inputs[COMORBIDITY_COLS].sum(axis=1).to_numpy()
+    rcount = inputs['rcount'].to_numpy()
+    lengthofstay = (1 + 1.3 * rcount + 0.9 * comorbidities
+                    + rng.gamma(2.0, 0.8, n)).round().clip(1, 17).astype(np.int64)
+
+    raw = pd.DataFrame({
+        'eid': np.arange(1, n + 1),
+        'vdate': vdate.strftime('%-m/%-d/%Y'),
+        'rcount': np.where(rcount >= 5, '5+', rcount.astype(str)),
+        'gender': np.where(inputs['gender'] == 1, 'M', 'F'),
+    })
+    for c in COMORBIDITY_COLS:
+        raw[c] = inputs[c]
+    for c in ['hematocrit', 'neutrophils', 'sodium', 'glucose', 'bloodureanitro',
+              'creatinine', 'bmi', 'pulse', 'respiration', 'secondarydiagnosisnonicd9']:
+        raw[c] = inputs[c]
+    raw['discharged'] = (vdate + pd.to_timedelta(lengthofstay, unit='D')).strftime('%-m/%-d/%Y')
+    raw['facid'] = inputs['facility']
+    raw['lengthofstay'] = lengthofstay
+    return raw
@@ -0,0 +1,316 @@
+"""
+Hyperparameter search for the length-of-stay model
+
+Successive halving over the Gradient Boosting (and, on request, histogram
+gradient boosting) search spaces. The resource is the number of boosting stages: every random
+candidate starts with `min_resource` stages, and after each rung only the
+best 1/eta by mean cross-validated MAE continue with eta times as many.
+All (candidate, fold) fits of a rung run on a process pool whose workers
+load the training matrix once. Each fold result is cached on disk under a key
+of the data fingerprint, estimator, parameters, stages and fold, so an
+interrupted or repeated search resumes without refitting anything it
+already has. The winner is refit on the training split, scored on the
+holdout and written as a model bundle that `Scorer.load` can serve. The
+bundle records the held-out eids (HOLDOUT_FILE), so the Model Performance
+metrics are computed on rows the model never saw.
+
+Only Gradient Boosting winners are exported. The SQL export
+(okoamaisha.sql_export) reads GradientBoostingRegressor trees directly, so
+a histogram gradient boosting bundle would break it. Searching that family
+with `--families` compares its cross-validated MAE, but if it wins no
+bundle is written.
+
+Usage:
+    python -m okoamaisha.tuning data/admissions.parquet --rows 50000 -o models/tuned
+    python -m okoamaisha.tuning data/admissions.parquet --families gradient_boosting hist_gradient_boosting
+    OKOA_MODEL_DIR=models/tuned streamlit run app.py
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import StandardScaler
+
+from okoamaisha.artifacts import ADMISSIONS_PATH, DATA_DIR, HOLDOUT_FILE, MODEL_DIR
+from okoamaisha.features import from_admissions, to_model_input
+from okoamaisha.ingest import MODEL_INPUT_COLUMNS, read_admissions
+from okoamaisha.scoring import Scorer
+
+TUNED_MODEL_DIR = MODEL_DIR / 'models' / 'tuned'
+TUNING_CACHE_DIR = DATA_DIR / 'tuning_cache'
+
+# Per family: estimator, the parameter that counts boosting stages, fixed and searched parameters
+SEARCH_SPACES = {
+    'gradient_boosting': {
+        'estimator': GradientBoostingRegressor,
+        'model_name': 'Gradient Boosting',
+        'stages': 'n_estimators',
+        'fixed': {},
+        'space': {
+            'learning_rate': [0.03, 0.05, 0.1, 0.2],
+            'max_depth': [3, 4, 5, 6],
+            'min_samples_leaf': [1, 5, 20, 50],
+            'subsample': [0.7, 0.85, 1.0],
+            'max_features': [None, 0.5],
+        },
+    },
+    'hist_gradient_boosting': {
+        'estimator': HistGradientBoostingRegressor,
+        'model_name': 'Histogram Gradient Boosting',
+        'stages': 'max_iter',
+        'fixed': {'early_stopping': False},
+        'space': {
+            'learning_rate': [0.03, 0.05, 0.1, 0.2],
+            'max_leaf_nodes': [15, 31, 63],
+            'max_depth': [None, 4, 6, 8],
+            'min_samples_leaf': [10, 20, 50],
+            'l2_regularization': [0.0, 0.1, 1.0],
+        },
+    },
+}
+
+
+# Families searched by default and families whose winner may be written as a bundle
+DEFAULT_FAMILIES = ('gradient_boosting',)
+EXPORTABLE_FAMILIES = ('gradient_boosting',)
+
+
+def sample_candidates(n_per_family, families=DEFAULT_FAMILIES, seed=0):
+    """`n_per_family` distinct random configurations from each family's grid."""
+    rng = random.Random(seed)
+    candidates = []
+    for family in families:
+        space = SEARCH_SPACES[family]['space']
+        grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+        candidates += [{'family': family, 'params': params}
+                       for params in rng.sample(grid, min(n_per_family, len(grid)))]
+    return candidates
+
+
+def make_estimator(family, params, stages, seed=42):
+    spec = SEARCH_SPACES[family]
+    return spec['estimator'](random_state=seed, **spec['fixed'], **params, **{spec['stages']: stages})
+
+
+def fingerprint(X, y):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class FoldCache:
+    """One small JSON file per (data, candidate, stages, fold split) result."""
+
+    def __init__(self, path=TUNING_CACHE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(data_id, candidate, stages, fold, n_folds, seed):
+        spec = json.dumps([data_id, candidate['family'], candidate['params'], stages, fold, n_folds, seed],
+                          sort_keys=True)
+        return hashlib.sha256(spec.encode('utf-8')).hexdigest()[:24]
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.path, f'{key}.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, result):
+        tmp = os.path.join(self.path, f'{key}.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, os.path.join(self.path, f'{key}.json'))
+
+
+# Worker state, populated once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(data_path, n_folds, seed):
+    with np.load(data_path) as data:
+        _worker['X'], _worker['y'] = data['X'], data['y']
+    _worker['folds'] = list(KFold(n_folds, shuffle=True, random_state=seed).split(_worker['X']))
+
+
+def _fit_fold(candidate, stages, fold):
+    train, valid = _worker['folds'][fold]
+    X, y = _worker['X'], _worker['y']
+    model = make_estimator(candidate['family'], candidate['params'], stages)
+    started = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    predicted = model.predict(X[valid])
+    predict_seconds = time.perf_counter() - started
+    return {'mae': float(np.abs(predicted - y[valid]).mean()), 'fit_seconds': fit_seconds,
+            'predict_us_per_row': predict_seconds / len(valid) * 1e6}
+
+
+def successive_halving(X, y, candidates, n_folds=3, eta=3, min_resource=50, max_resource=450,
+                       workers=None, cache_dir=TUNING_CACHE_DIR, seed=0, log=print):
+    """Returns (best candidate, rungs); each rung records its stages, wall time and results.
+
+    The best candidate is the lowest mean MAE at any rung, so a survivor that
+    overfits with more stages keeps the stage count it scored best with.
+    """
+    cache = FoldCache(cache_dir)
+    data_id = fingerprint(X, y)
+    rungs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'train.npz')
+        np.savez(data_path, X=X, y=y)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_init_worker,
+                                 initargs=(data_path, n_folds, seed)) as pool:
+            survivors, stages = list(candidates), min_resource
+            while True:
+                started = time.perf_counter()
+                keys = {(i, fold): cache.key(data_id, c, stages, fold, n_folds, seed)
+                        for i, c in enumerate(survivors) for fold in range(n_folds)}
+                results = {task: cache.get(key) for task, key in keys.items()}
+                missing = [task for task, result in results.items() if result is None]
+                futures = {task: pool.submit(_fit_fold, survivors[task[0]], stages, task[1]) for task in missing}
+                for task, future in futures.items():
+                    results[task] = future.result()
+                    cache.put(keys[task], results[task])
+
+                scored = []
+                for i, candidate in enumerate(survivors):
+                    folds = [results[(i, fold)] for fold in range(n_folds)]
+                    scored.append({**candidate, 'stages': stages,
+                                   'mae': float(np.mean([r['mae'] for r in folds])),
+                                   'fit_seconds': float(np.mean([r['fit_seconds'] for r in folds])),
+                                   'predict_us_per_row': float(np.mean([r['predict_us_per_row'] for r in folds]))})
+                scored.sort(key=lambda r: r['mae'])
+                rungs.append({'stages': stages, 'candidates': len(survivors), 'fits': len(missing),
+                              'cached': len(keys) - len(missing), 'seconds': time.perf_counter() - started,
+                              'results': scored})
+                log(f"rung {len(rungs)}: {len(survivors):3d} candidates x {stages:4d} stages, "
+                    f"{len(missing):3d} fits, {len(keys) - len(missing):3d} cached, "
+                    f"{rungs[-1]['seconds']:7.1f}s, best MAE {scored[0]['mae']:.4f} ({scored[0]['family']})")
+
+                if len(scored) == 1 or stages * eta > max_resource:
+                    return min((rung['results'][0] for rung in rungs), key=lambda r: r['mae']), rungs
+                survivors = [{'family': r['family'], 'params': r['params']}
+                             for r in scored[:max(1, len(scored) // eta)]]
+                stages *= eta
+
+
+def tune(admissions, out_dir=TUNED_MODEL_DIR, candidates_per_family=9, n_folds=3, eta=3,
+         min_resource=50, max_resource=450, holdout=0.2, workers=None, cache_dir=TUNING_CACHE_DIR,
+         seed=0, log=print, families=DEFAULT_FAMILIES):
+    """Search, refit the winner on the training split and write a model bundle; returns its metadata.
+
+    Raises ValueError, before refitting, when the winner's family is not in
+    EXPORTABLE_FAMILIES.
+    """
+    scorer = Scorer.load()
+    features = scorer.features(from_admissions(admissions))
+    y = admissions['lengthofstay'].to_numpy(dtype=np.float64)
+    test = np.random.default_rng(seed).random(len(y)) < holdout
+    scaler = StandardScaler().fit(to_model_input(features[~test]))
+    X = scaler.transform(to_model_input(features))
+
+    best, rungs = successive_halving(X[~test], y[~test], sample_candidates(candidates_per_family, families, seed),
+                                     n_folds, eta, min_resource, max_resource, workers, cache_dir, seed, log)
+    if best['family'] not in EXPORTABLE_FAMILIES:
+        raise ValueError(f"{SEARCH_SPACES[best['family']]['model_name']} won with CV MAE {best['mae']:.4f}, "
+                         f"but only {', '.join(EXPORTABLE_FAMILIES)} bundles are exported: the SQL export reads "
+                         f"GradientBoostingRegressor trees")
+
+    model = make_estimator(best['family'], best['params'], best['stages'])
+    started = time.perf_counter()
+    model.fit(X[~test], y[~test])
+    refit_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    predicted = model.predict(X[test])
+    predict_seconds = time.perf_counter() - started
+
+    residual = y[test] - predicted
+    metadata = {
+        'model_name': SEARCH_SPACES[best['family']]['model_name'],
+        'test_r2': float(1 - (residual ** 2).sum() / ((y[test] - y[test].mean()) ** 2).sum()),
+        'test_mae': float(np.abs(residual).mean()),
+        'test_rmse': float(np.sqrt((residual ** 2).mean())),
+        'features': list(scorer.feature_names),
+        'comorbidity_cols': list(scorer.comorbidity_cols),
+        'training_date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'tuning': {
+            'family': best['family'], 'params': best['params'], 'stages': best['stages'],
+            'cv_mae': best['mae'], 'n_folds': n_folds, 'eta': eta,
+            'train_rows': int((~test).sum()), 'holdout_rows': int(test.sum()),
+            'profile': {
+                'cv_fit_seconds_per_fold': best['fit_seconds'],
+                'refit_seconds': refit_seconds,
+                'predict_us_per_row': predict_seconds / max(int(test.sum()), 1) * 1e6,
+                'rungs': [{k: v for k, v in rung.items() if k != 'results'} for rung in rungs],
+            },
+        },
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(out_dir, 'best_model.pkl'))
+    joblib.dump(scaler, os.path.join(out_dir, 'scaler.pkl'))
+    joblib.dump(list(scorer.feature_names), os.path.join(out_dir, 'feature_names.pkl'))
+    joblib.dump(metadata, os.path.join(out_dir, 'model_metadata.pkl'))
+    # The evaluation set (okoamaisha.evaluation) scores only these rows
+    np.save(os.path.join(out_dir, HOLDOUT_FILE), admissions['eid'].to_numpy()[test])
+    with open(os.path.join(out_dir, 'tuning.json'), 'w') as f:
+        json.dump({**metadata['tuning'], 'rungs': rungs}, f, indent=2)
+    return metadata
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the length-of-stay model with successive halving.")
+    parser.add_argument('data', nargs='?', default=str(ADMISSIONS_PATH))
+    parser.add_argument('-o', '--out', default=str(TUNED_MODEL_DIR))
+    parser.add_argument('--rows', type=int, default=None, help="Random sample of admissions to tune on")
+    parser.add_argument('--candidates', type=int, default=9, help="Random candidates per model family")
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--min-stages', type=int, default=50)
+    parser.add_argument('--max-stages', type=int, default=450)
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Default: all cores")
+    parser.add_argument('--cache', default=str(TUNING_CACHE_DIR))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--families', nargs='+', choices=list(SEARCH_SPACES), default=list(DEFAULT_FAMILIES),
+                        help=f"Model families to search; only {', '.join(EXPORTABLE_FAMILIES)} winners are exported")
+    args = parser.parse_args(argv)
+
+    admissions = read_admissions(args.data, columns=MODEL_INPUT_COLUMNS + ['lengthofstay'])
+    if args.rows and args.rows < len(admissions):
+        admissions = admissions.sample(args.rows, random_state=args.seed)
+
+    started = time.perf_counter()
+    try:
+        metadata = tune(admissions, args.out, args.candidates, args.folds, args.eta, args.min_stages,
+                        args.max_stages, workers=args.workers, cache_dir=args.cache, seed=args.seed,
+                        families=args.families)
+    except ValueError as e:
+        parser.exit(1, f"No bundle written: {e}\n")
+    tuning = metadata['tuning']
+    profile = tuning['profile']
+    print(f"\nChose {metadata['model_name']} with {tuning['stages']} stages: {json.dumps(tuning['params'])}")
+    print(f"CV MAE {tuning['cv_mae']:.4f}; holdout MAE {metadata['test_mae']:.4f}, "
+          f"RMSE {metadata['test_rmse']:.4f}, R² {metadata['test_r2']:.4f}")
+    print(f"Fit {profile['cv_fit_seconds_per_fold']:.2f}s per CV fold, refit {profile['refit_seconds']:.2f}s, "
+          f"predict {profile['predict_us_per_row']:.2f} µs/row; search took {time.perf_counter() - started:.1f}s")
+    print(f"Model bundle -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
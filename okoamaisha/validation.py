@@ -0,0 +1,168 @@
+"""
+Vectorized input validation for batch and API payloads
+
+INPUT_SCHEMA is the single declaration of what a valid patient looks like.
+Counts, flags and calendar fields are checked against their domain. Labs and
+vitals are only checked for being present and numeric: the training data
+does not use the clinical units of the Home page widgets (its hematocrit
+averages 12 and its respiration 6.5), so the widget ranges kept under
+'widget' bound the UI only. `validate_batch` checks a whole DataFrame one
+column at a time with NumPy masks and returns a uint64 error code per row:
+
+    bit 2*i      field i is missing or not a number
+    bit 2*i + 1  field i is out of range / not an allowed value / infinite
+
+so a row is valid exactly when its code is 0, and `describe_errors` turns a
+code back into messages.
+"""
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.features import COMORBIDITY_COLS, FACILITIES
+
+# 'min'/'max' are enforced on every payload and integer fields must be whole
+# numbers; 'widget' is the (min, max) of a Home page input only
+INPUT_SCHEMA = {
+    'gender': {'min': 0, 'max': 1, 'integer': True},
+    'rcount': {'min': 0, 'max': 5, 'integer': True},
+    'bmi': {'widget': (10.0, 60.0)},
+    'pulse': {'widget': (30, 200)},
+    'respiration': {'widget': (5.0, 60.0)},
+    'hematocrit': {'widget': (20.0, 60.0)},
+    'neutrophils': {'widget': (0.0, 20.0)},
+    'glucose': {'widget': (50.0, 400.0)},
+    'sodium': {'widget': (120.0, 160.0)},
+    'creatinine': {'widget': (0.3, 10.0)},
+    'bloodureanitro': {'widget': (5.0, 100.0)},
+    'secondarydiagnosisnonicd9': {'min': 0, 'max': 10, 'integer': True},
+    'admission_month': {'min': 1, 'max': 12, 'integer': True},
+    'admission_dayofweek': {'min': 0, 'max': 6, 'integer': True},
+    # Derived from admission_month when absent; must agree with it when present
+    'admission_quarter': {'min': 1, 'max': 4, 'integer': True, 'required': False},
+    'facility': {'allowed': FACILITIES},
+    **{c: {'min': 0, 'max': 1, 'integer': True, 'required': False, 'default': 0}
+       for c in COMORBIDITY_COLS},
+}
+
+FIELDS = list(INPUT_SCHEMA)
+MISSING = {name: np.uint64(1) << np.uint64(2 * i) for i, name in enumerate(FIELDS)}
+INVALID = {name: np.uint64(1) << np.uint64(2 * i + 1) for i, name in enumerate(FIELDS)}
+
+
+def bounds(field):
+    """(min, max) of a numeric field's Home page widget, in the types the widgets use."""
+    spec = INPUT_SCHEMA[field]
+    return spec.get('widget', (spec.get('min'), spec.get('max')))
+
+
+def _numeric(column):
+    if column.dtype.kind in 'biuf':
+        return column.to_numpy(dtype=np.float64)
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def validate_batch(inputs):
+    """Check every row of `inputs` against INPUT_SCHEMA.
+
+    Returns (cleaned, error_codes): `cleaned` is `inputs` with optional
+    fields defaulted, facility normalized, admission_quarter derived and
+    integer fields as int64 on valid rows; `error_codes` is a uint64 array
+    that is 0 for valid rows.
+    """
+    n = len(inputs)
+    codes = np.zeros(n, dtype=np.uint64)
+    numeric = {}
+    replaced = {}
+
+    for name, spec in INPUT_SCHEMA.items():
+        if name not in inputs:
+            if 'default' in spec:
+                replaced[name] = np.full(n, spec['default'], dtype=np.int64)
+            elif spec.get('required', True):
+                codes |= MISSING[name]
+            continue
+
+        column = inputs[name]
+        if 'allowed' in spec:
+            # Normalize the distinct values only, then map back
+            labels, uniques = pd.factorize(column)
+            normalized = np.array([str(u).strip().upper() for u in uniques], dtype=object)
+            known = np.append(np.isin(normalized, spec['allowed']), False)
+            codes |= (labels < 0) * MISSING[name]
+            codes |= (~known[labels] & (labels >= 0)) * INVALID[name]
+            replaced[name] = np.append(normalized, None)[labels]
+            continue
+
+        values = _numeric(column)
+        missing = np.isnan(values)
+        if 'default' in spec and missing.any():
+            values = np.where(missing, spec['default'], values)
+            replaced[name] = values
+            missing[:] = False
+        # Comparisons with NaN are False, so missing values never count as out of range
+        if 'min' in spec:
+            bad = (values < spec['min']) | (values > spec['max'])
+        else:
+            bad = np.isinf(values)
+        if spec.get('integer'):
+            bad |= (values != np.floor(values)) & ~missing
+        if spec.get('required', True):
+            codes |= missing * MISSING[name]
+        codes |= bad * INVALID[name]
+        numeric[name] = values
+
+    if 'admission_month' in numeric:
+        derived = (numeric['admission_month'] - 1) // 3 + 1
+        given = numeric.get('admission_quarter')
+        if given is None:
+            replaced['admission_quarter'] = derived
+        else:
+            missing = np.isnan(given)
+            codes |= ((given != derived) & ~missing & ~np.isnan(derived)) * INVALID['admission_quarter']
+            if missing.any():
+                replaced['admission_quarter'] = np.where(missing, derived, given)
+
+    # Integer fields go back to int64 (0 on rejected rows) so valid rows
+    # engineer exactly like app input
+    valid = codes == 0
+    cleaned = inputs.copy(deep=False)
+    for name, values in replaced.items():
+        cleaned[name] = values
+    for name, spec in INPUT_SCHEMA.items():
+        if spec.get('integer') and name in cleaned and cleaned[name].dtype.kind not in 'iu':
+            values = cleaned[name].to_numpy(dtype=np.float64, na_value=np.nan)
+            cleaned[name] = np.where(valid, values, 0).astype(np.int64)
+    return cleaned, codes
+
+
+def describe_errors(code):
+    """Human-readable problems encoded in one row's error code."""
+    code = np.uint64(code)
+    messages = []
+    for name in FIELDS:
+        spec = INPUT_SCHEMA[name]
+        if code & MISSING[name]:
+            messages.append(f"{name}: missing or not a number")
+        if code & INVALID[name]:
+            if 'allowed' in spec:
+                messages.append(f"{name}: must be one of {', '.join(spec['allowed'])}")
+            elif name == 'admission_quarter':
+                messages.append(f"{name}: must be 1-4 and match admission_month")
+            elif 'min' not in spec:
+                messages.append(f"{name}: must be a finite number")
+            else:
+                kind = "a whole number " if spec.get('integer') else ""
+                messages.append(f"{name}: must be {kind}between {spec['min']} and {spec['max']}")
+    return messages
+
+
+def error_summary(codes):
+    """Number of rows failing each field, as {field: {'missing': n, 'invalid': n}}."""
+    summary = {}
+    for name in FIELDS:
+        missing = int(np.count_nonzero(codes & MISSING[name]))
+        invalid = int(np.count_nonzero(codes & INVALID[name]))
+        if missing or invalid:
+            summary[name] = {'missing': missing, 'invalid': invalid}
+    return summary
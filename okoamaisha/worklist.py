@@ -0,0 +1,210 @@
+"""
+Discharge-planning worklist of the current census
+
+Every scored admission with an encounter id (eid) is kept in two indexed
+max-heaps, one keyed by predicted LoS and one by risk score. Scoring,
+re-scoring and discharging a patient each cost O(log n), and the top K of
+either ranking is read in O(K log K) by walking the heap, so the worklist
+never re-sorts the census.
+
+The census is fed from the prediction log: rows with an eid are admitted or
+re-scored, rows that carry an actual LoS mark the stay as finished and
+discharge the patient. Rows without an eid (ad-hoc Home page predictions)
+are ignored.
+
+Usage:
+    python -m okoamaisha.worklist --top 50 --by risk_score
+"""
+
+import argparse
+import heapq
+import threading
+
+import numpy as np
+import pandas as pd
+
+from okoamaisha.clinical import risk_score, stay_category
+from okoamaisha.prediction_log import PredictionLog
+
+RANKINGS = ('predicted_los', 'risk_score')
+
+WORKLIST_COLUMNS = ['eid', 'facility', 'admission_month', 'admission_dayofweek',
+                    'total_comorbidities', 'rcount', 'predicted_los', 'risk_score', 'logged_at']
+
+
+class IndexedHeap:
+    """Binary max-heap of scores with a key -> position index."""
+
+    def __init__(self):
+        self._keys = []
+        self._scores = []
+        self._pos = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._pos
+
+    def _swap(self, i, j):
+        keys, scores = self._keys, self._scores
+        keys[i], keys[j] = keys[j], keys[i]
+        scores[i], scores[j] = scores[j], scores[i]
+        self._pos[keys[i]] = i
+        self._pos[keys[j]] = j
+
+    def _sift_up(self, i):
+        scores = self._scores
+        while i > 0:
+            parent = (i - 1) // 2
+            if scores[parent] >= scores[i]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        scores, n = self._scores, len(self._scores)
+        while True:
+            largest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and scores[child] > scores[largest]:
+                    largest = child
+            if largest == i:
+                break
+            self._swap(i, largest)
+            i = largest
+
+    def set(self, key, score):
+        """Insert `key` or move it to its new `score`."""
+        i = self._pos.get(key)
+        if i is None:
+            self._keys.append(key)
+            self._scores.append(score)
+            self._pos[key] = len(self._keys) - 1
+            self._sift_up(len(self._keys) - 1)
+            return
+        old = self._scores[i]
+        self._scores[i] = score
+        if score > old:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def remove(self, key):
+        """Drop `key`; returns False if it was not in the heap."""
+        i = self._pos.pop(key, None)
+        if i is None:
+            return False
+        last = len(self._keys) - 1
+        if i != last:
+            self._keys[i] = self._keys[last]
+            self._scores[i] = self._scores[last]
+            self._pos[self._keys[i]] = i
+        self._keys.pop()
+        self._scores.pop()
+        if i < len(self._keys):
+            self._sift_up(i)
+            self._sift_down(i)
+        return True
+
+    def top(self, k):
+        """[(key, score)] of the k highest scores, highest first."""
+        if not self._keys:
+            return []
+        keys, scores, n = self._keys, self._scores, len(self._keys)
+        frontier = [(-scores[0], 0)]
+        out = []
+        while frontier and len(out) < k:
+            score, i = heapq.heappop(frontier)
+            out.append((keys[i], -score))
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n:
+                    heapq.heappush(frontier, (-scores[child], child))
+        return out
+
+
+class Worklist:
+    def __init__(self):
+        self.patients = {}
+        self.heaps = {name: IndexedHeap() for name in RANKINGS}
+        self.offset = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.patients)
+
+    def _upsert(self, patient):
+        eid = patient['eid']
+        self.patients[eid] = patient
+        for name, heap in self.heaps.items():
+            heap.set(eid, patient[name])
+
+    def _discharge(self, eid):
+        if self.patients.pop(eid, None) is None:
+            return False
+        for heap in self.heaps.values():
+            heap.remove(eid)
+        return True
+
+    def apply(self, rows):
+        """Fold prediction log rows (LOG_COLUMNS) into the census."""
+        rows = rows[rows['eid'] >= 0]
+        if len(rows) == 0:
+            return
+        rows = rows.assign(risk_score=risk_score(rows['total_comorbidities'].to_numpy(),
+                                                 rows['rcount'].to_numpy()).astype(np.float64))
+        discharged = rows['actual_los'].notna().to_numpy()
+        with self._lock:
+            for patient, done in zip(rows[WORKLIST_COLUMNS].to_dict('records'), discharged):
+                if done:
+                    self._discharge(patient['eid'])
+                else:
+                    self._upsert(patient)
+
+    def discharge(self, eids):
+        """Remove patients by eid; returns how many were on the worklist."""
+        with self._lock:
+            return sum(self._discharge(eid) for eid in eids)
+
+    def refresh(self, log):
+        """Consume rows appended to `log` since the last refresh; returns the count."""
+        with self._lock:
+            size = log.size()
+            if size < self.offset:
+                # The log was rotated or replaced; rebuild from scratch
+                self.patients = {}
+                self.heaps = {name: IndexedHeap() for name in RANKINGS}
+                self.offset = 0
+            if size <= self.offset:
+                return 0
+            rows, self.offset = log.read_since(self.offset)
+            self.apply(rows)
+            return len(rows)
+
+    def top(self, k=50, by='predicted_los'):
+        """The k patients ranked highest by `by`, as a DataFrame."""
+        if by not in RANKINGS:
+            raise ValueError(f"by must be one of {RANKINGS}")
+        with self._lock:
+            ranked = [self.patients[eid] for eid, _ in self.heaps[by].top(k)]
+        top = pd.DataFrame(ranked, columns=WORKLIST_COLUMNS)
+        top['stay_category'] = stay_category(top['predicted_los'].to_numpy(dtype=np.float64))
+        top.index = pd.RangeIndex(1, len(top) + 1, name='rank')
+        return top
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the discharge-planning worklist.")
+    parser.add_argument('--log', default=None, help="Prediction log (default: data/predictions.csv)")
+    parser.add_argument('--top', type=int, default=50)
+    parser.add_argument('--by', choices=RANKINGS, default='predicted_los')
+    args = parser.parse_args(argv)
+
+    worklist = Worklist()
+    worklist.refresh(PredictionLog(args.log) if args.log else PredictionLog())
+    print(f"{len(worklist):,} patients on the census")
+    print(worklist.top(args.top, args.by).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""
+Passwords beyond bcrypt's 72-byte limit fail the login instead of raising
+"""
+
+import pytest
+
+from okoamaisha.auth import MAX_PASSWORD_BYTES, UserStore, login
+
+LONG_PASSWORD = 'a' * (MAX_PASSWORD_BYTES + 1)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UserStore(tmp_path / 'users.json')
+    store.add_user('alice', 'correct horse', rounds=4)
+    return store
+
+
+def test_add_user_rejects_73_byte_password(store):
+    with pytest.raises(ValueError, match="at most 72"):
+        store.add_user('bob', LONG_PASSWORD, rounds=4)
+    assert 'bob' not in store.users()
+
+
+def test_73_byte_password_fails_login(store):
+    assert store.verify('alice', LONG_PASSWORD) is None
+    assert login(store, 'alice', LONG_PASSWORD) is None
+    assert store.verify('alice', 'correct horse')['role'] == 'clinician'
@@ -0,0 +1,93 @@
+"""
+The compiled SQL views must reproduce the Python predictions exactly
+"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from okoamaisha.features import from_admissions
+from okoamaisha.ingest import to_typed_table
+from okoamaisha.scoring import Scorer
+from okoamaisha.sql_export import SQL_INPUT_COLUMNS, compile_sql, load_sqlite, verify
+from okoamaisha.synthetic import synthetic_admissions
+
+
+@pytest.fixture(scope='module')
+def scorer():
+    return Scorer.load()
+
+
+@pytest.fixture(scope='module')
+def admissions():
+    raw = synthetic_admissions(2000, seed=7)
+    typed = to_typed_table(pa.Table.from_pandas(raw, preserve_index=False)).to_pandas()
+    return typed[SQL_INPUT_COLUMNS]
+
+
+@pytest.fixture(scope='module')
+def over_cap(admissions):
+    """One admission repeated with rcount 5, above 5, and as raw strings; every row scores as rcount 5."""
+    rows = admissions.iloc[[0] * 5].reset_index(drop=True)
+    return rows.assign(eid=np.arange(1, 6), rcount=pd.Series([5, 7, '5+', '7', '12'], dtype=object))
+
+
+def sqlite_connection(frame, scorer):
+    connection = sqlite3.connect(':memory:')
+    load_sqlite(frame, connection)
+    connection.executescript(compile_sql(scorer))
+    return connection
+
+
+def duckdb_connection(frame, scorer):
+    duckdb = pytest.importorskip('duckdb')
+    connection = duckdb.connect()
+    frame = frame.assign(**{c: frame[c].astype(str) for c in ['facid', 'gender', 'rcount']})
+    connection.register('admissions_frame', frame)
+    connection.execute("CREATE TABLE admissions AS SELECT * FROM admissions_frame")
+    connection.execute(compile_sql(scorer))
+    return connection
+
+
+def by_eid(connection, query, eids):
+    values = dict(connection.execute(query).fetchall())
+    return np.array([values[eid] for eid in eids])
+
+
+def sql_predictions(connection, frame):
+    return by_eid(connection, "SELECT eid, predicted_los FROM los_predictions", frame['eid'].tolist())
+
+
+def sql_rcount(connection, frame):
+    return by_eid(connection, "SELECT eid, rcount FROM los_features", frame['eid'].tolist())
+
+
+def test_sqlite_matches_python(admissions, scorer):
+    _, _, max_diff, differ = verify(admissions, scorer)
+    assert differ == 0, f"{differ} rows differ, max |diff| {max_diff}"
+
+
+def test_rcount_is_capped_in_sql(over_cap, scorer):
+    assert "MIN(" not in compile_sql(scorer)
+    python = scorer.predict_frame(from_admissions(over_cap))
+    np.testing.assert_array_equal(python, python[0])
+    connection = sqlite_connection(over_cap, scorer)
+    np.testing.assert_array_equal(sql_rcount(connection, over_cap), 5)
+    np.testing.assert_array_equal(sql_predictions(connection, over_cap), python)
+
+
+def test_rcount_is_capped_in_duckdb(over_cap, scorer):
+    python = scorer.predict_frame(from_admissions(over_cap))
+    connection = duckdb_connection(over_cap, scorer)
+    np.testing.assert_array_equal(sql_rcount(connection, over_cap), 5)
+    np.testing.assert_allclose(sql_predictions(connection, over_cap), python, rtol=0, atol=1e-9)
+
+
+def test_duckdb_matches_python(admissions, scorer):
+    from_sql = sql_predictions(duckdb_connection(admissions, scorer), admissions)
+    python = scorer.predict_frame(from_admissions(admissions))
+    # Every row takes the same leaves; DuckDB may add the tree terms in another order
+    np.testing.assert_allclose(from_sql, python, rtol=0, atol=1e-9)